@@ -0,0 +1,154 @@
+"""
+Async HTTP Client for Federated Learning
+asyncio counterpart of FederatedHTTPClient for driving many logical clients
+from one process
+"""
+
+import aiohttp
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Any, Optional, List
+from .client import (BackoffPolicy, CallStatsMixin, DEFAULT_ROUTE_POLICIES,
+                     RETRYABLE_STATUS_CODES, REJECTED_STATUS_CODES)
+from ..utils.tracing import REQUEST_ID_HEADER, new_request_id
+
+logger = logging.getLogger(__name__)
+
+
+def create_session(pool_size: int = 100, timeout: int = 30) -> aiohttp.ClientSession:
+    """Create a session whose connection pool can be shared by many logical clients"""
+    connector = aiohttp.TCPConnector(limit=pool_size, keepalive_timeout=30)
+    return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout))
+
+
+class AsyncFederatedHTTPClient(CallStatsMixin):
+    def __init__(self, server_url: str, client_id: str, timeout: int = 30,
+                 http_config: Optional[Dict[str, Any]] = None,
+                 session: Optional[aiohttp.ClientSession] = None):
+        self.server_url = server_url.rstrip('/')
+        self.client_id = client_id
+        self.timeout = timeout
+        http_config = http_config or {}
+
+        self.backoff = BackoffPolicy.from_config(http_config.get('backoff', {}))
+        self.route_policies = {
+            route: dict(policy, **http_config.get('routes', {}).get(route, {}))
+            for route, policy in DEFAULT_ROUTE_POLICIES.items()
+        }
+
+        # Sessions passed in are shared with other logical clients and not closed here
+        self._owns_session = session is None
+        self.session = session or create_session(http_config.get('pool_maxsize', 8), timeout)
+        self.call_stats: Dict[str, Dict[str, float]] = {}
+        self.last_request_id: Optional[str] = None
+
+    async def _request(self, route: str, method: str, path: str,
+                       payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Send a request with the route's timeout and retry policy and return the JSON body."""
+        policy = self.route_policies[route]
+        timeout = aiohttp.ClientTimeout(total=policy.get('timeout', self.timeout))
+        max_retries = policy.get('max_retries', 0)
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        # One ID per logical call (shared by its retries) so client and server spans correlate
+        self.last_request_id = new_request_id()
+        headers[REQUEST_ID_HEADER] = self.last_request_id
+
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            retry_after = None
+            try:
+                async with self.session.request(method, f"{self.server_url}{path}", data=body,
+                                                headers=headers, timeout=timeout) as response:
+                    content = await response.read()
+                    status = response.status
+                    retry_header = response.headers.get('Retry-After')
+            except aiohttp.ClientConnectorError:
+                # Connection was never established, so any route can be replayed
+                self._record_call(route, time.perf_counter() - start, 0, 0, error=True, retry=attempt > 0)
+                if attempt >= max_retries:
+                    raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                self._record_call(route, time.perf_counter() - start, 0, 0, error=True, retry=attempt > 0)
+                if attempt >= max_retries or not policy.get('idempotent'):
+                    raise
+            else:
+                self._record_call(route, time.perf_counter() - start, len(body or b''), len(content),
+                                  error=status >= 400, retry=attempt > 0)
+                retryable = status in REJECTED_STATUS_CODES or (
+                    policy.get('idempotent') and status in RETRYABLE_STATUS_CODES)
+                if not retryable or attempt >= max_retries:
+                    if status >= 400:
+                        raise aiohttp.ClientResponseError(
+                            response.request_info, response.history, status=status,
+                            message=content[:200].decode('utf-8', 'replace'))
+                    return json.loads(content) if content else {}
+                try:
+                    retry_after = float(retry_header or '')
+                except ValueError:
+                    retry_after = None
+
+            delay = self.backoff.delay(attempt)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            logger.debug(f"Retrying {route} for client {self.client_id} in {delay:.2f}s "
+                         f"(attempt {attempt + 1}/{max_retries})")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def register(self, client_info: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Register this client with the server"""
+        payload = {
+            'client_id': self.client_id,
+            'client_info': client_info or {}
+        }
+        result = await self._request('register', 'POST', '/register', payload)
+        logger.debug(f"Client {self.client_id} registered successfully")
+        return result
+
+    async def get_global_model(self) -> Dict[str, Any]:
+        """Get the current global model from server"""
+        return await self._request('get_model', 'POST', '/get_model', {'client_id': self.client_id})
+
+    async def submit_model_update(self, model_weights: List, metrics: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Submit model update to server"""
+        payload = {
+            'client_id': self.client_id,
+            'model_weights': model_weights,
+            'metrics': metrics or {}
+        }
+        return await self._request('submit_update', 'POST', '/submit_update', payload)
+
+    async def get_training_status(self) -> Dict[str, Any]:
+        """Get current training status from server"""
+        return await self._request('training_status', 'GET', '/training_status')
+
+    async def health_check(self) -> bool:
+        """Check if server is healthy"""
+        try:
+            result = await self._request('health', 'GET', '/health')
+            return result.get('status') == 'healthy'
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    async def wait_for_server(self, max_wait: int = 60, check_interval: int = 5) -> bool:
+        """Wait for server to become available, backing off up to check_interval between probes"""
+        start_time = time.time()
+        attempt = 0
+
+        while time.time() - start_time < max_wait:
+            if await self.health_check():
+                return True
+            await asyncio.sleep(self.backoff.delay(attempt, cap=check_interval))
+            attempt += 1
+
+        logger.error(f"Server not available after {max_wait} seconds")
+        return False
+
+    async def close(self):
+        """Close the HTTP session if this client created it"""
+        if self._owns_session:
+            await self.session.close()
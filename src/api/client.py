@@ -4,20 +4,193 @@ Handles communication with the federated server
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError
 import json
 import logging
+import random
+import socket
 import time
 from typing import Dict, Any, Optional, List
+from ..utils.tracing import REQUEST_ID_HEADER, new_request_id
 
 logger = logging.getLogger(__name__)
 
-class FederatedHTTPClient:
-    def __init__(self, server_url: str, client_id: str, timeout: int = 30):
+# Per-route defaults; routes without a timeout use the client-wide one. Only
+# routes that are safe to replay after the server may have processed them are
+# marked idempotent; the rest are retried only when the request provably never
+# reached the server (connect failures, 429/503).
+DEFAULT_ROUTE_POLICIES = {
+    'health': {'timeout': 5, 'max_retries': 0, 'idempotent': True},
+    'register': {'max_retries': 3, 'idempotent': True},
+    'get_model': {'timeout': 60, 'max_retries': 3, 'idempotent': True},
+    'submit_update': {'timeout': 120, 'max_retries': 3, 'idempotent': False},
+    'submit_stats': {'max_retries': 3, 'idempotent': True},
+    'training_status': {'timeout': 10, 'max_retries': 3, 'idempotent': True},
+    'rag_query': {'max_retries': 1, 'idempotent': False},
+}
+
+RETRYABLE_STATUS_CODES = {502, 503, 504}
+REJECTED_STATUS_CODES = {429, 503}  # Server refused the request without processing it
+
+
+class BackoffPolicy:
+    """Exponential backoff with full jitter so clients don't reconnect in lockstep."""
+    
+    def __init__(self, base_delay: float = 0.5, max_delay: float = 30.0,
+                 multiplier: float = 2.0, jitter: bool = True):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+    
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'BackoffPolicy':
+        return cls(
+            base_delay=config.get('base_delay', 0.5),
+            max_delay=config.get('max_delay', 30.0),
+            multiplier=config.get('multiplier', 2.0),
+            jitter=config.get('jitter', True)
+        )
+    
+    def delay(self, attempt: int, cap: Optional[float] = None) -> float:
+        """Delay before retry number `attempt` (0-based)."""
+        ceiling = min(self.max_delay, self.base_delay * (self.multiplier ** attempt))
+        if cap is not None:
+            ceiling = min(ceiling, cap)
+        return random.uniform(0, ceiling) if self.jitter else ceiling
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter that enables TCP keep-alive probes on pooled connections."""
+    
+    def __init__(self, keepalive_idle: Optional[int] = None, **kwargs):
+        self.keepalive_idle = keepalive_idle
+        super().__init__(**kwargs)
+    
+    def init_poolmanager(self, *args, **kwargs):
+        socket_options = list(HTTPConnection.default_socket_options)
+        socket_options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+        if self.keepalive_idle and hasattr(socket, 'TCP_KEEPIDLE'):
+            socket_options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self.keepalive_idle))
+        kwargs['socket_options'] = socket_options
+        super().init_poolmanager(*args, **kwargs)
+
+
+def _never_reached_server(error: requests.exceptions.RequestException) -> bool:
+    """True if the request failed before any bytes could have been processed."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        reason = getattr(error.args[0], 'reason', error.args[0])
+        return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+    return False
+
+
+class CallStatsMixin:
+    """Per-route latency and byte accounting shared by the sync and async clients."""
+    
+    def _record_call(self, route: str, latency: float, bytes_sent: int,
+                     bytes_received: int, error: bool = False, retry: bool = False):
+        stats = self.call_stats.setdefault(route, {
+            'calls': 0, 'errors': 0, 'retries': 0,
+            'latency_total': 0.0, 'latency_max': 0.0,
+            'bytes_sent': 0, 'bytes_received': 0
+        })
+        stats['calls'] += 1
+        stats['errors'] += int(error)
+        stats['retries'] += int(retry)
+        stats['latency_total'] += latency
+        stats['latency_max'] = max(stats['latency_max'], latency)
+        stats['bytes_sent'] += bytes_sent
+        stats['bytes_received'] += bytes_received
+    
+    def get_call_stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-route call counts, latency and byte totals observed by this client"""
+        result = {}
+        for route, stats in self.call_stats.items():
+            result[route] = dict(stats)
+            result[route]['latency_mean'] = stats['latency_total'] / stats['calls'] if stats['calls'] else 0.0
+        return result
+
+
+class FederatedHTTPClient(CallStatsMixin):
+    def __init__(self, server_url: str, client_id: str, timeout: int = 30,
+                 http_config: Optional[Dict[str, Any]] = None):
         self.server_url = server_url.rstrip('/')
         self.client_id = client_id
         self.timeout = timeout
+        http_config = http_config or {}
+        
+        self.connect_timeout = http_config.get('connect_timeout', 3.05)
+        self.backoff = BackoffPolicy.from_config(http_config.get('backoff', {}))
+        self.route_policies = {
+            route: dict(policy, **http_config.get('routes', {}).get(route, {}))
+            for route, policy in DEFAULT_ROUTE_POLICIES.items()
+        }
+        
         self.session = requests.Session()
+        adapter = KeepAliveAdapter(
+            keepalive_idle=http_config.get('keepalive_idle', 30),
+            pool_connections=http_config.get('pool_connections', 4),
+            pool_maxsize=http_config.get('pool_maxsize', 8),
+            pool_block=http_config.get('pool_block', False),
+            max_retries=0  # Retries are handled per route in _request
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
+        self.call_stats: Dict[str, Dict[str, float]] = {}
+        self.last_request_id: Optional[str] = None
+    
+    def _request(self, route: str, method: str, path: str,
+                 payload: Optional[Dict[str, Any]] = None) -> requests.Response:
+        """Send a request with the route's timeout and retry policy."""
+        policy = self.route_policies[route]
+        timeout = (self.connect_timeout, policy.get('timeout', self.timeout))
+        max_retries = policy.get('max_retries', 0)
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        # One ID per logical call (shared by its retries) so client and server spans correlate
+        self.last_request_id = new_request_id()
+        headers[REQUEST_ID_HEADER] = self.last_request_id
         
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            retry_after = None
+            try:
+                response = self.session.request(method, f"{self.server_url}{path}",
+                                                data=body, headers=headers, timeout=timeout)
+            except requests.exceptions.RequestException as e:
+                self._record_call(route, time.perf_counter() - start, 0, 0,
+                                  error=True, retry=attempt > 0)
+                retryable = policy.get('idempotent') or _never_reached_server(e)
+                if attempt >= max_retries or not retryable:
+                    raise
+            else:
+                self._record_call(route, time.perf_counter() - start, len(body or b''),
+                                  len(response.content), error=not response.ok, retry=attempt > 0)
+                status = response.status_code
+                retryable = status in REJECTED_STATUS_CODES or (
+                    policy.get('idempotent') and status in RETRYABLE_STATUS_CODES)
+                if not retryable or attempt >= max_retries:
+                    response.raise_for_status()
+                    return response
+                try:
+                    retry_after = float(response.headers.get('Retry-After', ''))
+                except ValueError:
+                    retry_after = None
+            
+            delay = self.backoff.delay(attempt)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            logger.warning(f"Retrying {route} for client {self.client_id} in {delay:.2f}s "
+                           f"(attempt {attempt + 1}/{max_retries})")
+            time.sleep(delay)
+            attempt += 1
+    
     def register(self, client_info: Dict[str, Any] = None) -> Dict[str, Any]:
         """Register this client with the server"""
         try:
@@ -26,17 +199,12 @@ class FederatedHTTPClient:
                 'client_info': client_info or {}
             }
             
-            response = self.session.post(
-                f"{self.server_url}/register",
-                json=payload,
-                timeout=self.timeout
-            )
-            response.raise_for_status()
+            response = self._request('register', 'POST', '/register', payload)
             
             result = response.json()
             logger.info(f"Client {self.client_id} registered successfully")
             return result
-            
+        
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to register client {self.client_id}: {str(e)}")
             raise
@@ -46,21 +214,20 @@ class FederatedHTTPClient:
         try:
             payload = {'client_id': self.client_id}
             
-            response = self.session.post(
-                f"{self.server_url}/get_model",
-                json=payload,
-                timeout=self.timeout
-            )
-            response.raise_for_status()
+            response = self._request('get_model', 'POST', '/get_model', payload)
             
             result = response.json()
             logger.debug(f"Retrieved global model for round {result.get('round', 'unknown')}")
             return result
-            
+        
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to get global model: {str(e)}")
             raise
     
+    def encode_weights(self, weights: List) -> List:
+        """Weights in the form this transport sends them (JSON lists)"""
+        return [w.tolist() for w in weights]
+    
     def submit_model_update(self, model_weights: List, metrics: Dict[str, Any] = None) -> Dict[str, Any]:
         """Submit model update to server"""
         try:
@@ -70,32 +237,40 @@ class FederatedHTTPClient:
                 'metrics': metrics or {}
             }
             
-            response = self.session.post(
-                f"{self.server_url}/submit_update",
-                json=payload,
-                timeout=self.timeout
-            )
-            response.raise_for_status()
+            response = self._request('submit_update', 'POST', '/submit_update', payload)
             
             result = response.json()
             logger.info(f"Model update submitted successfully by client {self.client_id}")
             return result
-            
+        
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to submit model update: {str(e)}")
             raise
     
+    def submit_feature_stats(self, stats: Dict[str, Any]) -> Dict[str, Any]:
+        """Submit local feature statistics for the global scaler"""
+        try:
+            payload = {
+                'client_id': self.client_id,
+                'stats': stats
+            }
+            
+            response = self._request('submit_stats', 'POST', '/submit_stats', payload)
+            
+            logger.info(f"Feature statistics submitted by client {self.client_id}")
+            return response.json()
+            
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to submit feature statistics: {str(e)}")
+            raise
+    
     def get_training_status(self) -> Dict[str, Any]:
         """Get current training status from server"""
         try:
-            response = self.session.get(
-                f"{self.server_url}/training_status",
-                timeout=self.timeout
-            )
-            response.raise_for_status()
+            response = self._request('training_status', 'GET', '/training_status')
             
             return response.json()
-            
+        
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to get training status: {str(e)}")
             raise
@@ -103,29 +278,28 @@ class FederatedHTTPClient:
     def health_check(self) -> bool:
         """Check if server is healthy"""
         try:
-            response = self.session.get(
-                f"{self.server_url}/health",
-                timeout=5  # Short timeout for health checks
-            )
-            response.raise_for_status()
+            response = self._request('health', 'GET', '/health')
             
             result = response.json()
             return result.get('status') == 'healthy'
-            
+        
         except requests.exceptions.RequestException:
             return False
     
     def wait_for_server(self, max_wait: int = 60, check_interval: int = 5) -> bool:
-        """Wait for server to become available"""
+        """Wait for server to become available, backing off up to check_interval between probes"""
         start_time = time.time()
+        attempt = 0
         
         while time.time() - start_time < max_wait:
             if self.health_check():
                 logger.info(f"Server is available at {self.server_url}")
                 return True
             
+            delay = self.backoff.delay(attempt, cap=check_interval)
             logger.info(f"Waiting for server at {self.server_url}...")
-            time.sleep(check_interval)
+            time.sleep(min(delay, max(0.0, max_wait - (time.time() - start_time))))
+            attempt += 1
         
         logger.error(f"Server not available after {max_wait} seconds")
         return False
@@ -138,15 +312,10 @@ class FederatedHTTPClient:
                 'client_id': self.client_id
             }
             
-            response = self.session.post(
-                f"{self.server_url}/rag/query",
-                json=payload,
-                timeout=self.timeout
-            )
-            response.raise_for_status()
+            response = self._request('rag_query', 'POST', '/rag/query', payload)
             
             return response.json()
-            
+        
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to submit RAG query: {str(e)}")
             raise
@@ -0,0 +1,154 @@
+"""
+In-process transport for simulations
+Drop-in replacement for FederatedHTTPClient that calls the coordinator directly
+"""
+
+import json
+import logging
+import random
+import time
+from typing import Any, Dict, List, Optional
+import numpy as np
+from .client import BackoffPolicy, CallStatsMixin
+from ..utils.tracing import new_request_id
+
+logger = logging.getLogger(__name__)
+
+
+def _payload_bytes(payload: Any) -> int:
+    """Approximate wire size: raw bytes for arrays, JSON length for everything else."""
+    if isinstance(payload, np.ndarray):
+        return payload.nbytes
+    if isinstance(payload, dict):
+        return sum(_payload_bytes(v) for v in payload.values())
+    if isinstance(payload, (list, tuple)) and payload and isinstance(payload[0], np.ndarray):
+        return sum(w.nbytes for w in payload)
+    return len(json.dumps(payload, default=str))
+
+
+class NetworkEmulator:
+    """Per-client link model adding latency, jitter and bandwidth delay to each call.
+
+    With `realtime` the delay is actually slept, so concurrency effects show up;
+    otherwise it is only accumulated in `simulated_seconds`, which lets tuning
+    runs report network cost without spending wall-clock time on it.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, seed: Optional[int] = None):
+        config = config or {}
+        self.latency = config.get('latency_ms', 0.0) / 1000.0
+        self.jitter = config.get('jitter_ms', 0.0) / 1000.0
+        self.upload_bps = config.get('upload_mbps', config.get('bandwidth_mbps', 0.0)) * 1e6 / 8
+        self.download_bps = config.get('download_mbps', config.get('bandwidth_mbps', 0.0)) * 1e6 / 8
+        self.realtime = config.get('realtime', True)
+        self.simulated_seconds = 0.0
+        self._rng = random.Random(seed)
+
+    def delay(self, bytes_sent: int, bytes_received: int) -> float:
+        """Round-trip time of one call; bandwidths of 0 mean unlimited"""
+        seconds = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if self.upload_bps:
+            seconds += bytes_sent / self.upload_bps
+        if self.download_bps:
+            seconds += bytes_received / self.download_bps
+        return seconds
+
+    def transfer(self, bytes_sent: int, bytes_received: int) -> float:
+        seconds = self.delay(bytes_sent, bytes_received)
+        self.simulated_seconds += seconds
+        if self.realtime and seconds > 0:
+            time.sleep(seconds)
+        return seconds
+
+
+class InMemoryTransport(CallStatsMixin):
+    """Client transport that talks to an in-process FederatedCoordinator.
+
+    Exposes the same methods as FederatedHTTPClient, so a FederatedClient can
+    run unchanged inside a simulation. Weights are handed over as float32
+    arrays instead of JSON lists, and updates are applied synchronously.
+    """
+
+    def __init__(self, coordinator, client_id: str, network: Optional[NetworkEmulator] = None):
+        self.coordinator = coordinator
+        self.client_id = client_id
+        self.server_url = 'inmemory://coordinator'
+        self.network = network
+        self.backoff = BackoffPolicy(base_delay=0.0, max_delay=0.0)
+        self.call_stats: Dict[str, Dict[str, float]] = {}
+        self.last_request_id: Optional[str] = None
+
+    def _call(self, route: str, handler, payload: Any = None) -> Dict[str, Any]:
+        self.last_request_id = new_request_id()
+        start = time.perf_counter()
+        try:
+            result = handler()
+        except Exception:
+            self._record_call(route, time.perf_counter() - start, _payload_bytes(payload), 0, error=True)
+            raise
+        bytes_sent, bytes_received = _payload_bytes(payload), _payload_bytes(result)
+        if self.network is not None:
+            self.network.transfer(bytes_sent, bytes_received)
+        self._record_call(route, time.perf_counter() - start, bytes_sent, bytes_received)
+        return result
+
+    def encode_weights(self, weights: List) -> List:
+        """Weights in the form this transport sends them"""
+        return [np.asarray(w, dtype=np.float32) for w in weights]
+
+    def register(self, client_info: Dict[str, Any] = None) -> Dict[str, Any]:
+        def handler():
+            self.coordinator.register_client(self.client_id, client_info or {})
+            return {
+                'status': 'registered',
+                'client_id': self.client_id,
+                'server_config': self.coordinator.get_client_config()
+            }
+        return self._call('register', handler, client_info)
+
+    def get_global_model(self) -> Dict[str, Any]:
+        def handler():
+            return {
+                'model_weights': self.coordinator.get_global_model(),
+                'feature_scaler': self.coordinator.feature_scaler,
+                'round': self.coordinator.current_round,
+                'timestamp': time.time()
+            }
+        return self._call('get_model', handler, {'client_id': self.client_id})
+
+    def submit_model_update(self, model_weights: List, metrics: Dict[str, Any] = None) -> Dict[str, Any]:
+        def handler():
+            self.coordinator.receive_model_update(self.client_id, model_weights, metrics or {})
+            return {'status': 'update_received', 'client_id': self.client_id,
+                    'round': self.coordinator.current_round}
+        return self._call('submit_update', handler, {'model_weights': model_weights, 'metrics': metrics})
+
+    def submit_feature_stats(self, stats: Dict[str, Any]) -> Dict[str, Any]:
+        def handler():
+            ready = self.coordinator.receive_feature_stats(self.client_id, stats)
+            return {'status': 'stats_received', 'client_id': self.client_id, 'feature_stats_ready': ready}
+        return self._call('submit_stats', handler, stats)
+
+    def get_training_status(self) -> Dict[str, Any]:
+        def handler():
+            coordinator = self.coordinator
+            return {
+                'current_round': coordinator.current_round,
+                'total_rounds': coordinator.rounds,
+                'active_clients': len(coordinator.clients),
+                'clients_ready': len(coordinator.client_updates),
+                'updates_queued': 0,
+                'min_clients': coordinator.min_clients,
+                'training_active': coordinator.training_active,
+                'feature_stats_ready': coordinator.feature_scaler is not None
+            }
+        return self._call('training_status', handler)
+
+    def health_check(self) -> bool:
+        return True
+
+    def wait_for_server(self, max_wait: int = 60, check_interval: int = 5) -> bool:
+        return True
+
+    def close(self):
+        pass
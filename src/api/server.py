@@ -3,12 +3,16 @@ RESTful API for Federated Learning Server
 Handles client registration, model updates, and coordination
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response
 import logging
+import math
 import threading
 import time
+import numpy as np
 from typing import Dict, Any, List
 from ..server.coordinator import FederatedCoordinator
+from ..server.admission import IngestQueue
+from ..utils.tracing import REQUEST_ID_HEADER, new_request_id
 from ..utils.metrics import calculate_model_similarity
 
 logger = logging.getLogger(__name__)
@@ -19,7 +23,55 @@ class FederatedAPI:
         self.coordinator = coordinator
         self.host = host
         self.port = port
+        self.ingest = IngestQueue(coordinator.config.get('ingest', {}), self._apply_update)
+        self.ingest.start()
+        self._setup_metrics()
         self._setup_routes()
+    
+    def _setup_metrics(self):
+        """Instrument every route and expose ingest state on the coordinator's registry"""
+        metrics = self.coordinator.metrics
+        request_latency = metrics.histogram('http_request_duration_seconds', 'Request latency by route')
+        request_bytes = metrics.counter('http_request_bytes_total', 'Request body bytes by route')
+        response_bytes = metrics.counter('http_response_bytes_total', 'Response body bytes by route')
+        request_errors = metrics.counter('http_request_errors_total', 'Responses with status >= 400 by route')
+        metrics.gauge('fl_ingest_inflight_bytes', 'Update bytes admitted and not yet applied',
+                      lambda: self.ingest.stats()['inflight_bytes'])
+        metrics.gauge('fl_ingest_pending_updates', 'Updates admitted and not yet applied',
+                      lambda: self.ingest.stats()['pending_updates'])
+        metrics.gauge('fl_ingest_rejected_updates', 'Updates rejected by admission control since start',
+                      lambda: self.ingest.rejected)
+        
+        @self.app.before_request
+        def start_timer():
+            g.request_start = time.perf_counter()
+            g.request_id = request.headers.get(REQUEST_ID_HEADER) or new_request_id()
+        
+        @self.app.after_request
+        def record_request(response):
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            labels = {'route': route, 'method': request.method, 'status': response.status_code}
+            request_latency.observe(time.perf_counter() - g.get('request_start', time.perf_counter()),
+                                    labels)
+            request_bytes.inc(request.content_length or 0, {'route': route})
+            response_bytes.inc(response.calculate_content_length() or 0, {'route': route})
+            if response.status_code >= 400:
+                request_errors.inc(1, {'route': route, 'status': response.status_code})
+            response.headers[REQUEST_ID_HEADER] = g.get('request_id', '')
+            return response
+    
+    def _apply_update(self, item: Dict[str, Any]):
+        """Apply an update taken off the ingest queue"""
+        tracer = self.coordinator.tracer
+        round_num = item['round']
+        tags = {'client_id': item['client_id'], 'request_id': item['request_id']}
+        tracer.record('queue_wait', item['_enqueued_at'], time.time(), round_num, **tags)
+        
+        with tracer.span('apply_update', round_num, **tags):
+            self.coordinator.receive_model_update(item['client_id'], item['weights'], item['metrics'])
+        
+        if self.coordinator.current_round > round_num:
+            tracer.export_round(round_num)
         
     def _setup_routes(self):
         """Setup API routes"""
@@ -34,6 +86,12 @@ class FederatedAPI:
                 'current_round': getattr(self.coordinator, 'current_round', 0)
             })
         
+        @self.app.route('/metrics', methods=['GET'])
+        def metrics():
+            """Prometheus scrape endpoint"""
+            return Response(self.coordinator.metrics.render(),
+                            mimetype='text/plain; version=0.0.4; charset=utf-8')
+        
         @self.app.route('/register', methods=['POST'])
         def register_client():
             """Register a new client"""
@@ -73,7 +131,8 @@ class FederatedAPI:
                 model_weights = self.coordinator.get_global_model()
                 
                 return jsonify({
-                    'model_weights': model_weights,
+                    'model_weights': [np.asarray(w).tolist() for w in model_weights],
+                    'feature_scaler': self.coordinator.feature_scaler,
                     'round': getattr(self.coordinator, 'current_round', 0),
                     'timestamp': time.time()
                 })
@@ -85,29 +144,85 @@ class FederatedAPI:
         @self.app.route('/submit_update', methods=['POST'])
         def submit_model_update():
             """Submit a model update from client"""
+            # Reserve capacity before the body is read so bursts are shed, not buffered
+            num_bytes = request.content_length
+            if num_bytes is None:
+                return jsonify({'error': 'Content-Length is required'}), 411
+            if num_bytes > self.ingest.max_inflight_bytes:
+                return jsonify({'error': 'Model update exceeds the ingest limit'}), 413
+            
+            retry_after = self.ingest.try_admit(num_bytes)
+            if retry_after is not None:
+                response = jsonify({'error': 'Server busy, retry later', 'retry_after': retry_after})
+                response.headers['Retry-After'] = str(int(math.ceil(retry_after)))
+                return response, 429
+            
+            queued = False
+            try:
+                round_num = self.coordinator.current_round
+                with self.coordinator.tracer.span('server_decode', round_num,
+                                                  request_id=g.request_id, bytes=num_bytes) as span:
+                    data = request.get_json()
+                    client_id = data.get('client_id')
+                    model_weights = data.get('model_weights')
+                    training_metrics = data.get('metrics', {})
+                    span['client_id'] = client_id
+                    
+                    if not client_id or not model_weights:
+                        return jsonify({'error': 'client_id and model_weights are required'}), 400
+                    
+                    if client_id not in self.coordinator.clients:
+                        return jsonify({'error': 'Client not registered'}), 400
+                    
+                    # Decode to float32 arrays so queued updates hold compact buffers, not JSON lists
+                    weights = [np.asarray(w, dtype=np.float32) for w in model_weights]
+                
+                self.ingest.put({
+                    'client_id': client_id,
+                    'weights': weights,
+                    'metrics': training_metrics,
+                    'round': round_num,
+                    'request_id': g.request_id
+                }, num_bytes)
+                queued = True
+                
+                return jsonify({
+                    'status': 'update_queued',
+                    'client_id': client_id,
+                    'timestamp': time.time()
+                }), 202
+                
+            except Exception as e:
+                logger.error(f"Error submitting model update: {str(e)}")
+                return jsonify({'error': str(e)}), 500
+            finally:
+                if not queued:
+                    self.ingest.release(num_bytes)
+        
+        @self.app.route('/submit_stats', methods=['POST'])
+        def submit_feature_stats():
+            """Submit a client's feature statistics for the global scaler"""
             try:
                 data = request.get_json()
                 client_id = data.get('client_id')
-                model_weights = data.get('model_weights')
-                training_metrics = data.get('metrics', {})
+                stats = data.get('stats')
                 
-                if not client_id or not model_weights:
-                    return jsonify({'error': 'client_id and model_weights are required'}), 400
+                if not client_id or not stats:
+                    return jsonify({'error': 'client_id and stats are required'}), 400
                 
                 if client_id not in self.coordinator.clients:
                     return jsonify({'error': 'Client not registered'}), 400
                 
-                # Store the update
-                self.coordinator.receive_model_update(client_id, model_weights, training_metrics)
+                ready = self.coordinator.receive_feature_stats(client_id, stats)
                 
                 return jsonify({
-                    'status': 'update_received',
+                    'status': 'stats_received',
                     'client_id': client_id,
-                    'timestamp': time.time()
+                    'feature_stats_ready': ready
                 })
                 
             except Exception as e:
-                logger.error(f"Error submitting model update: {str(e)}")
+                logger.error(f"Error submitting feature statistics: {str(e)}")
                 return jsonify({'error': str(e)}), 500
         
         @self.app.route('/training_status', methods=['GET'])
@@ -119,8 +234,10 @@ class FederatedAPI:
                     'total_rounds': self.coordinator.config.get('federated', {}).get('num_rounds', 10),
                     'active_clients': len(self.coordinator.clients),
                     'clients_ready': len(getattr(self.coordinator, 'client_updates', {})),
+                    'updates_queued': self.ingest.stats()['pending_updates'],
                     'min_clients': self.coordinator.config.get('federated', {}).get('min_clients', 2),
-                    'training_active': getattr(self.coordinator, 'training_active', False)
+                    'training_active': getattr(self.coordinator, 'training_active', False),
+                    'feature_stats_ready': self.coordinator.feature_scaler is not None
                 })
                 
             except Exception as e:
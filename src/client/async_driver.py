@@ -0,0 +1,149 @@
+"""
+Async Load Driver for Federated Learning
+Drives thousands of logical clients against a FederatedAPI server from one event loop
+"""
+
+import aiohttp
+import argparse
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from ..api.async_client import AsyncFederatedHTTPClient, create_session
+
+logger = logging.getLogger(__name__)
+
+Trainer = Callable[[List, int], Tuple[List, Dict]]
+
+
+def stub_trainer(weights: List, client_index: int, dataset_size: int = 100,
+                 learning_rate: float = 0.01) -> Tuple[List, Dict]:
+    """Stand-in for local training: perturb the global weights with small noise."""
+    rng = np.random.default_rng(client_index)
+    new_weights = [
+        (np.asarray(w, dtype=np.float32)
+         + learning_rate * rng.standard_normal(np.shape(w)).astype(np.float32)).tolist()
+        for w in weights
+    ]
+    return new_weights, {'dataset_size': dataset_size, 'final_loss': 0.0, 'epochs_trained': 1}
+
+
+class AsyncClientDriver:
+    def __init__(self, server_url: str, num_clients: int, rounds: int,
+                 trainer: Optional[Trainer] = None, http_config: Optional[Dict] = None,
+                 pool_size: int = 100, poll_interval: float = 0.5, max_failures: int = 5,
+                 client_prefix: str = 'sim'):
+        """Configure a population of logical clients.
+
+        `trainer(weights, client_index)` returns `(new_weights, metrics)`. It runs in
+        the default executor so a real (blocking) trainer doesn't stall the event loop.
+        """
+        self.server_url = server_url
+        self.num_clients = num_clients
+        self.rounds = rounds
+        self.trainer = trainer or stub_trainer
+        self.http_config = http_config or {}
+        self.pool_size = pool_size
+        self.poll_interval = poll_interval
+        self.max_failures = max_failures
+        self.client_prefix = client_prefix
+        self.clients: List[AsyncFederatedHTTPClient] = []
+
+    async def _run_client(self, index: int, client: AsyncFederatedHTTPClient) -> int:
+        """Lifecycle of one logical client; returns the number of updates it submitted."""
+        loop = asyncio.get_running_loop()
+        await client.register({'dataset_size': 100, 'capabilities': ['training'], 'simulated': True})
+
+        submitted = 0
+        last_round = -1
+        consecutive_failures = 0
+        while True:
+            try:
+                status = await client.get_training_status()
+                server_round = status.get('current_round', 0)
+                if not status.get('training_active', True) or server_round >= self.rounds:
+                    return submitted
+
+                if server_round > last_round:
+                    model = await client.get_global_model()
+                    weights, metrics = await loop.run_in_executor(
+                        None, self.trainer, model['model_weights'], index)
+                    metrics['round'] = server_round
+                    await client.submit_model_update(weights, metrics)
+                    last_round = server_round
+                    submitted += 1
+                else:
+                    # Jitter the poll so the population doesn't hit /training_status in lockstep
+                    await asyncio.sleep(client.backoff.delay(0, cap=self.poll_interval))
+                consecutive_failures = 0
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                consecutive_failures += 1
+                if consecutive_failures > self.max_failures:
+                    raise
+                logger.debug(f"Client {client.client_id} error ({e!r}), backing off")
+                await asyncio.sleep(client.backoff.delay(consecutive_failures))
+
+    async def run(self) -> Dict:
+        """Run every logical client to completion and summarise the load generated."""
+        start = time.perf_counter()
+        session = create_session(self.pool_size)
+        try:
+            self.clients = [
+                AsyncFederatedHTTPClient(self.server_url, f"{self.client_prefix}_{i}",
+                                         http_config=self.http_config, session=session)
+                for i in range(self.num_clients)
+            ]
+            results = await asyncio.gather(
+                *(self._run_client(i, client) for i, client in enumerate(self.clients)),
+                return_exceptions=True
+            )
+        finally:
+            await session.close()
+
+        failures = [r for r in results if isinstance(r, BaseException)]
+        for failure in failures[:5]:
+            logger.error(f"Logical client failed: {failure!r}")
+
+        summary = {
+            'clients': self.num_clients,
+            'failed_clients': len(failures),
+            'updates_submitted': sum(r for r in results if isinstance(r, int)),
+            'elapsed_seconds': time.perf_counter() - start,
+            'routes': self._merge_call_stats()
+        }
+        logger.info(f"Async driver finished: {summary['updates_submitted']} updates from "
+                    f"{self.num_clients} clients in {summary['elapsed_seconds']:.1f}s")
+        return summary
+
+    def _merge_call_stats(self) -> Dict[str, Dict[str, float]]:
+        merged: Dict[str, Dict[str, float]] = {}
+        for client in self.clients:
+            for route, stats in client.get_call_stats().items():
+                target = merged.setdefault(route, {key: 0 for key in stats})
+                for key, value in stats.items():
+                    target[key] = max(target[key], value) if key == 'latency_max' else target[key] + value
+        for stats in merged.values():
+            stats['latency_mean'] = stats['latency_total'] / stats['calls'] if stats['calls'] else 0.0
+        return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Async federated load driver')
+    parser.add_argument('--server-url', default='http://localhost:8080')
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--pool-size', type=int, default=100)
+    args = parser.parse_args()
+
+    logging.basicConfig(level='INFO', format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    driver = AsyncClientDriver(args.server_url, args.clients, args.rounds, pool_size=args.pool_size)
+    summary = asyncio.run(driver.run())
+    for route, stats in summary['routes'].items():
+        logger.info(f"{route}: calls={stats['calls']} errors={stats['errors']} "
+                    f"mean={stats['latency_mean'] * 1000:.1f}ms max={stats['latency_max'] * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
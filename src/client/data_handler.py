@@ -2,28 +2,175 @@
 
 import numpy as np
 import pandas as pd
-from typing import Tuple, Dict
+from pathlib import Path
+from typing import Tuple, Dict, Optional, Union
+import logging
+import os
+import zlib
 import tensorflow as tf
 from sklearn.preprocessing import StandardScaler
+from .tabular_loader import OutOfCoreTabularLoader, MemmapTable
+from .partitioner import NonIIDPartitioner
 
 class FinancialDataHandler:
-    def __init__(self, config: Dict):
-        """Initialize the data handler with configuration."""
+    def __init__(self, config: Dict, client_id: Optional[str] = None):
+        """Initialize the data handler with configuration.
+        
+        `client_id` (default: the config's `id`) seeds the local data and names its cache file.
+        """
         self.batch_size = config['data']['batch_size']
         self.shuffle_buffer = config['data']['shuffle_buffer']
         self.prefetch_buffer = config['data']['prefetch_buffer']
+        self.input_dim = config['data'].get('input_dim', 32)
+        self.dataset_size = config['data'].get('dataset_size', 100)
+        self.cache_dir = config['data'].get('cache_dir')
+        self.source_path = config['data'].get('source_path')
+        self.feature_columns = config['data'].get('feature_columns')
+        self.target_column = config['data'].get('target_column')
+        if self.source_path and not self.target_column:
+            # Training consumes (features, target) batches; an extract without targets can't be trained on
+            raise ValueError("data.target_column is required when data.source_path is set")
+        self.partition = config['data'].get('partition')
+        self.loader = OutOfCoreTabularLoader(config)
+        self.client_id = str(client_id if client_id is not None else config.get('id', 'client'))
+        # Stable per-client seed (unlike hash(), crc32 doesn't change between processes)
+        self.seed = config['data'].get('seed', zlib.crc32(self.client_id.encode('utf-8')))
+        self.scaler = StandardScaler()
+        
+        self._local_data: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._local_dataset: Optional[tf.data.Dataset] = None
+        self._table: Optional[MemmapTable] = None
+        self._scaled_data: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        
+    def generate_synthetic_data(self, num_samples: int, seed: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Generate a synthetic regression task (features and their row sums)."""
+        rng = np.random.default_rng(self.seed if seed is None else seed)
+        X = rng.standard_normal((num_samples, self.input_dim), dtype=np.float32)
+        y = X.sum(axis=1, keepdims=True)
+        return X, y
+    
+    def get_local_data(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Local training arrays, materialized once and reused every round.
+        
+        With `data.cache_dir` set, the arrays are also persisted so restarts
+        and repeated runs train on exactly the same data.
+        """
+        if self._local_data is not None:
+            return self._local_data
+        
+        if self.partition:
+            # Simulated non-IID shard; the partitioner keeps its own .npy cache
+            X, y, _ = NonIIDPartitioner(self.partition).client_shard(self.partition.get('client_index', 0))
+            self._local_data = (X, y)
+            return self._local_data
+        
+        # Keyed on everything that shapes the data, so a changed config never reloads stale arrays
+        cache_name = f"{self.client_id}-{self.dataset_size}x{self.input_dim}-seed{self.seed}.npz"
+        cache_path = Path(self.cache_dir) / cache_name if self.cache_dir else None
+        if cache_path is not None and cache_path.exists():
+            with np.load(cache_path) as cached:
+                self._local_data = (cached['X'], cached['y'])
+            logging.getLogger(__name__).info(f"Loaded cached local data from {cache_path}")
+            return self._local_data
+        
+        self._local_data = self.generate_synthetic_data(self.dataset_size)
+        if cache_path is not None:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_suffix('.tmp.npz')
+            np.savez(tmp_path, X=self._local_data[0], y=self._local_data[1])
+            os.replace(tmp_path, cache_path)
+        return self._local_data
+    
+    def load_tabular(self, path: str, feature_columns=None, target_column=None) -> MemmapTable:
+        """Stream a CSV/Parquet extract into a scaled memory-mapped table.
+        
+        The handler's scaler takes the streaming statistics used for scaling.
+        """
+        self._table = self.loader.load(path, feature_columns, target_column, client_id=self.client_id)
+        self.scaler = self._table.scaler()
+        return self._table
+    
+    def get_training_data(self) -> Tuple[Union[Tuple[np.ndarray, np.ndarray], tf.data.Dataset], int]:
+        """Training input for the client and its number of samples.
+        
+        With `data.source_path` set, the extract is loaded out of core and
+        streamed from the memory map; otherwise the in-memory local data is used.
+        """
+        if not self.source_path:
+            X, y = self._scaled_data or self.get_local_data()
+            return (X, y), len(X)
+        
+        if self._table is None:
+            self.load_tabular(self.source_path, self.feature_columns, self.target_column)
+        if self._local_dataset is None:
+            self._local_dataset = self._table.to_dataset(self.batch_size, self.shuffle_buffer,
+                                                         self.prefetch_buffer, seed=self.seed)
+        return self._local_dataset, self._table.num_rows
+    
+    def get_local_dataset(self) -> tf.data.Dataset:
+        """Cached, shuffling, prefetching tf.data pipeline over the local data."""
+        if self.source_path:
+            return self.get_training_data()[0]
+        if self._local_dataset is None:
+            (X, y), _ = self.get_training_data()
+            self._local_dataset = (tf.data.Dataset.from_tensor_slices((X, y))
+                                   .cache()
+                                   .shuffle(self.shuffle_buffer, seed=self.seed, reshuffle_each_iteration=True)
+                                   .batch(self.batch_size)
+                                   .prefetch(self.prefetch_buffer))
+        return self._local_dataset
+    
+    def compute_feature_statistics(self, histogram_edges=None) -> Dict:
+        """Sufficient statistics (count, sum, sum of squares, optional histogram) of the raw features."""
+        if self.source_path:
+            if self._table is None:
+                self.load_tabular(self.source_path, self.feature_columns, self.target_column)
+            return self._table.raw_statistics(histogram_edges, self.loader.chunk_size)
+        
+        X, _ = self.get_local_data()
+        X64 = X.astype(np.float64)
+        stats = {
+            'count': len(X),
+            'sum': X64.sum(axis=0).tolist(),
+            'sum_sq': np.square(X64).sum(axis=0).tolist()
+        }
+        if histogram_edges is not None:
+            stats['histogram'] = {
+                'edges': list(histogram_edges),
+                'counts': [np.histogram(X[:, j], bins=histogram_edges)[0].tolist() for j in range(X.shape[1])]
+            }
+        return stats
+    
+    def apply_global_scaler(self, mean, scale):
+        """Standardize local features with the federation-wide scaler instead of a local fit."""
+        mean = np.asarray(mean, dtype=np.float64)
+        scale = np.asarray(scale, dtype=np.float64)
         self.scaler = StandardScaler()
+        self.scaler.mean_ = mean
+        self.scaler.scale_ = scale
+        self.scaler.var_ = scale ** 2
+        self.scaler.n_features_in_ = len(mean)
         
-    def simulate_financial_data(self, num_samples: int = 1000) -> pd.DataFrame:
+        if self.source_path:
+            if self._table is None:
+                self.load_tabular(self.source_path, self.feature_columns, self.target_column)
+            self._table.set_scaler(mean, scale)
+        else:
+            X, y = self.get_local_data()
+            self._scaled_data = (((X - mean) / scale).astype(np.float32), y)
+            self._local_dataset = None
+    
+    def simulate_financial_data(self, num_samples: int = 1000, seed: Optional[int] = None) -> pd.DataFrame:
         """Generate synthetic financial data for testing."""
-        np.random.seed(42)
+        # Private generator: reproducible per client without touching the global numpy RNG
+        rng = np.random.default_rng(self.seed if seed is None else seed)
         
         data = {
-            'transaction_amount': np.random.lognormal(mean=4.0, sigma=1.0, size=num_samples),
-            'account_balance': np.random.normal(loc=10000, scale=5000, size=num_samples),
-            'transaction_frequency': np.random.poisson(lam=5, size=num_samples),
-            'credit_score': np.random.normal(loc=700, scale=50, size=num_samples).clip(300, 850),
-            'days_since_last_transaction': np.random.exponential(scale=7, size=num_samples)
+            'transaction_amount': rng.lognormal(mean=4.0, sigma=1.0, size=num_samples),
+            'account_balance': rng.normal(loc=10000, scale=5000, size=num_samples),
+            'transaction_frequency': rng.poisson(lam=5, size=num_samples),
+            'credit_score': rng.normal(loc=700, scale=50, size=num_samples).clip(300, 850),
+            'days_since_last_transaction': rng.exponential(scale=7, size=num_samples)
         }
         
         return pd.DataFrame(data)
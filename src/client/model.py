@@ -6,23 +6,40 @@ import numpy as np
 import logging
 import time
 from ..api.client import FederatedHTTPClient
+from ..utils.resources import apply_resource_profile
+from ..utils.tracing import Tracer
 from .data_handler import FinancialDataHandler
+from .training import TrainingEngine
 
 class FederatedClient:
-    def __init__(self, client_id: str, config: Dict, server_url: Optional[str] = None):
-        """Initialize the federated client."""
+    def __init__(self, client_id: str, config: Dict, server_url: Optional[str] = None,
+                 transport=None):
+        """Initialize the federated client.
+        
+        `transport` replaces the HTTP client, e.g. with an InMemoryTransport in simulations.
+        """
         self.client_id = str(client_id)
         self.config = config.get('client', {})
+        # Thread pools and affinity must be set before TensorFlow builds anything
+        self.resources = apply_resource_profile(self.config.get('resources'))
         self.model = self._build_model()
-        self.data_handler = FinancialDataHandler(self.config)
+        self.engine = TrainingEngine(self.model, self.config.get('training', {}))
+        self.data_handler = FinancialDataHandler(self.config, self.client_id)
         
         # HTTP client for server communication
         self.server_url = server_url or self.config.get('server_url', 'http://localhost:8080')
-        self.http_client = FederatedHTTPClient(self.server_url, self.client_id)
+        self.http_client = transport or FederatedHTTPClient(self.server_url, self.client_id,
+                                                            http_config=self.config.get('http', {}))
         
         # Training state
         self.registered = False
         self.current_round = 0
+        self.server_config = {}
+        self.feature_scaler_applied = False
+        
+        # Round phase tracing
+        self.tracer = Tracer(f"client_{self.client_id}", self.config.get('tracing', {}))
+        self._round_wait_start = time.time()
         
     def start(self):
         """Start the federated client process with server communication."""
@@ -51,17 +68,24 @@ class FederatedClient:
         logger = logging.getLogger(__name__)
         
         try:
-            # Generate local data to get client info
-            X, y = self._generate_dummy_data()
+            # Load local data to get client info
+            _, num_samples = self._load_local_data()
             
             client_info = {
-                'dataset_size': len(X),
+                'dataset_size': num_samples,
                 'model_params': self.model.count_params(),
                 'capabilities': ['training', 'inference']
             }
             
             response = self.http_client.register(client_info)
             self.registered = True
+            self.server_config = response.get('server_config', {})
+            
+            # Federated analytics phase: contribute to the shared feature scaler before training
+            stats_config = self.server_config.get('feature_stats', {})
+            if stats_config.get('enabled'):
+                stats = self.data_handler.compute_feature_statistics(stats_config.get('histogram_edges'))
+                self.http_client.submit_feature_stats(stats)
             
             logger.info(f"Successfully registered with server")
             logger.info(f"Dataset size: {client_info['dataset_size']}")
@@ -74,6 +98,7 @@ class FederatedClient:
     def _federated_learning_loop(self):
         """Main federated learning loop"""
         logger = logging.getLogger(__name__)
+        consecutive_failures = 0
         
         while True:
             try:
@@ -85,72 +110,104 @@ class FederatedClient:
                     break
                 
                 server_round = status.get('current_round', 0)
+                stats_pending = (self.server_config.get('feature_stats', {}).get('enabled')
+                                 and not status.get('feature_stats_ready'))
                 
-                if server_round > self.current_round:
+                if server_round > self.current_round and not stats_pending:
+                    self.tracer.record('status_wait', self._round_wait_start, time.time(),
+                                       server_round, client_id=self.client_id)
                     self._participate_in_round(server_round)
                     self.current_round = server_round
+                    self._round_wait_start = time.time()
                 
+                consecutive_failures = 0
                 time.sleep(5)  # Check every 5 seconds
                 
             except Exception as e:
                 logger.error(f"Error in federated learning loop: {str(e)}")
-                time.sleep(10)  # Wait longer on error
+                # Jittered backoff so a server hiccup doesn't stall every client for a fixed
+                # period and then have them all reconnect at once
+                time.sleep(self.http_client.backoff.delay(consecutive_failures))
+                consecutive_failures += 1
     
     def _participate_in_round(self, round_num: int):
         """Participate in a federated learning round"""
         logger = logging.getLogger(__name__)
         logger.info(f"Participating in round {round_num}")
         
+        tracer = self.tracer
+        tags = {'client_id': self.client_id}
+        round_start = time.perf_counter()
+        
         try:
             # Get global model from server
-            model_response = self.http_client.get_global_model()
+            with tracer.span('model_download', round_num, **tags) as span:
+                model_response = self.http_client.get_global_model()
+                span['request_id'] = self.http_client.last_request_id
             global_weights = model_response.get('model_weights')
             
+            feature_scaler = model_response.get('feature_scaler')
+            if feature_scaler and not self.feature_scaler_applied:
+                self.data_handler.apply_global_scaler(feature_scaler['mean'], feature_scaler['scale'])
+                self.feature_scaler_applied = True
+                logger.info(f"Applied global feature scaler from {feature_scaler['num_clients']} clients")
+            
             if global_weights:
-                self.set_weights(global_weights)
+                with tracer.span('deserialization', round_num, **tags):
+                    self.set_weights([np.asarray(w, dtype=np.float32) for w in global_weights])
                 logger.info("Updated local model with global weights")
             
-            # Generate/load local data
-            X, y = self._generate_dummy_data()
-            logger.info(f"Training on {len(X)} samples")
-            
-            # Train locally
-            history = self.train_local((X, y))
+            # Local data is materialized once, so every round trains on the same samples
+            data, num_samples = self._load_local_data()
+            logger.info(f"Training on {num_samples} samples")
+            
+            # Train locally; with a round deadline the amount of work is sized to fit it
+            training_config = self.server_config.get('training_config', {})
+            deadline = training_config.get('round_deadline_seconds')
+            steps_per_epoch = self.engine.steps_per_epoch(num_samples)
+            with tracer.span('local_training', round_num, samples=num_samples, **tags) as span:
+                if deadline:
+                    # Leave part of the deadline for the upload
+                    budget = (deadline * training_config.get('deadline_fraction', 0.8)
+                              - (time.perf_counter() - round_start))
+                    history = self.engine.train_for(data, budget, training_config.get('min_local_steps', 1),
+                                                    training_config.get('max_local_steps'))
+                    local_steps = history['steps']
+                    epochs_trained = local_steps / steps_per_epoch
+                else:
+                    history = self.train_local(data)
+                    epochs_trained = len(history['loss'])
+                    local_steps = epochs_trained * steps_per_epoch
+                span['local_steps'] = local_steps
             
             # Prepare metrics
             metrics = {
-                'dataset_size': len(X),
+                'dataset_size': num_samples,
                 'final_loss': history['loss'][-1] if history['loss'] else 0.0,
-                'epochs_trained': len(history['loss']),
+                'epochs_trained': epochs_trained,
+                'local_steps': local_steps,
                 'round': round_num
             }
             
             # Submit update to server
-            local_weights = self.get_weights()
-            self.http_client.submit_model_update(local_weights, metrics)
+            with tracer.span('serialization', round_num, **tags):
+                local_weights = self.http_client.encode_weights(self.get_weights())
+            with tracer.span('upload', round_num, **tags) as span:
+                self.http_client.submit_model_update(local_weights, metrics)
+                span['request_id'] = self.http_client.last_request_id
             
             logger.info(f"Round {round_num} completed - Final loss: {metrics['final_loss']:.4f}")
+            return metrics
             
         except Exception as e:
             logger.error(f"Error in round {round_num}: {str(e)}")
             raise
+        finally:
+            tracer.export_round(round_num)
         
-    def _generate_dummy_data(self):
-        """Generate dummy data for testing."""
-        try:
-            # Try to use the data handler for more realistic data
-            return self.data_handler.generate_synthetic_data(100)
-        except Exception:
-            # Fallback to simple dummy data
-            num_samples = 100
-            input_dim = 32  # Match with model's input dimension
-            
-            # Generate input data
-            X = tf.random.normal((num_samples, input_dim))
-            # Generate target data (for this example, we'll predict the sum of inputs)
-            y = tf.reduce_sum(X, axis=1, keepdims=True)
-            
-            return X.numpy(), y.numpy()
+    def _load_local_data(self):
+        """Local training data and its size, loaded once and cached by the data handler."""
+        return self.data_handler.get_training_data()
         
     def _build_model(self):
         """Build the initial model architecture."""
@@ -172,34 +229,13 @@ class FederatedClient:
     def train_local(self, data):
         """Train the model on local data."""
         logger = logging.getLogger(__name__)
-        X, y = data
-        
-        # Ensure data is in the right format
-        if isinstance(X, np.ndarray):
-            X = tf.convert_to_tensor(X, dtype=tf.float32)
-        if isinstance(y, np.ndarray):
-            y = tf.convert_to_tensor(y, dtype=tf.float32)
         
         # Log training parameters
-        logger.info(f"Training Parameters:")
-        logger.info(f"Input shape: {X.shape}")
-        logger.info(f"Output shape: {y.shape}")
-        logger.info(f"Batch size: {self.config.get('training', {}).get('batch_size', 32)}")
-        logger.info(f"Epochs: {self.config.get('training', {}).get('local_epochs', 5)}")
-        
-        class LogCallback(tf.keras.callbacks.Callback):
-            def on_epoch_end(self, epoch, logs=None):
-                logger.debug(f"Epoch {epoch + 1} - loss: {logs['loss']:.4f}")
-        
-        # Train the model
-        history = self.model.fit(
-            X, y,
-            batch_size=self.config.get('training', {}).get('batch_size', 32),
-            epochs=self.config.get('training', {}).get('local_epochs', 3),
-            verbose=0,
-            callbacks=[LogCallback()]
-        )
-        return history.history
+        if isinstance(data, tuple):
+            logger.debug(f"Input shape: {np.shape(data[0])}, output shape: {np.shape(data[1])}")
+        logger.debug(f"Batch size: {self.engine.batch_size}, epochs: {self.engine.local_epochs}")
+        
+        return self.engine.train(data)
         
     def get_weights(self) -> List:
         """Get the model weights."""
@@ -207,5 +243,5 @@ class FederatedClient:
         
     def set_weights(self, weights: List):
         """Update local model with global weights."""
-        self.model.set_weights(weights)
+        self.engine.set_weights(weights)
 
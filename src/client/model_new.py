@@ -14,7 +14,7 @@ class FederatedClient:
         self.client_id = str(client_id)
         self.config = config.get('client', {})
         self.model = self._build_model()
-        self.data_handler = FinancialDataHandler(config)
+        self.data_handler = FinancialDataHandler(config, self.client_id)
         
         # HTTP client for server communication
         self.server_url = server_url or self.config.get('server_url', 'http://localhost:8080')
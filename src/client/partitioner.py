@@ -0,0 +1,150 @@
+"""partitioner.py module."""
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import numpy as np
+
+Shard = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+def _generate_shard(params: Dict, centers: np.ndarray, num_samples: int,
+                    seed: np.random.SeedSequence) -> Shard:
+    """One client's features, regression target and segment labels."""
+    rng = np.random.default_rng(seed)
+    num_segments, input_dim = centers.shape
+
+    # Label skew: the client's segment mix is a Dirichlet draw
+    proportions = rng.dirichlet(np.full(num_segments, params['label_alpha']))
+    labels = rng.choice(num_segments, size=num_samples, p=proportions).astype(np.int32)
+
+    # Feature skew: per-client scale and shift on top of the segment centers
+    shift = rng.normal(0.0, params['feature_skew'], size=input_dim)
+    scale = np.exp(rng.normal(0.0, params['feature_skew'] / 2, size=input_dim))
+    X = rng.standard_normal((num_samples, input_dim), dtype=np.float32)
+    X *= scale.astype(np.float32)
+    X += (centers[labels] + shift).astype(np.float32)
+
+    y = X.sum(axis=1, keepdims=True)
+    return X, y, labels
+
+def _generate_batch(params: Dict, centers: np.ndarray, jobs: List[Tuple[int, int, np.random.SeedSequence]],
+                    cache_dir: Optional[str]) -> List[Tuple[int, Optional[Shard]]]:
+    results = []
+    for index, num_samples, seed in jobs:
+        shard = _generate_shard(params, centers, num_samples, seed)
+        if cache_dir is not None:
+            _save_shard(Path(cache_dir), index, shard)
+            shard = None  # The parent reads it back from the cache instead of unpickling it
+        results.append((index, shard))
+    return results
+
+def _shard_paths(cache_dir: Path, index: int) -> Tuple[Path, Path, Path]:
+    return tuple(cache_dir / f"client_{index}_{name}.npy" for name in ('X', 'y', 'labels'))
+
+def _save_shard(cache_dir: Path, index: int, shard: Shard):
+    for path, array in zip(_shard_paths(cache_dir, index), shard):
+        tmp_path = path.with_suffix('.tmp.npy')
+        np.save(tmp_path, array)
+        os.replace(tmp_path, path)
+
+class NonIIDPartitioner:
+    """Reproducible, heterogeneous synthetic shards for simulated clients.
+
+    Every client draws from its own `np.random.Generator`, seeded from
+    `SeedSequence(seed).spawn(num_clients)`, so a client's shard depends only
+    on the seed and its index, not on worker count or generation order.
+    Heterogeneity is controlled by three knobs: `size_alpha` (Dirichlet
+    concentration of client dataset sizes), `label_alpha` (Dirichlet
+    concentration of each client's segment mix) and `feature_skew` (spread of
+    the per-client feature shift and scale). Smaller alphas mean more skew.
+    Shards are generated in a process pool and can be cached as `.npy` files.
+    """
+
+    def __init__(self, config: Dict):
+        partition_config = config.get('partition', config)
+        self.num_clients = partition_config.get('num_clients', 10)
+        self.input_dim = partition_config.get('input_dim', 32)
+        self.total_samples = partition_config.get('total_samples', self.num_clients * 100)
+        self.min_samples = partition_config.get('min_samples', 10)
+        self.num_segments = partition_config.get('num_segments', 10)
+        self.size_alpha = partition_config.get('size_alpha', 1.0)
+        self.label_alpha = partition_config.get('label_alpha', 0.5)
+        self.feature_skew = partition_config.get('feature_skew', 0.5)
+        self.seed = partition_config.get('seed', 42)
+        self.cache_dir = partition_config.get('cache_dir')
+        self.max_workers = partition_config.get('max_workers') or os.cpu_count() or 1
+
+        root = np.random.SeedSequence(self.seed)
+        global_seed, client_root = root.spawn(2)
+        self._client_seeds = client_root.spawn(self.num_clients)
+
+        # Shared structure (segment centers, client sizes) comes from its own stream
+        rng = np.random.default_rng(global_seed)
+        self.centers = rng.normal(0.0, 1.0, size=(self.num_segments, self.input_dim))
+        self.sizes = self._client_sizes(rng)
+
+    def _client_sizes(self, rng: np.random.Generator) -> np.ndarray:
+        # Size skew: a Dirichlet split of what is left after every client gets min_samples
+        spare = max(self.total_samples - self.min_samples * self.num_clients, 0)
+        shares = rng.dirichlet(np.full(self.num_clients, self.size_alpha))
+        return self.min_samples + rng.multinomial(spare, shares)
+
+    def _params(self) -> Dict:
+        return {'label_alpha': self.label_alpha, 'feature_skew': self.feature_skew}
+
+    def fingerprint(self) -> str:
+        """Short hash of every setting that affects the generated shards"""
+        settings = dict(self._params(), num_clients=self.num_clients, input_dim=self.input_dim,
+                        total_samples=self.total_samples, min_samples=self.min_samples,
+                        num_segments=self.num_segments, size_alpha=self.size_alpha, seed=self.seed)
+        return hashlib.sha1(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+    def _cache_path(self) -> Optional[Path]:
+        return Path(self.cache_dir) / self.fingerprint() if self.cache_dir else None
+
+    def client_shard(self, index: int, mmap: bool = False) -> Shard:
+        """Features, target and segment labels of one client, from cache when available"""
+        cache_path = self._cache_path()
+        if cache_path is not None:
+            paths = _shard_paths(cache_path, index)
+            if all(path.exists() for path in paths):
+                return tuple(np.load(path, mmap_mode='r' if mmap else None) for path in paths)
+        shard = _generate_shard(self._params(), self.centers, int(self.sizes[index]), self._client_seeds[index])
+        if cache_path is not None:
+            cache_path.mkdir(parents=True, exist_ok=True)
+            _save_shard(cache_path, index, shard)
+        return shard
+
+    def generate(self, clients: Optional[List[int]] = None, mmap: bool = False) -> Dict[int, Shard]:
+        """Shards for `clients` (default: all), generated in parallel where missing from the cache"""
+        logger = logging.getLogger(__name__)
+        clients = list(range(self.num_clients)) if clients is None else list(clients)
+        cache_path = self._cache_path()
+
+        missing = clients
+        if cache_path is not None:
+            cache_path.mkdir(parents=True, exist_ok=True)
+            missing = [i for i in clients if not all(p.exists() for p in _shard_paths(cache_path, i))]
+
+        shards: Dict[int, Shard] = {}
+        jobs = [(i, int(self.sizes[i]), self._client_seeds[i]) for i in missing]
+        cache_arg = str(cache_path) if cache_path is not None else None
+        workers = min(self.max_workers, len(jobs))
+        if workers > 1:
+            # A few batches per worker keeps pickling and scheduling overhead negligible
+            batch_size = -(-len(jobs) // (workers * 4))
+            batches = [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_generate_batch, self._params(), self.centers, batch, cache_arg)
+                           for batch in batches]
+                for future in futures:
+                    shards.update(future.result())
+        elif jobs:
+            shards.update(_generate_batch(self._params(), self.centers, jobs, cache_arg))
+
+        logger.info(f"Generated {len(jobs)} of {len(clients)} client shards ({workers or 1} workers)")
+        return {i: shards.get(i) or self.client_shard(i, mmap) for i in clients}
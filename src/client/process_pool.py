@@ -0,0 +1,165 @@
+"""process_pool.py module."""
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import logging
+import multiprocessing
+import os
+import numpy as np
+
+class SharedWeights:
+    """Model weights laid out as flat float32 slots in one shared-memory block.
+
+    Slot `i` holds a full set of weights with the given layer shapes; views
+    into it are plain numpy arrays, so reading or writing never pickles.
+    """
+
+    def __init__(self, shapes: Sequence[Tuple[int, ...]], slots: int = 1, name: Optional[str] = None):
+        self.shapes = [tuple(shape) for shape in shapes]
+        self.sizes = [int(np.prod(shape)) for shape in self.shapes]
+        self.slots = slots
+        self.slot_size = sum(self.sizes)
+        nbytes = max(1, slots * self.slot_size * 4)
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=nbytes if self.owner else 0)
+        self.name = self.shm.name
+        self.buffer = np.ndarray((slots, self.slot_size), dtype=np.float32, buffer=self.shm.buf)
+
+    def views(self, slot: int = 0) -> List[np.ndarray]:
+        """Per-layer arrays backed by the shared block (no copy)"""
+        views, offset = [], 0
+        for shape, size in zip(self.shapes, self.sizes):
+            views.append(self.buffer[slot, offset:offset + size].reshape(shape))
+            offset += size
+        return views
+
+    def write(self, weights: Sequence, slot: int = 0):
+        offset = 0
+        for weight, size in zip(weights, self.sizes):
+            self.buffer[slot, offset:offset + size] = np.asarray(weight, dtype=np.float32).ravel()
+            offset += size
+
+    def close(self):
+        self.buffer = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+# Per-worker state, built once by the pool initializer
+_worker = None
+
+def _init_worker(client_config: Dict, shapes: List[Tuple[int, ...]], global_name: str,
+                 updates_name: str, num_slots: int):
+    # Imported here so the parent can create the pool without paying for the client stack twice
+    from .model import FederatedClient
+    global _worker
+    client = FederatedClient(f"worker_{os.getpid()}", client_config)
+    _worker = {
+        'client': client,
+        'global': SharedWeights(shapes, 1, name=global_name),
+        'updates': SharedWeights(shapes, num_slots, name=updates_name),
+        'handlers': {},
+        'scaled': set(),
+        # Fresh optimizer state (zero slots, step 0, configured learning rate) to restore per client
+        'optimizer_state': [variable.numpy() for variable in client.engine.optimizer.variables]
+    }
+
+def _train_client(task: Tuple[int, Dict, int, Optional[Dict]]) -> Optional[Dict[str, Any]]:
+    # One failing client must not abort the round for the others, as with the threads backend
+    try:
+        return _train(*task)
+    except Exception as e:
+        logging.getLogger(__name__).error(f"Client {task[0]} failed in round {task[2]} "
+                                          f"(worker {os.getpid()}): {e!r}")
+        return None
+
+def _train(index: int, config: Dict, round_num: int, feature_scaler: Optional[Dict]) -> Dict[str, Any]:
+    from .data_handler import FinancialDataHandler
+    client = _worker['client']
+
+    handler = _worker['handlers'].get(index)
+    if handler is None:
+        handler = _worker['handlers'][index] = FinancialDataHandler(config['client'], config['client'].get('id'))
+    if feature_scaler and index not in _worker['scaled']:
+        handler.apply_global_scaler(feature_scaler['mean'], feature_scaler['scale'])
+        _worker['scaled'].add(index)
+
+    # The worker's model is shared by every client it trains: load the global
+    # weights and start from fresh optimizer state, as a new client would
+    client.set_weights(_worker['global'].views(0))
+    for variable, value in zip(client.engine.optimizer.variables, _worker['optimizer_state']):
+        variable.assign(value)
+
+    data, num_samples = handler.get_training_data()
+    history = client.train_local(data)
+    _worker['updates'].write(client.get_weights(), slot=index)
+    return {
+        'dataset_size': num_samples,
+        'final_loss': history['loss'][-1] if history['loss'] else 0.0,
+        'epochs_trained': len(history['loss']),
+        # FedNova normalizes each update by the optimizer steps behind it
+        'local_steps': len(history['loss']) * client.engine.steps_per_epoch(num_samples),
+        'round': round_num,
+        'worker': os.getpid()
+    }
+
+class ProcessPoolBackend:
+    """Trains many clients per round across a pool of worker processes.
+
+    Each worker builds its TensorFlow model once, in the pool initializer.
+    Every round the global weights are written once to a shared-memory block
+    that all workers read, and each client's update is written into its own
+    shared-memory slot; only task descriptors and small metric dicts cross
+    the process boundary. Workers are started with `spawn`, since forking a
+    process that has already initialized TensorFlow is unsafe.
+    """
+
+    def __init__(self, client_configs: List[Dict], weight_shapes: Sequence[Tuple[int, ...]],
+                 max_workers: Optional[int] = None):
+        self.client_configs = client_configs
+        self.num_clients = len(client_configs)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.global_weights = SharedWeights(weight_shapes, 1)
+        self.updates = SharedWeights(weight_shapes, self.num_clients)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        logger = logging.getLogger(__name__)
+        if self._pool is not None:
+            return
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.client_configs[0], self.global_weights.shapes, self.global_weights.name,
+                      self.updates.name, self.num_clients)
+        )
+        logger.info(f"Started client process pool with {self.max_workers} workers")
+
+    def train_round(self, global_weights: List, round_num: int,
+                    feature_scaler: Optional[Dict] = None) -> List[Optional[Dict[str, Any]]]:
+        """Train every client from `global_weights`; updates are left in their slots.
+
+        A client that failed has None in place of its metrics.
+        """
+        self.start()
+        self.global_weights.write(global_weights)
+        tasks = [(i, config, round_num, feature_scaler) for i, config in enumerate(self.client_configs)]
+        chunksize = max(1, self.num_clients // (self.max_workers * 4))
+        return list(self._pool.map(_train_client, tasks, chunksize=chunksize))
+
+    def update_weights(self, index: int) -> List[np.ndarray]:
+        """A copy of client `index`'s latest update.
+
+        Views into the slot would keep the shared block exported after `close`
+        if the coordinator still holds them, so the update is copied out.
+        """
+        return [view.copy() for view in self.updates.views(index)]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        self.global_weights.close()
+        self.updates.close()
@@ -0,0 +1,274 @@
+"""tabular_loader.py module."""
+
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from sklearn.preprocessing import StandardScaler
+
+class MemmapTable:
+    """Scaled float32 feature matrix (and optional target) backed by memory-mapped files.
+
+    The files are never modified after conversion: a scaler set with
+    `set_scaler` is applied to the rows as they are read.
+    """
+
+    def __init__(self, directory: str):
+        directory = Path(directory)
+        with open(directory / 'meta.json', 'r') as f:
+            self.meta = json.load(f)
+        self.directory = directory
+        self.num_rows = self.meta['num_rows']
+        self.feature_columns = self.meta['feature_columns']
+        self.target_column = self.meta['target_column']
+        shape = (self.num_rows, len(self.feature_columns))
+        self.features = np.memmap(directory / 'features.f32', dtype=np.float32, mode='r', shape=shape)
+        self._transform: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self.targets = None
+        if self.target_column is not None:
+            self.targets = np.memmap(directory / 'targets.f32', dtype=np.float32, mode='r',
+                                     shape=(self.num_rows, 1))
+
+    def scaler(self) -> StandardScaler:
+        """StandardScaler carrying the streaming statistics the features were scaled with"""
+        scaler = StandardScaler()
+        scaler.mean_ = np.asarray(self.meta['mean'])
+        scaler.var_ = np.asarray(self.meta['var'])
+        scaler.scale_ = np.asarray(self.meta['scale'])
+        scaler.n_samples_seen_ = self.num_rows
+        scaler.n_features_in_ = len(self.feature_columns)
+        return scaler
+
+    def raw_statistics(self, histogram_edges: Optional[List[float]] = None,
+                       chunk_size: int = 100000) -> Dict:
+        """Sufficient statistics of the unscaled features.
+
+        Count, sum and sum of squares come straight from the stored scaling
+        statistics; histograms need one streaming pass to undo the scaling.
+        """
+        mean = np.asarray(self.meta['mean'])
+        var = np.asarray(self.meta['var'])
+        stats = {
+            'count': self.num_rows,
+            'sum': (mean * self.num_rows).tolist(),
+            'sum_sq': ((var + mean ** 2) * self.num_rows).tolist()
+        }
+        if histogram_edges is not None:
+            scale = np.asarray(self.meta['scale'])
+            counts = np.zeros((len(self.feature_columns), len(histogram_edges) - 1), dtype=np.int64)
+            for start in range(0, self.num_rows, chunk_size):
+                raw = self.features[start:start + chunk_size] * scale + mean
+                for j in range(raw.shape[1]):
+                    counts[j] += np.histogram(raw[:, j], bins=histogram_edges)[0]
+            stats['histogram'] = {'edges': list(histogram_edges), 'counts': counts.tolist()}
+        return stats
+
+    def set_scaler(self, mean, scale):
+        """Standardize rows read from now on with a new (e.g. global) scaler instead of the local one."""
+        old_mean = np.asarray(self.meta['mean'])
+        old_scale = np.asarray(self.meta['scale'])
+        mean = np.asarray(mean, dtype=np.float64)
+        scale = np.asarray(scale, dtype=np.float64)
+        # (x - mean) / scale expressed on the stored, locally scaled values
+        self._transform = ((old_scale / scale).astype(np.float32), ((old_mean - mean) / scale).astype(np.float32))
+
+    def rows(self, start: int, stop: int) -> np.ndarray:
+        """Features of rows [start, stop), scaled with the current scaler"""
+        x = np.array(self.features[start:stop])
+        if self._transform is not None:
+            factor, offset = self._transform
+            x *= factor
+            x += offset
+        return x
+
+    def _blocks(self, block_size: int, rng: Optional[np.random.Generator]) -> Iterator[Tuple]:
+        starts = np.arange(0, self.num_rows, block_size)
+        if rng is not None:
+            rng.shuffle(starts)
+        for start in starts:
+            stop = min(start + block_size, self.num_rows)
+            # Contiguous reads keep page-cache access sequential; shuffle rows only within the block
+            x = self.rows(start, stop)
+            y = np.array(self.targets[start:stop]) if self.targets is not None else None
+            if rng is not None:
+                order = rng.permutation(len(x))
+                x = x[order]
+                y = y[order] if y is not None else None
+            yield x, y
+
+    def to_dataset(self, batch_size: int = 32, shuffle_block: int = 8192,
+                   prefetch_buffer: int = 2, seed: Optional[int] = None,
+                   shuffle: bool = True) -> tf.data.Dataset:
+        """Stream batches straight from the memory map without loading the table.
+
+        Shuffling is two-level: block order is permuted each epoch and rows are
+        permuted within each block, so memory use is one block, not the table.
+        """
+        num_features = len(self.feature_columns)
+        epoch_seeds = np.random.SeedSequence(seed)
+
+        def generate():
+            rng = np.random.default_rng(epoch_seeds.spawn(1)[0]) if shuffle else None
+            for x, y in self._blocks(shuffle_block, rng):
+                for start in range(0, len(x), batch_size):
+                    if y is None:
+                        yield x[start:start + batch_size]
+                    else:
+                        yield x[start:start + batch_size], y[start:start + batch_size]
+
+        x_spec = tf.TensorSpec(shape=(None, num_features), dtype=tf.float32)
+        if self.targets is None:
+            signature = x_spec
+        else:
+            signature = (x_spec, tf.TensorSpec(shape=(None, 1), dtype=tf.float32))
+        dataset = tf.data.Dataset.from_generator(generate, output_signature=signature)
+        return dataset.prefetch(prefetch_buffer)
+
+class OutOfCoreTabularLoader:
+    """Streams CSV/Parquet extracts into a scaled, memory-mapped float32 matrix.
+
+    Pass one reads fixed-size chunks, appends the raw float32 rows to disk and
+    accumulates scaling statistics with `StandardScaler.partial_fit`. Pass two
+    standardizes the memory map in place, chunk by chunk. Peak memory is one
+    chunk regardless of the extract size.
+
+    Each (extract, client) pair gets its own directory, built under a temporary
+    name and renamed into place once complete; a finished conversion of an
+    unchanged extract is reused instead of rewritten.
+    """
+
+    def __init__(self, config: Dict):
+        data_config = config.get('data', config)
+        self.chunk_size = data_config.get('chunk_size', 100000)
+        self.mmap_dir = data_config.get('mmap_dir', 'data/mmap')
+
+    def _iter_chunks(self, path: Path, columns: Optional[List[str]]) -> Iterator[pd.DataFrame]:
+        suffix = path.suffix.lower()
+        if suffix in ('.parquet', '.pq'):
+            try:
+                import pyarrow.parquet as pq
+            except ImportError as e:
+                raise ImportError("Reading Parquet extracts requires pyarrow") from e
+            parquet_file = pq.ParquetFile(path)
+            for batch in parquet_file.iter_batches(batch_size=self.chunk_size, columns=columns):
+                yield batch.to_pandas()
+        else:
+            yield from pd.read_csv(path, chunksize=self.chunk_size, usecols=columns)
+
+    def output_dir(self, path: str, client_id: Optional[str] = None) -> Path:
+        """Directory of the conversion of `path` for `client_id`"""
+        source = Path(path).resolve()
+        # Keyed on the full path, so extracts sharing a file name (a/q1.csv, b/q1.csv) don't collide
+        key = hashlib.sha1(f"{source}\0{client_id or ''}".encode('utf-8')).hexdigest()[:16]
+        return Path(self.mmap_dir) / f"{source.stem}-{key}"
+
+    @staticmethod
+    def _is_conversion(directory: Path, signature: Dict) -> bool:
+        try:
+            with open(directory / 'meta.json', 'r') as f:
+                return json.load(f).get('signature') == signature
+        except (OSError, ValueError):
+            return False
+
+    def _publish(self, tmp_dir: Path, output_dir: Path, signature: Dict):
+        try:
+            os.rename(tmp_dir, output_dir)
+            return
+        except OSError:
+            pass
+        if self._is_conversion(output_dir, signature):
+            # Another client or worker finished the same conversion first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        # A conversion of an older version of the extract: readers keep their mapping of the old files
+        stale = output_dir.with_name(f"{output_dir.name}.old-{os.getpid()}-{threading.get_ident()}")
+        os.rename(output_dir, stale)
+        os.rename(tmp_dir, output_dir)
+        shutil.rmtree(stale, ignore_errors=True)
+
+    def load(self, path: str, feature_columns: Optional[List[str]] = None,
+             target_column: Optional[str] = None, output_dir: Optional[str] = None,
+             client_id: Optional[str] = None) -> MemmapTable:
+        """Convert an extract into a memory-mapped table and return it opened read-only."""
+        logger = logging.getLogger(__name__)
+        path = Path(path)
+        output_dir = Path(output_dir) if output_dir else self.output_dir(str(path), client_id)
+        stat = path.stat()
+        signature = {
+            'source': str(path.resolve()),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'feature_columns': list(feature_columns) if feature_columns is not None else None,
+            'target_column': target_column
+        }
+        if self._is_conversion(output_dir, signature):
+            logger.info(f"Reusing the memory-mapped conversion of {path} in {output_dir}")
+            return MemmapTable(str(output_dir))
+
+        tmp_dir = output_dir.with_name(f"{output_dir.name}.tmp-{os.getpid()}-{threading.get_ident()}")
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            num_rows, feature_columns = self._convert(path, tmp_dir, feature_columns, target_column, signature)
+            self._publish(tmp_dir, output_dir, signature)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        logger.info(f"Loaded {num_rows} rows x {len(feature_columns)} features from {path} into {output_dir}")
+        return MemmapTable(str(output_dir))
+
+    def _convert(self, path: Path, output_dir: Path, feature_columns: Optional[List[str]],
+                 target_column: Optional[str], signature: Dict) -> Tuple[int, List[str]]:
+        columns = None
+        if feature_columns is not None:
+            columns = list(feature_columns) + ([target_column] if target_column else [])
+
+        scaler = StandardScaler()
+        num_rows = 0
+        with open(output_dir / 'features.f32', 'wb') as features_file, \
+                open(output_dir / 'targets.f32', 'wb') as targets_file:
+            for chunk in self._iter_chunks(path, columns):
+                if feature_columns is None:
+                    feature_columns = [c for c in chunk.select_dtypes('number').columns if c != target_column]
+                features = chunk[feature_columns].to_numpy(dtype=np.float32)
+                scaler.partial_fit(features)
+                features_file.write(np.ascontiguousarray(features).tobytes())
+                if target_column is not None:
+                    targets_file.write(chunk[target_column].to_numpy(dtype=np.float32).tobytes())
+                num_rows += len(features)
+
+        if num_rows == 0:
+            raise ValueError(f"No rows found in {path}")
+
+        # Standardize in place, one chunk at a time
+        features = np.memmap(output_dir / 'features.f32', dtype=np.float32, mode='r+',
+                             shape=(num_rows, len(feature_columns)))
+        mean = scaler.mean_.astype(np.float32)
+        scale = scaler.scale_.astype(np.float32)
+        for start in range(0, num_rows, self.chunk_size):
+            block = features[start:start + self.chunk_size]
+            block -= mean
+            block /= scale
+        features.flush()
+        del features
+
+        # Written last: a directory with a matching signature in meta.json is a finished conversion
+        with open(output_dir / 'meta.json', 'w') as f:
+            json.dump({
+                'source': str(path),
+                'num_rows': num_rows,
+                'feature_columns': list(feature_columns),
+                'target_column': target_column,
+                'mean': scaler.mean_.tolist(),
+                'var': scaler.var_.tolist(),
+                'scale': scaler.scale_.tolist(),
+                'signature': signature
+            }, f)
+        return num_rows, list(feature_columns)
@@ -0,0 +1,291 @@
+"""training.py module."""
+
+from typing import Dict, List, Optional, Union
+import tensorflow as tf
+import numpy as np
+import logging
+import time
+
+class TrainingEngine:
+    """Compiled local training loop, built once per client and reused every round.
+
+    For in-memory data a whole epoch (shuffle, batching and every train step)
+    runs inside one `tf.function`, so there is no per-batch Python or callback
+    overhead as with `model.fit`. `tf.data` pipelines are iterated from Python
+    and fed to the same compiled step. The step can additionally be
+    XLA-compiled. Global weights are assigned to the existing variables in
+    place, so new rounds reuse the traced graphs rather than retracing them.
+    """
+
+    def __init__(self, model: tf.keras.Model, config: Dict):
+        logger = logging.getLogger(__name__)
+        self.model = model
+        self.batch_size = config.get('batch_size', 32)
+        self.local_epochs = config.get('local_epochs', 3)
+        self.jit_compile = config.get('jit_compile', False)
+        self.optimizer = model.optimizer
+        self.loss_fn = tf.keras.losses.MeanSquaredError()
+        self._resident = None  # (X, y, X tensor, y tensor) of the last in-memory data trained on
+        self.steps_per_second: Optional[float] = None  # Measured training throughput (EMA)
+
+        # Create optimizer slots up front so no variables are created while tracing
+        self.optimizer.build(self.model.trainable_variables)
+
+        self._train_step = tf.function(self._step, jit_compile=self.jit_compile, reduce_retracing=True)
+        self._train_epoch = tf.function(self._epoch)
+        self._train_steps = tf.function(self._steps)
+        logger.debug(f"TrainingEngine initialized. XLA: {self.jit_compile}")
+
+    def _step(self, x, y):
+        with tf.GradientTape() as tape:
+            predictions = self.model(x, training=True)
+            loss = self.loss_fn(y, predictions)
+        gradients = tape.gradient(loss, self.model.trainable_variables)
+        self.optimizer.apply_gradients(zip(gradients, self.model.trainable_variables))
+        return loss
+
+    def _epoch(self, X, y, batch_size):
+        num_samples = tf.shape(X)[0]
+        order = tf.random.shuffle(tf.range(num_samples))
+        num_batches = (num_samples + batch_size - 1) // batch_size
+        total = tf.constant(0.0)
+        for i in tf.range(num_batches):
+            index = order[i * batch_size:tf.minimum((i + 1) * batch_size, num_samples)]
+            total += self._train_step(tf.gather(X, index), tf.gather(y, index))
+        return total / tf.cast(tf.maximum(num_batches, 1), tf.float32)
+
+    def _steps(self, X, y, batch_size, num_steps):
+        # Fixed number of steps over back-to-back reshuffled passes of the data
+        num_samples = tf.shape(X)[0]
+        passes = (num_steps * batch_size + num_samples - 1) // num_samples
+        order = tf.reshape(tf.argsort(tf.random.uniform((passes, num_samples)), axis=1), [-1])
+        total = tf.constant(0.0)
+        for i in tf.range(num_steps):
+            index = order[i * batch_size:(i + 1) * batch_size]
+            total += self._train_step(tf.gather(X, index), tf.gather(y, index))
+        return total / tf.cast(tf.maximum(num_steps, 1), tf.float32)
+
+    def steps_per_epoch(self, num_samples: int) -> int:
+        return -(-num_samples // self.batch_size)
+
+    def train_for(self, data: Union[tf.data.Dataset, tuple], time_budget: float,
+                  min_steps: int = 1, max_steps: Optional[int] = None,
+                  chunk_seconds: float = 0.25) -> Dict[str, List[float]]:
+        """Train for as many steps as fit in `time_budget` seconds.
+
+        Steps run in chunks sized from the measured throughput, which is
+        re-measured after every chunk (the first chunk also pays for tracing),
+        so the step count adapts to this machine and to current load. Returns
+        the history with the number of steps actually taken under 'steps'.
+        """
+        logger = logging.getLogger(__name__)
+        deadline = time.perf_counter() + time_budget
+        if isinstance(data, tf.data.Dataset):
+            batches = iter(data.repeat())
+            run_chunk = lambda n: float(sum(self._train_step(*next(batches)) for _ in range(n)) / n)
+        else:
+            X, y = self._resident_tensors(*data)
+            batch_size = tf.constant(self.batch_size)
+            run_chunk = lambda n: float(self._train_steps(X, y, batch_size, tf.constant(n)))
+
+        history = {'loss': [], 'steps': 0}
+        while max_steps is None or history['steps'] < max_steps:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 and history['steps'] >= min_steps:
+                break
+            rate = self.steps_per_second or 1.0 / chunk_seconds
+            chunk = max(1, int(min(chunk_seconds, max(remaining, 0.0)) * rate))
+            chunk = max(chunk, min_steps - history['steps'])
+            if max_steps is not None:
+                chunk = min(chunk, max_steps - history['steps'])
+
+            start = time.perf_counter()
+            history['loss'].append(run_chunk(chunk))
+            measured = chunk / max(time.perf_counter() - start, 1e-6)
+            self.steps_per_second = measured if self.steps_per_second is None else (
+                0.5 * self.steps_per_second + 0.5 * measured)
+            history['steps'] += chunk
+        logger.debug(f"Trained {history['steps']} steps in budget {time_budget:.2f}s "
+                     f"({self.steps_per_second:.1f} steps/s)")
+        return history
+
+    def train(self, data: Union[tf.data.Dataset, tuple], epochs: Optional[int] = None) -> Dict[str, List[float]]:
+        """Run local epochs over `data`, an (X, y) pair or a dataset of (x, y) batches"""
+        logger = logging.getLogger(__name__)
+        epochs = epochs or self.local_epochs
+
+        if isinstance(data, tf.data.Dataset):
+            run_epoch = lambda: self._dataset_epoch(data)
+        else:
+            X, y = self._resident_tensors(*data)
+            batch_size = tf.constant(self.batch_size)
+            run_epoch = lambda: self._train_epoch(X, y, batch_size)
+
+        history = {'loss': []}
+        for epoch in range(epochs):
+            loss = float(run_epoch())
+            history['loss'].append(loss)
+            logger.debug(f"Epoch {epoch + 1} - loss: {loss:.4f}")
+        return history
+
+    def _resident_tensors(self, X, y):
+        # Clients train on the same cached arrays every round; convert them only once
+        if self._resident is None or self._resident[0] is not X or self._resident[1] is not y:
+            X_tensor = tf.convert_to_tensor(np.asarray(X, dtype=np.float32))
+            y_tensor = tf.reshape(tf.convert_to_tensor(np.asarray(y, dtype=np.float32)),
+                                  (X_tensor.shape[0], -1))
+            self._resident = (X, y, X_tensor, y_tensor)
+        return self._resident[2], self._resident[3]
+
+    def _dataset_epoch(self, dataset: tf.data.Dataset) -> float:
+        total, batches = 0.0, 0
+        for x, y in dataset:
+            total += self._train_step(x, y)
+            batches += 1
+        return total / max(batches, 1)
+
+    def set_weights(self, weights: List):
+        """Assign weights to the existing variables without rebuilding the graph"""
+        for variable, value in zip(self.model.weights, weights):
+            variable.assign(value)
+
+    def tracing_count(self) -> int:
+        """How many times the epoch function has been traced (1 once warmed up)"""
+        return self._train_epoch.experimental_get_tracing_count()
+
+class StackedTrainer:
+    """Trains M same-architecture MLP clients at once with stacked weights.
+
+    Each Dense kernel is held as one (M, in, out) variable, so a training step
+    for all clients is a handful of batched matmuls instead of M separate
+    Keras steps. Clients keep independent data, shuffling, batch boundaries
+    and Adam state: the loss is the sum of per-client batch means, so every
+    client's gradient only depends on its own slice, and the optimizer update
+    is masked for clients that have run out of batches in the current epoch.
+    Results therefore match training each client on its own.
+    """
+
+    def __init__(self, num_clients: int, config: Dict, layer_sizes: List[int] = (32, 128, 64, 1)):
+        logger = logging.getLogger(__name__)
+        self.num_clients = num_clients
+        self.layer_sizes = list(layer_sizes)
+        self.batch_size = config.get('batch_size', 32)
+        self.local_epochs = config.get('local_epochs', 3)
+        self.learning_rate = config.get('learning_rate', 0.001)
+        self.beta_1, self.beta_2, self.epsilon = 0.9, 0.999, 1e-7
+        self.jit_compile = config.get('jit_compile', False)
+
+        self.variables: List[tf.Variable] = []
+        for fan_in, fan_out in zip(self.layer_sizes[:-1], self.layer_sizes[1:]):
+            self.variables.append(tf.Variable(tf.zeros((num_clients, fan_in, fan_out))))
+            self.variables.append(tf.Variable(tf.zeros((num_clients, fan_out))))
+        self._m = [tf.Variable(tf.zeros_like(v)) for v in self.variables]
+        self._v = [tf.Variable(tf.zeros_like(v)) for v in self.variables]
+        self._iterations = tf.Variable(tf.zeros(num_clients))
+        self._data = None  # (datasets, X, y, sizes) of the last stacked data
+
+        self._train_step = tf.function(self._step, jit_compile=self.jit_compile, reduce_retracing=True)
+        self._train_epoch = tf.function(self._epoch)
+        logger.debug(f"StackedTrainer initialized for {num_clients} clients, layers {self.layer_sizes}")
+
+    def _forward(self, x):
+        num_layers = len(self.variables) // 2
+        for i in range(num_layers):
+            x = tf.matmul(x, self.variables[2 * i]) + self.variables[2 * i + 1][:, None, :]
+            if i < num_layers - 1:
+                x = tf.nn.relu(x)
+        return x
+
+    def _step(self, x, y, mask):
+        # x: (M, B, in), y: (M, B, 1), mask: (M, B) marking real (non-padding) rows
+        counts = tf.reduce_sum(mask, axis=1)
+        active = tf.cast(counts > 0, tf.float32)
+        with tf.GradientTape() as tape:
+            squared_error = tf.reduce_mean(tf.square(self._forward(x) - y), axis=-1)
+            losses = tf.reduce_sum(squared_error * mask, axis=1) / tf.maximum(counts, 1.0)
+            total = tf.reduce_sum(losses)
+        gradients = tape.gradient(total, self.variables)
+
+        # Adam with per-client step counts; inactive clients are left untouched
+        self._iterations.assign_add(active)
+        t = tf.maximum(self._iterations, 1.0)
+        alpha = self.learning_rate * tf.sqrt(1.0 - self.beta_2 ** t) / (1.0 - self.beta_1 ** t)
+        for variable, gradient, m, v in zip(self.variables, gradients, self._m, self._v):
+            shape = [-1] + [1] * (len(variable.shape) - 1)
+            keep = tf.reshape(active, shape)
+            new_m = self.beta_1 * m + (1.0 - self.beta_1) * gradient
+            new_v = self.beta_2 * v + (1.0 - self.beta_2) * tf.square(gradient)
+            m.assign(keep * new_m + (1.0 - keep) * m)
+            v.assign(keep * new_v + (1.0 - keep) * v)
+            variable.assign_sub(keep * tf.reshape(alpha, shape) * m / (tf.sqrt(v) + self.epsilon))
+        return losses, active
+
+    def _epoch(self, X, y, sizes, batch_size):
+        num_clients, max_rows = tf.shape(X)[0], tf.shape(X)[1]
+        # Independent permutation per client with padding rows sorted to the end
+        keys = tf.random.uniform((num_clients, max_rows))
+        keys = tf.where(tf.range(max_rows)[None, :] < sizes[:, None], keys, 2.0)
+        order = tf.argsort(keys, axis=1)
+        num_batches = (tf.reduce_max(sizes) + batch_size - 1) // batch_size
+
+        total = tf.zeros((num_clients,))
+        batches = tf.zeros((num_clients,))
+        for i in tf.range(num_batches):
+            positions = i * batch_size + tf.range(batch_size)
+            index = tf.gather(order, tf.minimum(positions, max_rows - 1), axis=1)
+            mask = tf.cast(positions[None, :] < sizes[:, None], tf.float32)
+            losses, active = self._train_step(tf.gather(X, index, batch_dims=1),
+                                              tf.gather(y, index, batch_dims=1), mask)
+            total += losses
+            batches += active
+        return total / tf.maximum(batches, 1.0)
+
+    def _stack(self, datasets: List[tuple]):
+        # Pad every client to the largest dataset; padding rows are masked out of the loss
+        if self._data is not None and len(datasets) == len(self._data[0]) and \
+                all(a[0] is b[0] and a[1] is b[1] for a, b in zip(datasets, self._data[0])):
+            return self._data[1:]
+        sizes = np.array([len(X) for X, _ in datasets], dtype=np.int32)
+        max_rows = int(sizes.max())
+        X = np.zeros((len(datasets), max_rows, self.layer_sizes[0]), dtype=np.float32)
+        y = np.zeros((len(datasets), max_rows, 1), dtype=np.float32)
+        for i, (features, target) in enumerate(datasets):
+            X[i, :sizes[i]] = features
+            y[i, :sizes[i]] = np.reshape(target, (sizes[i], -1))
+        self._data = (list(datasets), tf.constant(X), tf.constant(y), tf.constant(sizes))
+        return self._data[1:]
+
+    def train(self, datasets: List[tuple], epochs: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Run local epochs for every client; `datasets[i]` is client i's (X, y)"""
+        logger = logging.getLogger(__name__)
+        if len(datasets) != self.num_clients:
+            raise ValueError(f"Expected {self.num_clients} datasets, got {len(datasets)}")
+        epochs = epochs or self.local_epochs
+        X, y, sizes = self._stack(datasets)
+        batch_size = tf.constant(self.batch_size)
+
+        losses = []
+        for epoch in range(epochs):
+            losses.append(self._train_epoch(X, y, sizes, batch_size).numpy())
+            logger.debug(f"Epoch {epoch + 1} - mean loss: {losses[-1].mean():.4f}")
+        return {'loss': np.stack(losses, axis=1)}  # (clients, epochs)
+
+    def set_weights(self, weights: List, client: Optional[int] = None):
+        """Load Keras-ordered weights into one client, or broadcast them to all"""
+        for variable, value in zip(self.variables, weights):
+            value = tf.convert_to_tensor(np.asarray(value, dtype=np.float32))
+            if client is None:
+                variable.assign(tf.broadcast_to(value, variable.shape))
+            else:
+                variable[client].assign(value)
+
+    def get_weights(self, client: int) -> List[np.ndarray]:
+        """Keras-ordered weights of one client"""
+        return [variable[client].numpy() for variable in self.variables]
+
+    def get_all_weights(self) -> List[List[np.ndarray]]:
+        stacked = [variable.numpy() for variable in self.variables]
+        return [[w[i] for w in stacked] for i in range(self.num_clients)]
+
+    def tracing_count(self) -> int:
+        return self._train_epoch.experimental_get_tracing_count()
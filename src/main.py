@@ -41,9 +41,31 @@ def load_config(config_path: str) -> dict:
 
 def main():
     parser = argparse.ArgumentParser(description='Federated Learning Demo')
-    parser.add_argument('--mode', choices=['server', 'client'], required=True)
-    parser.add_argument('--config', type=str, required=True)
+    parser.add_argument('--mode', choices=['server', 'client', 'simulate', 'ingest'], required=True)
+    parser.add_argument('--config', type=str,
+                        help='Server or client config (simulate: server config, default config/server_config.yaml)')
+    simulation = parser.add_argument_group('simulation')
+    simulation.add_argument('--client-config', type=str, default='config/client_config.yaml')
+    simulation.add_argument('--clients', type=int, default=2)
+    simulation.add_argument('--rounds', type=int, default=None)
+    simulation.add_argument('--workers', type=int, default=1, help='Clients training concurrently (threads/processes)')
+    simulation.add_argument('--backend', choices=['threads', 'stacked', 'processes'], default='threads',
+                            help='stacked: train all clients together with stacked weights; '
+                                 'processes: train clients on --workers processes')
+    simulation.add_argument('--latency-ms', type=float, default=0.0)
+    simulation.add_argument('--jitter-ms', type=float, default=0.0)
+    simulation.add_argument('--bandwidth-mbps', type=float, default=0.0, help='0 = unlimited')
+    simulation.add_argument('--account-network', action='store_true',
+                            help='Only account emulated network time instead of sleeping it')
+    ingestion = parser.add_argument_group('ingestion')
+    ingestion.add_argument('--inputs', nargs='+', default=[], help='.jsonl/.json/text files to index')
+    ingestion.add_argument('--index-dir', type=str, default=None, help='Defaults to rag.index_dir')
     args = parser.parse_args()
+    
+    if args.config is None:
+        if args.mode == 'client':
+            parser.error('--config is required in client mode')
+        args.config = 'config/server_config.yaml'
 
     config = load_config(args.config)
     setup_logging(config)
@@ -53,6 +75,31 @@ def main():
         coordinator = FederatedCoordinator(config)
         logger.info("Starting federated server...")
         coordinator.start()
+    elif args.mode == 'simulate':
+        from src.simulation import SimulationRunner
+        
+        network = None
+        if args.latency_ms or args.jitter_ms or args.bandwidth_mbps:
+            network = {'latency_ms': args.latency_ms, 'jitter_ms': args.jitter_ms,
+                       'bandwidth_mbps': args.bandwidth_mbps, 'realtime': not args.account_network}
+        rounds = args.rounds or config.get('federated', {}).get('rounds', 10)
+        
+        runner = SimulationRunner(config, load_config(args.client_config), args.clients, rounds,
+                                  network=network, max_workers=args.workers, backend=args.backend)
+        logger.info(f"Simulating {args.clients} clients for {rounds} rounds in-process...")
+        summary = runner.run()
+        logger.info(f"Simulation finished: {summary['completed_rounds']} rounds in {summary['wall_time']:.2f}s, "
+                    f"emulated network time {summary['network_seconds']:.2f}s")
+    elif args.mode == 'ingest':
+        from src.rag.ingestion import IngestionPipeline
+        
+        index_dir = args.index_dir or config['rag'].get('index_dir')
+        if not index_dir:
+            parser.error('--index-dir (or rag.index_dir) is required in ingest mode')
+        config['rag']['index_dir'] = index_dir
+        pipeline = IngestionPipeline(config)
+        pipeline.ingest_files(args.inputs)
+        pipeline.retriever.save(index_dir)
     else:
         # Extract client ID from config or use default
         client_id = config.get('client', {}).get('id', '1')
@@ -0,0 +1,91 @@
+"""Disk-backed embedding cache for the RAG retriever."""
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+import numpy as np
+
+class EmbeddingCache:
+    """SQLite file of embeddings keyed by (model name, max_length, text hash).
+
+    Texts are whitespace-normalized before hashing, so re-ingesting an
+    unchanged document or repeating a query finds its vector without running
+    the model. Every hit refreshes the entry's last-used time, and once the
+    cache holds more than `max_entries` vectors the least recently used are
+    evicted. `timeout` is how long a write waits for another connection's
+    lock, e.g. one per ingestion worker.
+    """
+
+    def __init__(self, path: str, model_name: str, max_length: int, max_entries: int = 1000000,
+                 timeout: float = 60.0):
+        self.path = path
+        self.namespace = f"{model_name}\0{max_length}\0".encode('utf-8')
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Every ingestion worker opens the same file, so writers wait on each other's locks
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings "
+                           "(key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_used INTEGER NOT NULL) WITHOUT ROWID")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+
+    def key(self, text: str) -> bytes:
+        normalized = re.sub(r'\s+', ' ', text).strip()
+        return hashlib.blake2b(self.namespace + normalized.encode('utf-8'), digest_size=16).digest()
+
+    def lookup(self, texts: List[str], out: np.ndarray) -> np.ndarray:
+        """Fill the rows of `out` whose text is cached; returns the boolean hit mask"""
+        keys = [self.key(text) for text in texts]
+        found = np.zeros(len(texts), dtype=bool)
+        rows: Dict[bytes, bytes] = {}
+        with self._lock:
+            # SQLite caps the number of bound parameters per statement
+            unique = list(set(keys))
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                rows.update(self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk))
+            if rows:
+                now = time.time_ns()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                       [(now, key) for key in rows])
+                self._conn.commit()
+
+        for i, key in enumerate(keys):
+            vector = rows.get(key)
+            if vector is not None:
+                out[i] = np.frombuffer(vector, dtype=np.float32)
+                found[i] = True
+        self.hits += int(found.sum())
+        self.misses += len(texts) - int(found.sum())
+        return found
+
+    def store(self, texts: List[str], vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        now = time.time_ns()
+        with self._lock:
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(self.key(text), vector.tobytes(), now) for text, vector in zip(texts, vectors)])
+            if cursor.rowcount > 0:
+                # Other workers write to the same file; the insert holds the write lock, so this count is exact
+                count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                if count > self.max_entries:
+                    self._conn.execute("DELETE FROM embeddings WHERE key IN "
+                                       "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                                       (count - self.max_entries,))
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
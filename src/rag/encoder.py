@@ -0,0 +1,72 @@
+"""Batched text encoder for the RAG retriever."""
+
+import logging
+import time
+from typing import Dict, List, Optional
+import numpy as np
+import torch
+
+class TextEncoder:
+    """CLS embeddings from a transformer model, computed in bounded-size batches.
+
+    Texts are tokenized a window of `bucket_window` batches at a time and
+    sorted by length inside the window, so each batch is padded only to its
+    own longest text. Embeddings are written straight into a preallocated
+    float32 matrix (or a .npy memmap with `output_path`) in input order, so
+    memory stays flat however many texts are encoded.
+    """
+
+    def __init__(self, tokenizer, model, config: Optional[Dict] = None):
+        config = config or {}
+        self.tokenizer = tokenizer
+        self.model = model.eval()
+        self.batch_size = config.get('batch_size', 32)
+        self.max_length = config.get('max_length', 512)
+        self.bucket_window = config.get('bucket_window', 64)
+        self.dimension = model.config.hidden_size
+        self.stats = {'texts': 0, 'tokens': 0, 'padded_tokens': 0, 'seconds': 0.0}
+
+    def encode(self, texts: List[str], output_path: Optional[str] = None) -> np.ndarray:
+        logger = logging.getLogger(__name__)
+        if output_path:
+            out = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.float32,
+                                            shape=(len(texts), self.dimension))
+        else:
+            out = np.empty((len(texts), self.dimension), dtype=np.float32)
+
+        start = time.perf_counter()
+        tokens = padded = 0
+        window = self.batch_size * self.bucket_window
+        for window_start in range(0, len(texts), window):
+            encoded = self.tokenizer(list(texts[window_start:window_start + window]), truncation=True,
+                                     max_length=self.max_length)['input_ids']
+            order = np.argsort([len(ids) for ids in encoded], kind='stable')
+            for batch_start in range(0, len(order), self.batch_size):
+                batch = order[batch_start:batch_start + self.batch_size]
+                inputs = self.tokenizer.pad({'input_ids': [encoded[i] for i in batch]}, return_tensors='pt')
+                with torch.inference_mode():
+                    hidden = self.model(**inputs).last_hidden_state
+                out[window_start + batch] = hidden[:, 0, :].float().numpy()
+                tokens += int(inputs['attention_mask'].sum())
+                padded += inputs['input_ids'].numel()
+
+        elapsed = time.perf_counter() - start
+        self.stats['texts'] += len(texts)
+        self.stats['tokens'] += tokens
+        self.stats['padded_tokens'] += padded
+        self.stats['seconds'] += elapsed
+        if len(texts) > self.batch_size:
+            logger.info(f"Encoded {len(texts)} texts in {elapsed:.2f}s "
+                        f"({len(texts) / max(elapsed, 1e-9):.1f} texts/s, "
+                        f"{tokens / max(elapsed, 1e-9):.0f} tokens/s, "
+                        f"{1 - tokens / max(padded, 1):.1%} padding)")
+        return out
+
+    def throughput(self) -> Dict[str, float]:
+        """Cumulative texts/s, tokens/s and padding share over every encode call"""
+        seconds = max(self.stats['seconds'], 1e-9)
+        return {
+            'texts_per_second': self.stats['texts'] / seconds,
+            'tokens_per_second': self.stats['tokens'] / seconds,
+            'padding_ratio': 1 - self.stats['tokens'] / max(self.stats['padded_tokens'], 1)
+        }
@@ -0,0 +1,147 @@
+"""FAISS index construction and evaluation for the retriever."""
+
+import logging
+import time
+from typing import Dict, List, Optional
+import faiss
+import numpy as np
+
+INDEX_TYPES = ('flat', 'ivf_flat', 'ivf_pq', 'hnsw')
+
+def index_factory_string(config: Dict) -> str:
+    """FAISS factory string for an `index` config section."""
+    index_type = config.get('type', 'flat')
+    if index_type == 'flat':
+        return 'Flat'
+    if index_type == 'ivf_flat':
+        return f"IVF{config.get('nlist', 1024)},Flat"
+    if index_type == 'ivf_pq':
+        # m sub-quantizers of nbits each: m * nbits / 8 bytes per vector instead of 4 * dimension
+        return f"IVF{config.get('nlist', 1024)},PQ{config.get('pq_m', 64)}x{config.get('pq_nbits', 8)}"
+    if index_type == 'hnsw':
+        return f"HNSW{config.get('hnsw_m', 32)}"
+    raise ValueError(f"Unknown index type: {index_type} (expected one of {INDEX_TYPES})")
+
+def build_index(dimension: int, config: Optional[Dict] = None) -> faiss.Index:
+    """Create an empty (possibly untrained) L2 index from an `index` config section."""
+    config = config or {}
+    index = faiss.index_factory(dimension, index_factory_string(config), faiss.METRIC_L2)
+    if config.get('type') == 'hnsw':
+        faiss.downcast_index(index).hnsw.efConstruction = config.get('ef_construction', 40)
+    apply_search_params(index, config)
+    return index
+
+def apply_search_params(index: faiss.Index, config: Dict):
+    """Set the query-time knobs (`nprobe` for IVF, `ef_search` for HNSW) on an index.
+
+    Works through wrappers such as IndexIDMap2; knobs the index doesn't have are ignored.
+    """
+    space = faiss.ParameterSpace()
+    for name, key in (('nprobe', 'nprobe'), ('efSearch', 'ef_search')):
+        if config.get(key) is None:
+            continue
+        try:
+            space.set_index_parameter(index, name, config[key])
+        except RuntimeError:
+            pass
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    """The index underneath IndexIDMap/IndexIDMap2 wrappers"""
+    while hasattr(index, 'id_map'):
+        index = faiss.downcast_index(index.index)
+    return index
+
+def search_parameters(index: faiss.Index, selector: Optional[faiss.IDSelector] = None) -> faiss.SearchParameters:
+    """Query-time parameters for `index` that restrict the search to `selector`.
+
+    IVF and HNSW indexes reject the generic SearchParameters class, and
+    parameters passed with a query replace the ones set on the index, so the
+    index's current `nprobe` / `efSearch` are carried over.
+    """
+    inner = base_index(index)
+    ivf = faiss.try_extract_index_ivf(inner)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=inner.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+def min_training_points(config: Dict) -> int:
+    """Vectors needed to train an index config: 39 per centroid (FAISS's minimum), capped at `train_sample`"""
+    index_type = config.get('type', 'flat')
+    if not index_type.startswith('ivf'):
+        return 0
+    centroids = config.get('nlist', 1024)
+    if index_type == 'ivf_pq':
+        centroids = max(centroids, 2 ** config.get('pq_nbits', 8))
+    return min(centroids * 39, config.get('train_sample', 100000))
+
+def train_index(index: faiss.Index, vectors: np.ndarray, sample_size: int = 100000, seed: int = 0):
+    """Train an untrained index on a random sample of `vectors`."""
+    if index.is_trained:
+        return
+    logger = logging.getLogger(__name__)
+    if len(vectors) > sample_size:
+        rng = np.random.default_rng(seed)
+        vectors = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+    start = time.perf_counter()
+    index.train(np.ascontiguousarray(vectors, dtype=np.float32))
+    logger.info(f"Trained index on {len(vectors)} vectors in {time.perf_counter() - start:.2f}s")
+
+def index_memory_bytes(index: faiss.Index) -> int:
+    """Serialized size of the index, a close proxy for its resident size"""
+    return int(faiss.serialize_index(index).size)
+
+def evaluate_index(index: faiss.Index, vectors: np.ndarray, queries: np.ndarray, k: int = 10,
+                   ground_truth: Optional[np.ndarray] = None) -> Dict[str, float]:
+    """Recall@k of `index` against exact flat search, plus per-query latency.
+
+    `index` must already hold `vectors` with ids 0..n-1 (as `index.add` assigns).
+    """
+    if ground_truth is None:
+        exact = faiss.IndexFlatL2(vectors.shape[1])
+        exact.add(vectors)
+        _, ground_truth = exact.search(queries, k)
+
+    start = time.perf_counter()
+    _, found = index.search(queries, k)
+    elapsed = time.perf_counter() - start
+
+    hits = sum(len(np.intersect1d(truth, result)) for truth, result in zip(ground_truth, found))
+    return {
+        'recall': hits / float(ground_truth.size),
+        'ms_per_query': 1000.0 * elapsed / len(queries),
+        'memory_bytes': index_memory_bytes(index)
+    }
+
+def recall_latency_sweep(vectors: np.ndarray, queries: np.ndarray, configs: List[Dict],
+                         k: int = 10, knob_values: Optional[Dict[str, List[int]]] = None) -> List[Dict]:
+    """Build each index config over `vectors` and measure recall@k vs latency.
+
+    `knob_values` maps `nprobe` / `ef_search` to the values to sweep for the
+    index types that have them, e.g. {'nprobe': [1, 8, 32], 'ef_search': [16, 64]}.
+    """
+    knob_values = knob_values or {'nprobe': [1, 4, 16, 64], 'ef_search': [16, 32, 64, 128]}
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, k)
+
+    results = []
+    for config in configs:
+        index = build_index(vectors.shape[1], config)
+        train_index(index, vectors, config.get('train_sample', 100000))
+        index.add(vectors)
+
+        index_type = config.get('type', 'flat')
+        knob = 'nprobe' if index_type.startswith('ivf') else 'ef_search' if index_type == 'hnsw' else None
+        for value in (knob_values.get(knob, [None]) if knob else [None]):
+            if knob:
+                apply_search_params(index, {knob: value})
+            result = evaluate_index(index, vectors, queries, k, ground_truth)
+            result.update(type=index_type, factory=index_factory_string(config))
+            if knob:
+                result[knob] = value
+            results.append(result)
+    return results
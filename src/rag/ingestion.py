@@ -0,0 +1,211 @@
+"""Streaming ingestion pipeline for the RAG corpus."""
+
+import copy
+import json
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List
+import numpy as np
+
+def read_documents(paths: Iterable[str]) -> Iterator[Dict]:
+    """Yield documents from .jsonl (one per line), .json (one or a list) and plain text files.
+
+    A plain text file is one document whose id is the file name.
+    """
+    for path in map(Path, paths):
+        if path.suffix == '.jsonl':
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        elif path.suffix == '.json':
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            yield from (data if isinstance(data, list) else [data])
+        else:
+            yield {'id': path.stem, 'text': path.read_text(encoding='utf-8'), 'source': str(path)}
+
+def chunk_document(document: Dict, chunk_size: int = 256, overlap: int = 32) -> List[Dict]:
+    """Split a document into passages of `chunk_size` words, consecutive passages sharing `overlap`.
+
+    A document that fits in one passage is returned unchanged; otherwise each
+    passage keeps the document's other fields, with id `<id>#<n>` and a
+    `parent_id` pointing back at the document.
+    """
+    words = document['text'].split()
+    if len(words) <= chunk_size:
+        return [document]
+    step = max(1, chunk_size - overlap)
+    passages = []
+    for number, start in enumerate(range(0, max(1, len(words) - overlap), step)):
+        passage = dict(document, text=' '.join(words[start:start + chunk_size]), chunk=number)
+        if document.get('id') is not None:
+            passage.update(id=f"{document['id']}#{number}", parent_id=document['id'])
+        passages.append(passage)
+    return passages
+
+def _embedding_worker(config: Dict, tasks, results, threads: int):
+    import torch
+    from .retriever import FinancialDataRetriever
+    torch.set_num_threads(threads)
+    try:
+        retriever = FinancialDataRetriever(config)
+        while True:
+            passages = tasks.get()
+            if passages is None:
+                break
+            results.put(('batch', passages, retriever.encode_text([p['text'] for p in passages])))
+    except Exception:
+        results.put(('error', traceback.format_exc()))
+    results.put(('done',))
+
+class IngestionPipeline:
+    """Streams documents into a FinancialDataRetriever.
+
+    A reader thread chunks documents into batches of passages and feeds a
+    pool of `workers` embedding processes, each with its own model (and the
+    shared embedding cache, if configured). The calling thread is the single
+    writer that upserts the encoded batches into the index and document
+    store. Both queues are bounded by `queue_size` batches, so a fast reader
+    blocks instead of buffering the corpus, and memory stays constant apart
+    from the index itself. With `workers: 0` batches are encoded in the
+    writer's process.
+    """
+
+    def __init__(self, config: Dict, retriever=None):
+        from .retriever import FinancialDataRetriever
+        settings = config['rag'].get('ingestion', {})
+        self.config = config
+        self.retriever = retriever or FinancialDataRetriever(config)
+        self.workers = settings.get('workers', multiprocessing.cpu_count())
+        self.batch_size = settings.get('batch_size', 64)
+        self.queue_size = settings.get('queue_size', 4)
+        self.chunk_size = settings.get('chunk_size', 256)
+        self.chunk_overlap = settings.get('chunk_overlap', 32)
+        self.threads_per_worker = settings.get('threads_per_worker', 1)
+        self._replaced = set()  # Documents whose previous passages this ingest has already removed
+
+    def _batches(self, documents: Iterable[Dict], stats: Dict[str, Any]) -> Iterator[List[Dict]]:
+        batch = []
+        for document in documents:
+            stats['documents'] += 1
+            for passage in chunk_document(document, self.chunk_size, self.chunk_overlap):
+                batch.append(passage)
+                if len(batch) == self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def _remove_previous(self, document_id: Any, run: int = 64):
+        """Delete the passages (or the unchunked document) indexed for `document_id` by an earlier ingest"""
+        self.retriever.delete([document_id])
+        # Passages are numbered from 0 without gaps, so stop at the first run that isn't fully indexed
+        start = 0
+        while self.retriever.delete(f"{document_id}#{n}" for n in range(start, start + run)) == run:
+            start += run
+
+    def _write(self, passages: List[Dict], embeddings: np.ndarray, stats: Dict[str, Any]):
+        # A re-ingested document may now have fewer passages, so everything indexed for it before goes first;
+        # its passages can span several batches, which may arrive in any order
+        for passage in passages:
+            document_id = passage.get('parent_id', passage.get('id'))
+            if document_id is not None and document_id not in self._replaced:
+                self._replaced.add(document_id)
+                self._remove_previous(document_id)
+        self.retriever.upsert(passages, embeddings)
+        stats['passages'] += len(passages)
+        stats['batches'] += 1
+
+    def ingest_files(self, paths: Iterable[str]) -> Dict[str, Any]:
+        return self.ingest(read_documents(paths))
+
+    def ingest(self, documents: Iterable[Dict]) -> Dict[str, Any]:
+        """Chunk, encode and index `documents`; returns counts and throughput"""
+        logger = logging.getLogger(__name__)
+        stats = {'documents': 0, 'passages': 0, 'batches': 0}
+        self._replaced = set()
+        start = time.perf_counter()
+        if self.workers <= 0:
+            for batch in self._batches(documents, stats):
+                self._write(batch, self.retriever.encode_text([p['text'] for p in batch]), stats)
+        else:
+            self._run_workers(documents, stats)
+
+        stats['seconds'] = time.perf_counter() - start
+        stats['passages_per_second'] = stats['passages'] / max(stats['seconds'], 1e-9)
+        logger.info(f"Ingested {stats['documents']} documents as {stats['passages']} passages in "
+                    f"{stats['seconds']:.2f}s ({stats['passages_per_second']:.1f} passages/s, "
+                    f"{max(self.workers, 0)} embedding workers)")
+        return stats
+
+    def _run_workers(self, documents: Iterable[Dict], stats: Dict[str, Any]):
+        context = multiprocessing.get_context('spawn')
+        tasks = context.Queue(self.queue_size)
+        results = context.Queue(self.queue_size)
+        # Workers only encode: they never load or write the index
+        worker_config = copy.deepcopy(self.config)
+        worker_config['rag'].update(retriever='faiss', index_dir=None)
+        processes = [context.Process(target=_embedding_worker, daemon=True,
+                                     args=(worker_config, tasks, results, self.threads_per_worker))
+                     for _ in range(self.workers)]
+        for process in processes:
+            process.start()
+
+        stop = threading.Event()
+        reader_errors = []
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    tasks.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def read():
+            try:
+                for batch in self._batches(documents, stats):
+                    if not put(batch):
+                        return
+            except Exception as e:
+                reader_errors.append(e)
+            finally:
+                for _ in processes:
+                    put(None)
+
+        reader = threading.Thread(target=read, name='ingestion-reader', daemon=True)
+        reader.start()
+        try:
+            finished = 0
+            while finished < len(processes):
+                try:
+                    message = results.get(timeout=1.0)
+                except queue.Empty:
+                    # A worker that was killed (e.g. out of memory) never reports back
+                    crashed = any(p.exitcode not in (None, 0) for p in processes)
+                    if crashed or not any(p.is_alive() for p in processes):
+                        raise RuntimeError(f"Embedding worker exited unexpectedly (exit codes "
+                                           f"{[p.exitcode for p in processes]})") from None
+                    continue
+                if message[0] == 'batch':
+                    self._write(message[1], message[2], stats)
+                elif message[0] == 'error':
+                    raise RuntimeError(f"Embedding worker failed:\n{message[1]}")
+                else:
+                    finished += 1
+        finally:
+            stop.set()
+            reader.join()
+            for process in processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+        if reader_errors:
+            raise reader_errors[0]
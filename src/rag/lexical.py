@@ -0,0 +1,202 @@
+"""BM25 lexical index for the RAG retriever."""
+
+import json
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-/:_][a-z0-9]+)*")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens for BM25.
+
+    Compound tokens such as tickers (BRK.B) and account codes (GL-4100-20)
+    are kept whole, so an exact code matches exactly, and are also split into
+    their parts.
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(re.findall(r'[a-z0-9]+', token))
+    return tokens
+
+class _Segment:
+    """Postings of a batch of documents in CSR layout.
+
+    `docs[indptr[t]:indptr[t + 1]]` are the segment-local documents containing
+    term `t` and `tfs` the matching term frequencies; terms added to the
+    vocabulary after the segment was built simply have no postings in it.
+    """
+
+    def __init__(self, labels: np.ndarray, lengths: np.ndarray, indptr: np.ndarray,
+                 docs: np.ndarray, tfs: np.ndarray):
+        self.labels = labels
+        self.lengths = lengths
+        self.indptr = indptr
+        self.docs = docs
+        self.tfs = tfs
+        self.alive = np.ones(len(labels), dtype=bool)
+
+    @classmethod
+    def build(cls, labels: np.ndarray, lengths: np.ndarray, terms: np.ndarray, docs: np.ndarray,
+              tfs: np.ndarray, num_terms: int) -> '_Segment':
+        """Segment from (term, doc, tf) triples; repeated (term, doc) pairs are summed"""
+        n = max(len(labels), 1)
+        keys, inverse = np.unique(terms.astype(np.int64) * n + docs, return_inverse=True)
+        counts = np.bincount(inverse, weights=tfs).astype(np.int32)
+        indptr = np.zeros(num_terms + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys // n, minlength=num_terms), out=indptr[1:])
+        return cls(np.asarray(labels, dtype=np.int64), np.asarray(lengths, dtype=np.float32),
+                   indptr, (keys % n).astype(np.int32), counts)
+
+    def posting_terms(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self.indptr) - 1), np.diff(self.indptr))
+
+class BM25Index:
+    """Inverted index with Okapi BM25 scoring, held in numpy arrays.
+
+    Each `add` builds an immutable segment; deletions clear a per-document
+    alive flag and adjust the collection statistics. Once there are more
+    than `max_segments` segments they are merged into one, dropping deleted
+    documents. Documents are identified by the retriever's int64 labels.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, max_segments: int = 8):
+        self.k1 = k1
+        self.b = b
+        self.max_segments = max_segments
+        self.vocabulary: Dict[str, int] = {}
+        self.segments: List[_Segment] = []
+        self._df = np.zeros(0, dtype=np.int64)
+        self.num_documents = 0
+        self.total_length = 0.0
+
+    def _term_ids(self, tokens: Iterable[str], grow: bool) -> np.ndarray:
+        ids = []
+        for token in tokens:
+            term = self.vocabulary.get(token)
+            if term is None and grow:
+                term = self.vocabulary[token] = len(self.vocabulary)
+            if term is not None:
+                ids.append(term)
+        return np.asarray(ids, dtype=np.int64)
+
+    def add(self, labels: Iterable[int], texts: Iterable[str]):
+        token_ids = [self._term_ids(tokenize(text), grow=True) for text in texts]
+        if not token_ids:
+            return
+        lengths = np.array([len(ids) for ids in token_ids], dtype=np.float32)
+        terms = np.concatenate(token_ids)
+        docs = np.repeat(np.arange(len(token_ids)), lengths.astype(np.int64))
+        segment = _Segment.build(np.fromiter(labels, dtype=np.int64), lengths, terms, docs,
+                                 np.ones(len(terms)), len(self.vocabulary))
+        self.segments.append(segment)
+        self._grow_df()
+        self._df += np.bincount(segment.posting_terms(), minlength=len(self._df))
+        self.num_documents += len(token_ids)
+        self.total_length += float(lengths.sum())
+        if len(self.segments) > self.max_segments:
+            self.merge()
+
+    def _grow_df(self):
+        if len(self._df) < len(self.vocabulary):
+            self._df = np.concatenate([self._df, np.zeros(len(self.vocabulary) - len(self._df), dtype=np.int64)])
+
+    def remove(self, labels: Iterable[int]) -> int:
+        labels = np.fromiter(labels, dtype=np.int64)
+        removed = 0
+        for segment in self.segments:
+            dead = np.isin(segment.labels, labels) & segment.alive
+            if not dead.any():
+                continue
+            hit = dead[segment.docs]
+            self._df -= np.bincount(segment.posting_terms()[hit], minlength=len(self._df))
+            segment.alive = segment.alive & ~dead
+            self.num_documents -= int(dead.sum())
+            self.total_length -= float(segment.lengths[dead].sum())
+            removed += int(dead.sum())
+        return removed
+
+    def merge(self):
+        """Merge all segments into one, dropping deleted documents"""
+        if len(self.segments) <= 1 and all(segment.alive.all() for segment in self.segments):
+            return
+        labels, lengths, terms, docs, tfs = [], [], [], [], []
+        offset = 0
+        for segment in self.segments:
+            # Segment-local document numbers of the live documents in the merged segment
+            remap = np.cumsum(segment.alive) - 1 + offset
+            keep = segment.alive[segment.docs]
+            labels.append(segment.labels[segment.alive])
+            lengths.append(segment.lengths[segment.alive])
+            terms.append(segment.posting_terms()[keep])
+            docs.append(remap[segment.docs[keep]])
+            tfs.append(segment.tfs[keep])
+            offset += int(segment.alive.sum())
+        merged = _Segment.build(np.concatenate(labels), np.concatenate(lengths), np.concatenate(terms),
+                                np.concatenate(docs), np.concatenate(tfs), len(self.vocabulary))
+        self.segments = [merged]
+
+    def search(self, query: str, k: int, allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Labels and BM25 scores of the top `k` documents matching any query term.
+
+        `allowed` (sorted labels) restricts the search to those documents.
+        """
+        terms = np.unique(self._term_ids(tokenize(query), grow=False))
+        if not len(terms) or not self.num_documents:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        df = self._df[terms]
+        idf = np.log(1 + (self.num_documents - df + 0.5) / (df + 0.5))
+        # Documents without a single token make the average length zero
+        avgdl = self.total_length / self.num_documents or 1.0
+
+        labels, scores = [], []
+        for segment in self.segments:
+            segment_scores = np.zeros(len(segment.labels), dtype=np.float32)
+            norm = self.k1 * (1 - self.b + self.b * segment.lengths / avgdl)
+            for term, weight in zip(terms, idf):
+                if term + 1 >= len(segment.indptr):
+                    continue
+                start, end = segment.indptr[term], segment.indptr[term + 1]
+                docs, tf = segment.docs[start:end], segment.tfs[start:end]
+                segment_scores[docs] += weight * tf * (self.k1 + 1) / (tf + norm[docs])
+            candidates = segment.alive if allowed is None else segment.alive & np.isin(segment.labels, allowed)
+            matched = np.flatnonzero((segment_scores > 0) & candidates)
+            if len(matched) > k:
+                matched = matched[np.argpartition(-segment_scores[matched], k - 1)[:k]]
+            labels.append(segment.labels[matched])
+            scores.append(segment_scores[matched])
+        labels, scores = np.concatenate(labels), np.concatenate(scores)
+        order = np.argsort(-scores, kind='stable')[:k]
+        return labels[order], scores[order]
+
+    def save(self, directory: str):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.merge()
+        segment = self.segments[0] if self.segments else _Segment.build(
+            np.empty(0, dtype=np.int64), np.empty(0), np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.int64), np.empty(0), len(self.vocabulary))
+        for name in ('labels', 'lengths', 'indptr', 'docs', 'tfs'):
+            np.save(directory / f'{name}.npy', getattr(segment, name))
+        with open(directory / 'vocabulary.json', 'w', encoding='utf-8') as f:
+            json.dump({'k1': self.k1, 'b': self.b, 'terms': sorted(self.vocabulary, key=self.vocabulary.get)}, f)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True, max_segments: Optional[int] = None) -> 'BM25Index':
+        directory = Path(directory)
+        with open(directory / 'vocabulary.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        index = cls(meta['k1'], meta['b'], max_segments or 8)
+        index.vocabulary = {term: i for i, term in enumerate(meta['terms'])}
+        mode = 'r' if mmap else None
+        segment = _Segment(*(np.load(directory / f'{name}.npy', mmap_mode=mode)
+                             for name in ('labels', 'lengths', 'indptr', 'docs', 'tfs')))
+        if len(segment.labels):
+            index.segments = [segment]
+        index._df = np.bincount(segment.posting_terms(), minlength=len(index.vocabulary)).astype(np.int64)
+        index.num_documents = len(segment.labels)
+        index.total_length = float(np.sum(segment.lengths))
+        return index
@@ -0,0 +1,187 @@
+"""Metadata indexes for filtered retrieval."""
+
+import datetime
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+import numpy as np
+
+FIELD_TYPES = ('keyword', 'date', 'number')
+
+def _values(document: Dict, field: str) -> List[Any]:
+    value = document.get(field)
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple, set)) else [value]
+
+class MetadataIndex:
+    """Per-field indexes from document metadata to retriever labels.
+
+    A `keyword` field maps each value to a sorted array of labels; `date`
+    and `number` fields keep their values sorted alongside the labels, so a
+    range is two binary searches. `select` turns a filter into the sorted
+    array of matching labels, which the retriever hands to the search itself.
+    Additions are buffered and merged into the arrays on the next query.
+    """
+
+    def __init__(self, fields: Optional[Dict[str, str]] = None):
+        self.fields = dict(fields or {})
+        for field, field_type in self.fields.items():
+            if field_type not in FIELD_TYPES:
+                raise ValueError(f"Unknown type {field_type!r} for metadata field {field!r} "
+                                 f"(expected one of {FIELD_TYPES})")
+        self._postings: Dict[str, Dict[str, np.ndarray]] = {f: {} for f, t in self.fields.items() if t == 'keyword'}
+        self._pending_postings: Dict[str, Dict[str, List[np.ndarray]]] = {f: {} for f in self._postings}
+        self._ranges: Dict[str, Dict[str, Any]] = {
+            f: {'values': np.empty(0), 'labels': np.empty(0, dtype=np.int64), 'pending': [], 'removed': set()}
+            for f, t in self.fields.items() if t != 'keyword'
+        }
+
+    def _number(self, field: str, value: Any) -> float:
+        try:
+            if self.fields[field] == 'date':
+                if isinstance(value, (datetime.date, datetime.datetime)):
+                    return float(value.toordinal())
+                return float(datetime.date.fromisoformat(str(value)[:10]).toordinal())
+            return float(value)
+        except (TypeError, ValueError):
+            expected = 'an ISO date (YYYY-MM-DD)' if self.fields[field] == 'date' else 'a number'
+            raise ValueError(f"Metadata field {field!r} must be {expected}, got {value!r}") from None
+
+    def validate(self, documents: Iterable[Dict]):
+        """Raise ValueError if any document has a date or number field that can't be indexed"""
+        for document in documents:
+            for field in self._ranges:
+                for value in _values(document, field):
+                    self._number(field, value)
+
+    def add(self, labels: Iterable[int], documents: Iterable[Dict]):
+        grouped: Dict[str, Dict[str, List[int]]] = {field: {} for field in self._postings}
+        ranges: Dict[str, List] = {field: [] for field in self._ranges}
+        for label, document in zip(labels, documents):
+            for field in self._postings:
+                for value in _values(document, field):
+                    grouped[field].setdefault(str(value), []).append(label)
+            for field in self._ranges:
+                ranges[field].extend((self._number(field, value), label) for value in _values(document, field))
+        for field, values in grouped.items():
+            for value, value_labels in values.items():
+                self._pending_postings[field].setdefault(value, []).append(np.asarray(value_labels, dtype=np.int64))
+        for field, pairs in ranges.items():
+            self._ranges[field]['pending'].extend(pairs)
+
+    def remove(self, labels: Iterable[int], documents: Iterable[Dict]):
+        grouped: Dict[str, Dict[str, List[int]]] = {field: {} for field in self._postings}
+        for label, document in zip(labels, documents):
+            for field in self._postings:
+                for value in _values(document, field):
+                    grouped[field].setdefault(str(value), []).append(label)
+            for field in self._ranges:
+                if _values(document, field):
+                    self._ranges[field]['removed'].add(label)
+        for field, values in grouped.items():
+            for value, value_labels in values.items():
+                remaining = np.setdiff1d(self._keyword_labels(field, value), value_labels, assume_unique=True)
+                if len(remaining):
+                    self._postings[field][value] = remaining
+                else:
+                    self._postings[field].pop(value, None)
+
+    def _keyword_labels(self, field: str, value: str) -> np.ndarray:
+        pending = self._pending_postings[field].pop(value, None)
+        labels = self._postings[field].get(value)
+        if pending:
+            # New labels are always larger than existing ones, so appending keeps the array sorted
+            labels = self._postings[field][value] = np.concatenate(([] if labels is None else [labels]) + pending)
+        return labels if labels is not None else np.empty(0, dtype=np.int64)
+
+    def _range(self, field: str) -> Dict[str, Any]:
+        state = self._ranges[field]
+        if state['pending'] or state['removed']:
+            values, labels = state['values'], state['labels']
+            if state['pending']:
+                pending = np.asarray(state['pending'])
+                values = np.concatenate([values, pending[:, 0]])
+                labels = np.concatenate([labels, pending[:, 1].astype(np.int64)])
+            if state['removed']:
+                keep = ~np.isin(labels, np.fromiter(state['removed'], dtype=np.int64))
+                values, labels = values[keep], labels[keep]
+            order = np.argsort(values, kind='stable')
+            state.update(values=values[order], labels=labels[order], pending=[], removed=set())
+        return state
+
+    def select(self, filters: Dict[str, Any]) -> np.ndarray:
+        """Sorted labels of the documents matching every filter.
+
+        A keyword filter is a value or a list of accepted values; a date or
+        number filter is a value or a dict of `gte` / `gt` / `lte` / `lt` bounds.
+        """
+        result = None
+        for field, condition in filters.items():
+            if field not in self.fields:
+                raise ValueError(f"Metadata field {field!r} is not indexed (see rag.metadata_fields)")
+            if self.fields[field] == 'keyword':
+                accepted = condition if isinstance(condition, (list, tuple, set)) else [condition]
+                arrays = [self._keyword_labels(field, str(value)) for value in accepted]
+                labels = np.unique(np.concatenate(arrays)) if len(arrays) != 1 else arrays[0]
+            else:
+                labels = self._range_labels(field, condition)
+            result = labels if result is None else np.intersect1d(result, labels, assume_unique=True)
+            if not len(result):
+                break
+        return result if result is not None else np.empty(0, dtype=np.int64)
+
+    def _range_labels(self, field: str, condition: Any) -> np.ndarray:
+        if not isinstance(condition, dict):
+            condition = {'gte': condition, 'lte': condition}
+        unknown = set(condition) - {'gte', 'gt', 'lte', 'lt'}
+        if unknown:
+            raise ValueError(f"Unknown range bounds for {field!r}: {sorted(unknown)}")
+        state = self._range(field)
+        values = state['values']
+        start, end = 0, len(values)
+        if 'gte' in condition:
+            start = max(start, int(np.searchsorted(values, self._number(field, condition['gte']), 'left')))
+        if 'gt' in condition:
+            start = max(start, int(np.searchsorted(values, self._number(field, condition['gt']), 'right')))
+        if 'lte' in condition:
+            end = min(end, int(np.searchsorted(values, self._number(field, condition['lte']), 'right')))
+        if 'lt' in condition:
+            end = min(end, int(np.searchsorted(values, self._number(field, condition['lt']), 'left')))
+        return np.unique(state['labels'][start:end]) if end > start else np.empty(0, dtype=np.int64)
+
+    def save(self, directory: str):
+        directory = Path(directory)
+        arrays, keyword_values = {}, {}
+        for field in self._postings:
+            values = sorted(set(self._postings[field]) | set(self._pending_postings[field]))
+            postings = [self._keyword_labels(field, value) for value in values]
+            keyword_values[field] = values
+            arrays[f'{field}.labels'] = np.concatenate(postings) if postings else np.empty(0, dtype=np.int64)
+            arrays[f'{field}.offsets'] = np.cumsum([0] + [len(p) for p in postings])
+        for field in self._ranges:
+            state = self._range(field)
+            arrays[f'{field}.values'] = state['values']
+            arrays[f'{field}.labels'] = state['labels']
+        np.savez(directory / 'metadata.npz', **arrays)
+        with open(directory / 'metadata.json', 'w', encoding='utf-8') as f:
+            json.dump({'fields': self.fields, 'keyword_values': keyword_values}, f)
+
+    @classmethod
+    def load(cls, directory: str, fields: Dict[str, str]) -> Optional['MetadataIndex']:
+        """The saved index, or None if there is none for exactly these fields"""
+        directory = Path(directory)
+        if not (directory / 'metadata.json').exists():
+            return None
+        with open(directory / 'metadata.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta['fields'] != dict(fields):
+            return None
+        index = cls(fields)
+        with np.load(directory / 'metadata.npz') as arrays:
+            for field, values in meta['keyword_values'].items():
+                labels, offsets = arrays[f'{field}.labels'], arrays[f'{field}.offsets']
+                index._postings[field] = {value: labels[offsets[i]:offsets[i + 1]] for i, value in enumerate(values)}
+            for field in index._ranges:
+                index._ranges[field].update(values=arrays[f'{field}.values'], labels=arrays[f'{field}.labels'])
+        return index
@@ -1,11 +1,21 @@
 """Retrieval component for the RAG system."""
 
 import faiss
+import json
+import logging
+import threading
 import numpy as np
-from typing import List, Dict, Tuple
-from elasticsearch import Elasticsearch
+from pathlib import Path
+from typing import Any, Iterable, Iterator, List, Dict, Optional, Tuple
+from elasticsearch import Elasticsearch, helpers
 from transformers import AutoTokenizer, AutoModel
-import torch
+from .embedding_cache import EmbeddingCache
+from .encoder import TextEncoder
+from .lexical import BM25Index
+from .metadata import MetadataIndex
+from .indexes import (apply_search_params, base_index, build_index, min_training_points, search_parameters,
+                      train_index)
+from .store import DocumentStore, document_key
 
 class FinancialDataRetriever:
     def __init__(self, config: Dict):
@@ -13,72 +23,532 @@ class FinancialDataRetriever:
         self.retriever_type = config['rag']['retriever']
         self.max_documents = config['rag']['max_documents']
         self.similarity_threshold = config['rag']['similarity_threshold']
+        self.model_name = config['rag'].get('embedding_model', 'bert-base-uncased')
+        self.index_dir = config['rag'].get('index_dir')
         
-        # Initialize FAISS index
+        # Initialize FAISS index (exact flat search unless rag.index selects IVF/PQ/HNSW)
         self.dimension = 768  # BERT embedding dimension
-        self.index = faiss.IndexFlatL2(self.dimension)
+        self.index_config = config['rag'].get('index', {})
+        self.index = self._new_index()
+        self.documents = DocumentStore()
         
-        # Initialize transformer model for embeddings
-        self.tokenizer = AutoTokenizer.from_pretrained('bert-base-uncased')
-        self.model = AutoModel.from_pretrained('bert-base-uncased')
+        # Vectors are stored under internal labels; a document keeps its `id` while
+        # an upsert gives it a new label, so replaced vectors are tombstoned like deletions
+        self._next_label = 0
+        self._labels: Optional[Dict[Any, int]] = None  # Document id -> label, built on first use
+        self._deleted = set()  # Labels of deleted vectors still in the index
+        self._selector = None
+        self._index_mmapped = False
+        self._lock = threading.RLock()
+        self._compaction: Optional[threading.Thread] = None
+        self._compact_lock = threading.Lock()  # One compaction at a time
+        self._replay: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None  # Vectors added during a compaction
+        self.compaction_threshold = config['rag'].get('compaction_threshold', 0.1)
+        
+        # bm25 and hybrid keep a local lexical index; hybrid fuses it with the vectors
+        self.dense = self.retriever_type in ("faiss", "hybrid")
+        lexical_config = config['rag'].get('lexical', {})
+        self.lexical = BM25Index(
+            lexical_config.get('k1', 1.2), lexical_config.get('b', 0.75), lexical_config.get('max_segments', 8)
+        ) if self.retriever_type in ("bm25", "hybrid") else None
+        self.fusion_candidates = lexical_config.get('fusion_candidates', 50)
+        self.rrf_k = lexical_config.get('rrf_k', 60)
+        # BM25 scores are unbounded, so similarity_threshold (a 0-1 vector score) doesn't apply to them
+        self.lexical_min_score = lexical_config.get('min_score', 0.0)
+        
+        # Attribute indexes for filtered retrieval, e.g. {'bank': 'keyword', 'filing_date': 'date'}
+        self.metadata = MetadataIndex(config['rag'].get('metadata_fields'))
+        
+        # The transformer model is loaded on first use, so a retriever restored
+        # from disk (or fed precomputed embeddings) starts without it
+        self._tokenizer = None
+        self._model = None
+        self._encoder = None
+        self.encoder_config = config['rag'].get('encoder', {})
+        cache_config = config['rag'].get('embedding_cache') or {}
+        self.embedding_cache = EmbeddingCache(
+            cache_config['path'], self.model_name, self.encoder_config.get('max_length', 512),
+            cache_config.get('max_entries', 1000000), cache_config.get('timeout', 60.0)
+        ) if cache_config.get('path') else None
         
         # Initialize Elasticsearch if needed
         if self.retriever_type == "elasticsearch":
-            self.es = Elasticsearch()
+            es_config = config['rag'].get('elasticsearch', {})
+            self.es_index = es_config.get('index', 'financial_data')
+            self.bulk_chunk_size = es_config.get('bulk_chunk_size', 500)
+            self.bulk_threads = es_config.get('bulk_threads', 4)
+            self.msearch_batch_size = es_config.get('msearch_batch_size', 100)
+            self.es_refresh = es_config.get('refresh', False)
+            self.es = Elasticsearch(es_config.get('hosts', ['http://localhost:9200']),
+                                    request_timeout=es_config.get('request_timeout', 30))
+        
+        # Restore a previously saved index
+        if self.index_dir and (Path(self.index_dir) / 'index.faiss').exists():
+            self.load(self.index_dir, mmap=config['rag'].get('mmap_index', True))
+    
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        return self._tokenizer
+    
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = AutoModel.from_pretrained(self.model_name)
+        return self._model
+    
+    @property
+    def encoder(self) -> TextEncoder:
+        if self._encoder is None:
+            self._encoder = TextEncoder(self.tokenizer, self.model, self.encoder_config)
+        return self._encoder
+    
+    def save(self, directory: str = None):
+        """Persist the vector index and the document store to `directory`."""
+        directory = Path(directory or self.index_dir)
+        directory.mkdir(parents=True, exist_ok=True)
+        # Deleted vectors are dropped first so the saved index and documents agree
+        self.wait_for_compaction()
+        self.compact()
+        with self._lock:
+            faiss.write_index(self.index, str(directory / 'index.faiss.tmp'))
+            (directory / 'index.faiss.tmp').replace(directory / 'index.faiss')
+            self.documents.save(str(directory))
+            if self.lexical is not None:
+                self.lexical.save(str(directory / 'lexical'))
+            if self.metadata.fields:
+                self.metadata.save(str(directory))
+            with open(directory / 'meta.json', 'w') as f:
+                json.dump({
+                    'embedding_model': self.model_name,
+                    'dimension': self.dimension,
+                    'num_vectors': int(self.index.ntotal),
+                    'num_documents': len(self.documents),
+                    'next_label': self._next_label
+                }, f)
+        logging.getLogger(__name__).info(f"Saved {self.index.ntotal} vectors to {directory}")
+    
+    def load(self, directory: str = None, mmap: bool = True):
+        """Restore a saved index and document store.
+        
+        With `mmap` the index codes and the documents are memory-mapped instead
+        of read into memory: startup no longer scales with corpus size and the
+        pages are shared by every retriever process on the host.
+        """
+        directory = Path(directory or self.index_dir)
+        with open(directory / 'meta.json', 'r') as f:
+            meta = json.load(f)
+        if meta['embedding_model'] != self.model_name:
+            raise ValueError(f"Index at {directory} was built with {meta['embedding_model']}, "
+                             f"not {self.model_name}")
+        
+        # IO_FLAG_MMAP covers IVF lists; flat codes need IO_FLAG_MMAP_IFC to stay on disk
+        flags = faiss.IO_FLAG_MMAP | getattr(faiss, 'IO_FLAG_MMAP_IFC', 0) if mmap else 0
+        index = faiss.read_index(str(directory / 'index.faiss'), flags)
+        if not hasattr(index, 'id_map'):
+            raise ValueError(f"Index at {directory} has no id map; re-index the documents")
+        with self._lock:
+            self.index = index
+            self.documents = DocumentStore.load(str(directory), mmap_documents=mmap)
+            self.dimension = self.index.d
+            self._next_label = meta.get('next_label', int(self.index.ntotal))
+            self._labels = None
+            self._deleted = set()
+            self._selector = None
+            self._index_mmapped = mmap
+            apply_search_params(self.index, self.index_config)
+            if self.lexical is not None:
+                if (directory / 'lexical').exists():
+                    self.lexical = BM25Index.load(str(directory / 'lexical'), mmap, self.lexical.max_segments)
+                else:
+                    # Saved without a lexical index: build one from the stored documents
+                    items = list(self.documents.items())
+                    self.lexical = BM25Index(self.lexical.k1, self.lexical.b, self.lexical.max_segments)
+                    self.lexical.add([label for label, _ in items], [doc['text'] for _, doc in items])
+            if self.metadata.fields:
+                metadata = MetadataIndex.load(str(directory), self.metadata.fields)
+                if metadata is None:
+                    # Saved with other (or no) metadata fields: index them from the stored documents
+                    metadata = MetadataIndex(self.metadata.fields)
+                    items = list(self.documents.items())
+                    metadata.add([label for label, _ in items], [doc for _, doc in items])
+                self.metadata = metadata
+        logging.getLogger(__name__).info(f"Loaded {self.index.ntotal} vectors from {directory} (mmap: {mmap})")
             
-    def encode_text(self, texts: List[str]) -> np.ndarray:
-        """Encode text using BERT."""
-        tokens = self.tokenizer(texts, padding=True, truncation=True, 
-                              return_tensors="pt", max_length=512)
-        with torch.no_grad():
-            outputs = self.model(**tokens)
-            embeddings = outputs.last_hidden_state[:, 0, :].numpy()
+    def encode_text(self, texts: List[str], output_path: Optional[str] = None) -> np.ndarray:
+        """Encode text using BERT, in length-bucketed batches of `rag.encoder.batch_size`."""
+        if self.embedding_cache is None:
+            return self.encoder.encode(texts, output_path)
+        
+        # Only texts missing from the cache go through the model
+        if output_path:
+            embeddings = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.float32,
+                                                   shape=(len(texts), self.dimension))
+        else:
+            embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+        # One encoder window at a time, so only that many looked-up or encoded vectors are held in memory
+        window = self.encoder_config.get('batch_size', 32) * self.encoder_config.get('bucket_window', 64)
+        for start in range(0, len(texts), window):
+            chunk = texts[start:start + window]
+            out = embeddings[start:start + window]
+            missing = np.flatnonzero(~self.embedding_cache.lookup(chunk, out))
+            if len(missing):
+                missing_texts = [chunk[i] for i in missing]
+                vectors = self.encoder.encode(missing_texts)
+                out[missing] = vectors
+                self.embedding_cache.store(missing_texts, vectors)
         return embeddings
         
     def index_documents(self, documents: List[Dict]):
         """Index documents for retrieval."""
-        if self.retriever_type == "faiss":
-            texts = [doc['text'] for doc in documents]
-            embeddings = self.encode_text(texts)
-            self.index.add(embeddings)
-            self.documents = documents
-        else:
-            for doc in documents:
-                self.es.index(index="financial_data", document=doc)
+        self.add(documents)
+    
+    def add(self, documents: List[Dict], embeddings: Optional[np.ndarray] = None) -> int:
+        """Index new documents, keyed by their `id` field.
+        
+        Documents without an `id` are keyed by the label they are stored under.
+        Raises ValueError if an id is already indexed (use `upsert` to replace).
+        """
+        if self.retriever_type == "elasticsearch":
+            # Documents without an id get one generated by Elasticsearch
+            actions = (dict({'_index': self.es_index, '_source': doc},
+                            **({'_id': doc['id']} if doc.get('id') is not None else {}))
+                       for doc in documents)
+            return sum(1 for _ in self._bulk(actions))
+        
+        embeddings = self._embed(documents, embeddings)
+        with self._lock:
+            labels = self._label_map()
+            ids = [doc['id'] for doc in documents if doc.get('id') is not None]
+            duplicates = [doc_id for doc_id in ids if doc_id in labels]
+            if duplicates or len(set(ids)) < len(ids):
+                raise ValueError(f"Documents already indexed: {(duplicates or ids)[:10]}")
+            self._insert(documents, embeddings)
+        return len(documents)
+    
+    def upsert(self, documents: List[Dict], embeddings: Optional[np.ndarray] = None) -> int:
+        """Index documents, replacing any already indexed under the same id."""
+        if self.retriever_type == "elasticsearch":
+            return self.add(documents)
+        
+        # Keep only the last version of an id repeated within the batch
+        latest = {document_key(doc, object()): i for i, doc in enumerate(documents)}
+        keep = sorted(latest.values())
+        documents = [documents[i] for i in keep]
+        embeddings = self._embed(documents, None if embeddings is None else np.asarray(embeddings)[keep])
+        with self._lock:
+            # Validate before the old versions are removed, so a rejected batch changes nothing
+            if self.metadata.fields:
+                self.metadata.validate(documents)
+            self._remove(doc['id'] for doc in documents if doc.get('id') is not None)
+            self._insert(documents, embeddings)
+        self._maybe_compact()
+        return len(documents)
+    
+    def delete(self, ids: Iterable[Any]) -> int:
+        """Delete documents by id; returns how many were indexed.
+        
+        Vectors are tombstoned and skipped by searches right away; they are
+        removed from the index by a background compaction once more than
+        `compaction_threshold` of the index is deleted.
+        """
+        if self.retriever_type == "elasticsearch":
+            actions = ({'_op_type': 'delete', '_index': self.es_index, '_id': doc_id} for doc_id in ids)
+            return sum(info['delete'].get('result') == 'deleted' for info in self._bulk(actions))
+        
+        with self._lock:
+            deleted = self._remove(ids)
+        self._maybe_compact()
+        return deleted
+    
+    def _bulk(self, actions: Iterable[Dict]) -> Iterator[Dict]:
+        """Run actions through the bulk API, `bulk_chunk_size` per request on `bulk_threads` threads"""
+        # Deleting a missing document is a 404 item, not a failure
+        for ok, info in helpers.parallel_bulk(self.es, actions, thread_count=self.bulk_threads,
+                                              chunk_size=self.bulk_chunk_size, raise_on_error=False):
+            if not ok and next(iter(info.values())).get('status') != 404:
+                raise RuntimeError(f"Bulk indexing failed: {info}")
+            yield info
+        if self.es_refresh:
+            self.es.indices.refresh(index=self.es_index)
+    
+    def _embed(self, documents: List[Dict], embeddings: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        if not self.dense:
+            return None
+        if embeddings is None:
+            embeddings = self.encode_text([doc['text'] for doc in documents])
+        if len(embeddings) != len(documents):
+            raise ValueError(f"Got {len(embeddings)} embeddings for {len(documents)} documents")
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+    
+    def _label_map(self) -> Dict[Any, int]:
+        # Built on first use; a loaded store reads the ids saved with it instead of its documents
+        if self._labels is None:
+            self._labels = self.documents.id_map()
+        return self._labels
+    
+    def _ensure_writable(self):
+        # A memory-mapped index is read-only; copy it into memory before the first change
+        if self._index_mmapped:
+            self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+            apply_search_params(self.index, self.index_config)
+            self._index_mmapped = False
+    
+    def _insert(self, documents: List[Dict], embeddings: Optional[np.ndarray]):
+        if not len(documents):
+            return
+        # Bad metadata must fail the batch before any index has changed
+        if self.metadata.fields:
+            self.metadata.validate(documents)
+        # Labels are reserved up front, so a failure part-way through never lets a later batch reuse them
+        labels = np.arange(self._next_label, self._next_label + len(documents), dtype=np.int64)
+        self._next_label += len(documents)
+        if embeddings is not None:
+            self._ensure_writable()
+            self.index.add_with_ids(embeddings, labels)
+            if self._replay is not None:
+                self._replay.append((embeddings, labels))
+            self._maybe_train()
+        if self.lexical is not None:
+            self.lexical.add(labels, (doc['text'] for doc in documents))
+        if self.metadata.fields:
+            self.metadata.add(labels.tolist(), documents)
+        label_map = self._label_map()
+        for label, doc in zip(labels.tolist(), documents):
+            self.documents.put(label, doc)
+            label_map[document_key(doc, label)] = label
+    
+    def _new_index(self) -> faiss.Index:
+        index = build_index(self.dimension, self.index_config)
+        if not index.is_trained:
+            # IVF/PQ need a training sample first; until there is one, vectors go to an exact flat index
+            index = faiss.IndexFlatL2(self.dimension)
+        return faiss.IndexIDMap2(index)
+    
+    def _maybe_train(self):
+        """Replace the interim flat index by the configured one once there are enough vectors to train it"""
+        required = min_training_points(self.index_config)
+        if not required or not isinstance(base_index(self.index), faiss.IndexFlat):
+            return
+        live = faiss.vector_to_array(self.index.id_map)
+        live = live[~np.isin(live, np.fromiter(self._deleted, dtype=np.int64, count=len(self._deleted)))]
+        if len(live) < required:
+            return
+        vectors = self.index.reconstruct_batch(live)
+        index = faiss.IndexIDMap2(build_index(self.dimension, self.index_config))
+        train_index(index, vectors, self.index_config.get('train_sample', 100000))
+        index.add_with_ids(vectors, live)
+        self.index = index
+        self._deleted = set()
+        self._selector = None
+        logging.getLogger(__name__).info(f"Trained the {self.index_config.get('type')} index on {len(live)} vectors")
+    
+    def _remove(self, ids: Iterable[Any]) -> int:
+        label_map = self._label_map()
+        labels, documents = [], []
+        for doc_id in ids:
+            label = label_map.pop(doc_id, None)
+            if label is None:
+                continue
+            documents.append(self.documents.get(label))
+            self.documents.delete(label)
+            labels.append(label)
+        if labels and self.metadata.fields:
+            self.metadata.remove(labels, documents)
+        if labels and self.dense:
+            self._deleted.update(labels)
+            self._selector = None
+        if labels and self.lexical is not None:
+            self.lexical.remove(labels)
+        return len(labels)
+    
+    def _search(self, queries: np.ndarray, k: int,
+                allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            if allowed is not None:
+                # Deleted documents are already gone from the metadata indexes, so `allowed` has no tombstones
+                selector = faiss.IDSelectorBatch(allowed)
+                return self.index.search(queries, k, params=search_parameters(self.index, selector))
+            if not self._deleted:
+                return self.index.search(queries, k)
+            if self._selector is None:
+                deleted = faiss.IDSelectorBatch(np.fromiter(self._deleted, dtype=np.int64, count=len(self._deleted)))
+                # The outer selector only points at the batch, so both are kept alive
+                self._selector = (faiss.IDSelectorNot(deleted), deleted)
+            return self.index.search(queries, k, params=search_parameters(self.index, self._selector[0]))
+    
+    def compact(self) -> int:
+        """Remove deleted vectors from the index; returns how many were removed.
+        
+        The compacted index is built from a copy outside the lock, so searches
+        and writes go on meanwhile; vectors added in the meantime are replayed
+        into it before it replaces the live index.
+        """
+        with self._compact_lock:
+            with self._lock:
+                deleted = np.fromiter(self._deleted, dtype=np.int64, count=len(self._deleted))
+                if not len(deleted):
+                    return 0
+                self._ensure_writable()
+                source = self.index
+                hnsw = isinstance(base_index(source), faiss.IndexHNSW)
+                if hnsw:
+                    # HNSW graphs can't drop nodes: rebuild from the live vectors
+                    live = faiss.vector_to_array(source.id_map)
+                    live = live[~np.isin(live, deleted)]
+                    vectors = source.reconstruct_batch(live)
+                else:
+                    index = faiss.clone_index(source)
+                self._replay = []
+            
+            try:
+                if hnsw:
+                    index = faiss.IndexIDMap2(build_index(self.dimension, self.index_config))
+                    index.add_with_ids(vectors, live)
+                else:
+                    index.remove_ids(faiss.IDSelectorBatch(deleted))
+            except Exception:
+                with self._lock:
+                    self._replay = None
+                raise
+            
+            with self._lock:
+                replay, self._replay = self._replay, None
+                if self.index is not source:
+                    # Retrained or reloaded meanwhile, which already dropped the deleted vectors
+                    return 0
+                for embeddings, labels in replay:
+                    index.add_with_ids(embeddings, labels)
+                self.index = index
+                self._deleted.difference_update(deleted.tolist())
+                self._selector = None
+            return len(deleted)
+    
+    def _run_compaction(self):
+        try:
+            removed = self.compact()
+            logging.getLogger(__name__).info(f"Compacted {removed} deleted vectors out of the index")
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Index compaction failed: {str(e)}")
+    
+    def _maybe_compact(self):
+        with self._lock:
+            if len(self._deleted) <= self.compaction_threshold * max(1, self.index.ntotal):
+                return
+            if self._compaction is not None and self._compaction.is_alive():
+                return
+            self._compaction = threading.Thread(target=self._run_compaction, name='index-compaction', daemon=True)
+            self._compaction.start()
+    
+    def wait_for_compaction(self, timeout: Optional[float] = None):
+        """Block until a running background compaction has finished."""
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.join(timeout)
                 
-    def retrieve(self, query: str, k: int = None) -> List[Dict]:
-        """Retrieve relevant documents."""
+    def retrieve_many(self, queries: List[str], k: int = None,
+                      filters: Optional[Dict[str, Any]] = None) -> List[List[Dict]]:
+        """Retrieve relevant documents for a batch of queries.
+        
+        The queries are encoded together and searched with one index call;
+        the similarity threshold is applied to the whole score matrix at once.
+        `filters` restricts every query to documents with matching metadata
+        (see MetadataIndex.select) inside the search, so up to k matching
+        documents are returned.
+        """
         k = k or self.max_documents
-        query_embedding = self.encode_text([query])
-        
-        if self.retriever_type == "faiss":
-            distances, indices = self.index.search(query_embedding, k)
-            results = [
-                {
-                    'document': self.documents[idx],
-                    'score': float(1 / (1 + dist))
-                }
-                for dist, idx in zip(distances[0], indices[0])
-                if 1 / (1 + dist) >= self.similarity_threshold
-            ]
+        if not len(queries):
+            return []
+        if self.retriever_type == "elasticsearch":
+            return self._msearch(queries, k, filters)
+        
+        allowed = None
+        if filters:
+            with self._lock:
+                allowed = self.metadata.select(filters)
+            if not len(allowed):
+                return [[] for _ in queries]
+        
+        if self.retriever_type == "bm25":
+            hits = [self._lexical_search(query, k, allowed) for query in queries]
+        elif self.retriever_type == "hybrid":
+            candidates = max(k, self.fusion_candidates)
+            dense = self._dense_search(queries, candidates, allowed)
+            hits = [self._fuse(vector_hits, self._lexical_search(query, candidates, allowed), k)
+                    for query, vector_hits in zip(queries, dense)]
         else:
-            response = self.es.search(
-                index="financial_data",
-                query={
-                    "match": {
-                        "text": query
+            hits = self._dense_search(queries, k, allowed)
+        
+        results: List[List[Dict]] = [[] for _ in queries]
+        documents: Dict[int, Optional[Dict]] = {}
+        for row, (labels, scores) in enumerate(hits):
+            for label, score in zip(labels.tolist(), scores.tolist()):
+                # Popular documents are decoded once per batch
+                if label not in documents:
+                    documents[label] = self.documents.get(label)
+                # A document deleted since the search ran is skipped
+                if documents[label] is not None:
+                    results[row].append({'document': documents[label], 'score': score})
+        return results
+    
+    def _dense_search(self, queries: List[str], k: int,
+                      allowed: Optional[np.ndarray] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        distances, labels = self._search(self.encode_text(list(queries)), k, allowed)
+        scores = 1 / (1 + distances)
+        keep = (labels >= 0) & (scores >= self.similarity_threshold)
+        splits = np.cumsum(keep.sum(axis=1))[:-1]
+        return list(zip(np.split(labels[keep], splits), np.split(scores[keep], splits)))
+    
+    def _lexical_search(self, query: str, k: int,
+                        allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            labels, scores = self.lexical.search(query, k, allowed)
+        keep = scores >= self.lexical_min_score
+        return labels[keep], scores[keep]
+    
+    def _fuse(self, dense: Tuple[np.ndarray, np.ndarray], lexical: Tuple[np.ndarray, np.ndarray],
+              k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Reciprocal-rank fusion: each ranking adds 1 / (rrf_k + rank) to a document's score"""
+        fused: Dict[int, float] = {}
+        for labels, _ in (dense, lexical):
+            for rank, label in enumerate(labels.tolist(), start=1):
+                fused[label] = fused.get(label, 0.0) + 1.0 / (self.rrf_k + rank)
+        top = sorted(fused.items(), key=lambda item: -item[1])[:k]
+        return (np.array([label for label, _ in top], dtype=np.int64),
+                np.array([score for _, score in top], dtype=np.float64))
+    
+    def _msearch(self, queries: List[str], k: int, filters: Optional[Dict[str, Any]] = None) -> List[List[Dict]]:
+        """Match queries through msearch, `msearch_batch_size` queries per request"""
+        clauses = []
+        for field, condition in (filters or {}).items():
+            if isinstance(condition, dict):
+                clauses.append({'range': {field: condition}})
+            else:
+                # Dynamically mapped strings are matched exactly on their keyword sub-field
+                values = list(condition) if isinstance(condition, (list, tuple, set)) else [condition]
+                keyword = f"{field}.keyword" if all(isinstance(v, str) for v in values) else field
+                clauses.append({'terms': {keyword: values}})
+        results = []
+        for start in range(0, len(queries), self.msearch_batch_size):
+            searches = []
+            for query in queries[start:start + self.msearch_batch_size]:
+                match = {'match': {'text': query}}
+                body = {'bool': {'must': match, 'filter': clauses}} if clauses else match
+                searches.extend([{'index': self.es_index}, {'query': body, 'size': k}])
+            for response in self.es.msearch(searches=searches)['responses']:
+                if 'error' in response:
+                    raise RuntimeError(f"Elasticsearch query failed: {response['error']}")
+                results.append([
+                    {
+                        'document': hit['_source'],
+                        'score': hit['_score']
                     }
-                },
-                size=k
-            )
-            results = [
-                {
-                    'document': hit['_source'],
-                    'score': hit['_score']
-                }
-                for hit in response['hits']['hits']
-                if hit['_score'] >= self.similarity_threshold
-            ]
-            
+                    for hit in response['hits']['hits']
+                    if hit['_score'] >= self.similarity_threshold
+                ])
         return results
-
+    
+    def retrieve(self, query: str, k: int = None, filters: Optional[Dict[str, Any]] = None) -> List[Dict]:
+        """Retrieve relevant documents, optionally only those matching metadata `filters`."""
+        return self.retrieve_many([query], k, filters)[0]
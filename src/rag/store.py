@@ -0,0 +1,164 @@
+"""Document store for the RAG retriever."""
+
+import heapq
+import json
+import mmap
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+import numpy as np
+
+def document_key(document: Dict, label: int) -> Any:
+    """The key a document is indexed under: its `id`, or its label when the id is missing or None"""
+    doc_id = document.get('id')
+    return label if doc_id is None else doc_id
+
+class DocumentStore:
+    """Documents keyed by their int64 vector label in the FAISS index.
+
+    Persisted as `documents.jsonl` with sorted `labels.npy`, an int64 offset
+    table and the matching document ids in `ids.json`. A loaded store
+    memory-maps the first three and decodes a document only when it is
+    retrieved, so opening a store of millions of documents is instant and its
+    pages are shared between retriever processes. Changes
+    made after loading (new documents, deletions) are kept in an in-memory
+    overlay until the next save.
+    """
+
+    def __init__(self, documents: Optional[Dict[int, Dict]] = None):
+        self._documents: Dict[int, Dict] = dict(documents or {})
+        self._deleted = set()  # Persisted labels removed since loading
+        self._file = None
+        self._mmap = None
+        self._labels = None  # Sorted labels of the persisted documents
+        self._offsets = None  # (n + 1,) byte offsets of the persisted documents
+        self._ids_path: Optional[Path] = None  # Ids of the persisted documents, in label order
+
+    def _persisted_position(self, label: int) -> Optional[int]:
+        if self._labels is None or label in self._deleted:
+            return None
+        position = int(np.searchsorted(self._labels, label))
+        if position < len(self._labels) and self._labels[position] == label:
+            return position
+        return None
+
+    def __len__(self) -> int:
+        persisted = len(self._labels) - len(self._deleted) if self._labels is not None else 0
+        overlap = sum(1 for label in self._documents if self._persisted_position(label) is not None)
+        return persisted + len(self._documents) - overlap
+
+    def __contains__(self, label: int) -> bool:
+        return int(label) in self._documents or self._persisted_position(int(label)) is not None
+
+    def __getitem__(self, label: int) -> Dict:
+        document = self.get(label)
+        if document is None:
+            raise KeyError(label)
+        return document
+
+    def get(self, label: int, default: Optional[Dict] = None) -> Optional[Dict]:
+        label = int(label)
+        if label in self._documents:
+            return self._documents[label]
+        position = self._persisted_position(label)
+        if position is None:
+            return default
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        return json.loads(self._mmap[start:end])
+
+    def put(self, label: int, document: Dict):
+        label = int(label)
+        self._deleted.discard(label)
+        self._documents[label] = document
+
+    def delete(self, label: int) -> bool:
+        label = int(label)
+        found = self._documents.pop(label, None) is not None
+        if self._persisted_position(label) is not None:
+            self._deleted.add(label)
+            found = True
+        return found
+
+    def _persisted_labels(self, chunk_size: int = 65536) -> Iterator[int]:
+        # Streamed in chunks, so iterating a memory-mapped store never holds all labels at once
+        if self._labels is None:
+            return
+        for start in range(0, len(self._labels), chunk_size):
+            for label in self._labels[start:start + chunk_size].tolist():
+                if label not in self._deleted and label not in self._documents:
+                    yield label
+
+    def labels(self) -> Iterator[int]:
+        """Every label, in order"""
+        return heapq.merge(self._persisted_labels(), sorted(self._documents))
+
+    def items(self) -> Iterator[Tuple[int, Dict]]:
+        """(label, document) pairs in label order"""
+        for label in self.labels():
+            yield label, self.get(label)
+
+    def id_map(self) -> Dict[Any, int]:
+        """Document id -> label, with documents that have no `id` keyed by their label.
+
+        The ids of persisted documents are read from `ids.json`, so no
+        document is decoded.
+        """
+        if self._ids_path is None:
+            return {document_key(document, label): label for label, document in self.items()}
+        with open(self._ids_path, 'r', encoding='utf-8') as f:
+            ids = json.load(f)
+        mapping = {doc_id: label for doc_id, label in zip(ids, self._labels.tolist()) if label not in self._deleted}
+        for label, document in self._documents.items():
+            mapping[document_key(document, label)] = label
+        return mapping
+
+    def __iter__(self) -> Iterator[Dict]:
+        for _, document in self.items():
+            yield document
+
+    def save(self, directory: str):
+        """Write every document to `directory` (atomically replacing a previous save)"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        labels, offsets, ids = [], [0], []
+        tmp_path = directory / 'documents.jsonl.tmp'
+        with open(tmp_path, 'wb') as f:
+            for label, document in self.items():
+                line = json.dumps(document, default=str).encode('utf-8') + b'\n'
+                f.write(line)
+                labels.append(label)
+                offsets.append(offsets[-1] + len(line))
+                ids.append(document_key(document, label))
+        np.save(directory / 'labels.tmp.npy', np.asarray(labels, dtype=np.int64))
+        np.save(directory / 'offsets.tmp.npy', np.asarray(offsets, dtype=np.int64))
+        with open(directory / 'ids.json.tmp', 'w', encoding='utf-8') as f:
+            json.dump(ids, f, default=str)
+        os.replace(tmp_path, directory / 'documents.jsonl')
+        os.replace(directory / 'labels.tmp.npy', directory / 'labels.npy')
+        os.replace(directory / 'offsets.tmp.npy', directory / 'offsets.npy')
+        os.replace(directory / 'ids.json.tmp', directory / 'ids.json')
+
+    @classmethod
+    def load(cls, directory: str, mmap_documents: bool = True) -> 'DocumentStore':
+        directory = Path(directory)
+        labels = np.load(directory / 'labels.npy', mmap_mode='r' if mmap_documents else None)
+        if not mmap_documents:
+            with open(directory / 'documents.jsonl', 'r', encoding='utf-8') as f:
+                return cls({int(label): json.loads(line) for label, line in zip(labels, f)})
+
+        store = cls()
+        if len(labels):
+            store._labels = labels
+            store._offsets = np.load(directory / 'offsets.npy', mmap_mode='r')
+            store._file = open(directory / 'documents.jsonl', 'rb')
+            store._mmap = mmap.mmap(store._file.fileno(), 0, access=mmap.ACCESS_READ)
+            # Stores saved before ids were persisted fall back to decoding the documents
+            if (directory / 'ids.json').exists():
+                store._ids_path = directory / 'ids.json'
+        return store
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = self._file = None
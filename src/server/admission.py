@@ -0,0 +1,134 @@
+"""admission.py module."""
+
+from typing import Any, Callable, Dict, Optional
+import logging
+import queue
+import threading
+import time
+
+class IngestQueue:
+    """Bounded ingest queue for client updates with byte-based admission control.
+
+    Requests reserve their body size before the body is parsed. When the reserved
+    bytes would exceed `max_inflight_bytes`, or the queue already holds
+    `max_queue_size` updates, the request is rejected with a Retry-After hint
+    instead of being buffered. A single worker applies admitted updates at no
+    more than `max_updates_per_second` and releases their reservation afterwards,
+    so server memory is bounded by configuration rather than cohort size.
+    """
+
+    def __init__(self, config: Dict, handler: Callable[[Dict[str, Any]], None]):
+        logger = logging.getLogger(__name__)
+        self.max_inflight_bytes = config.get('max_inflight_bytes', 256 * 1024 * 1024)
+        self.max_queue_size = config.get('max_queue_size', 64)
+        self.max_updates_per_second = config.get('max_updates_per_second', 0)
+        self.retry_after = config.get('retry_after_seconds', 1.0)
+        self.handler = handler
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._inflight_bytes = 0
+        self._pending = 0  # Admitted but not yet applied, including bodies still being parsed
+        self._worker = None
+        self._running = False
+
+        self.admitted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        logger.info(f"IngestQueue initialized. Max in-flight bytes: {self.max_inflight_bytes}, "
+                    f"max queue size: {self.max_queue_size}")
+
+    def start(self):
+        """Start the worker that applies queued updates"""
+        if self._running:
+            return
+        self._running = True
+        self._worker = threading.Thread(target=self._drain, name='ingest-worker', daemon=True)
+        self._worker.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the worker once the queued updates have been applied"""
+        if not self._running:
+            return
+        self._running = False
+        self._queue.put(None)
+        self._worker.join(timeout)
+
+    def try_admit(self, num_bytes: int) -> Optional[float]:
+        """Reserve capacity for an update of `num_bytes`.
+
+        Returns None if admitted, otherwise the number of seconds the client
+        should wait before retrying.
+        """
+        with self._lock:
+            if (self._pending >= self.max_queue_size
+                    or self._inflight_bytes + num_bytes > self.max_inflight_bytes):
+                self.rejected += 1
+                return self._retry_after_hint()
+            self._inflight_bytes += num_bytes
+            self._pending += 1
+            self.admitted += 1
+            return None
+
+    def release(self, num_bytes: int):
+        """Give back a reservation for an update that will not be queued"""
+        with self._lock:
+            self._inflight_bytes -= num_bytes
+            self._pending -= 1
+
+    def put(self, item: Dict[str, Any], num_bytes: int):
+        """Queue an admitted update for the worker"""
+        item['_num_bytes'] = num_bytes
+        item['_enqueued_at'] = time.time()
+        self._queue.put(item)
+
+    def _retry_after_hint(self) -> float:
+        # Time for the worker to drain what is already queued, never below the configured floor
+        if self.max_updates_per_second:
+            return max(self.retry_after, self._pending / self.max_updates_per_second)
+        return self.retry_after
+
+    def _drain(self):
+        logger = logging.getLogger(__name__)
+        min_interval = 1.0 / self.max_updates_per_second if self.max_updates_per_second else 0.0
+        last_applied = 0.0
+
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            wait = last_applied + min_interval - time.time()
+            if wait > 0:
+                time.sleep(wait)
+
+            num_bytes = item.pop('_num_bytes')
+            succeeded = False
+            try:
+                self.handler(item)
+                succeeded = True
+            except Exception as e:
+                logger.error(f"Error applying queued update from client {item.get('client_id')}: {str(e)}")
+            finally:
+                last_applied = time.time()
+                # Counted together with the release, so stats() sees one consistent state
+                with self._lock:
+                    if succeeded:
+                        self.processed += 1
+                    else:
+                        self.failed += 1
+                    self._inflight_bytes -= num_bytes
+                    self._pending -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Current queue occupancy and admission counters"""
+        with self._lock:
+            return {
+                'inflight_bytes': self._inflight_bytes,
+                'pending_updates': self._pending,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'processed': self.processed,
+                'failed': self.failed
+            }
@@ -20,7 +20,20 @@ class FederatedAggregator:
             logger.error(f"No 'aggregation' key found in config passed to FederatedAggregator: {config}")
             raise KeyError("'aggregation' config section is required for FederatedAggregator")
         self.weighted = agg_config.get('weighted', True)
-        logger.info(f"FederatedAggregator initialized. Weighted: {self.weighted}")
+        self.method = agg_config.get('method', 'fedavg')
+        logger.info(f"FederatedAggregator initialized. Method: {self.method}, weighted: {self.weighted}")
+    
+    def aggregate(self, updates: List[Dict], global_weights: List = None) -> List:
+        """Aggregate with the configured method.
+        
+        FedNova needs the round's starting weights and every update's
+        `local_steps`; without them it falls back to FedAvg.
+        """
+        if self.method == 'fednova':
+            if global_weights is not None and all(update.get('local_steps') for update in updates):
+                return self.fednova_averaging(updates, global_weights)
+            logging.getLogger(__name__).warning("FedNova needs local_steps from every client; using FedAvg")
+        return self.federated_averaging(updates)
     
     def federated_averaging(self, updates: List[Dict]) -> List:
         """Perform federated averaging (FedAvg) on model weights."""
@@ -54,6 +67,71 @@ class FederatedAggregator:
         logger.info("Federated averaging completed successfully")
         return aggregated_weights
     
+    def fednova_averaging(self, updates: List[Dict], global_weights: List) -> List:
+        """Normalized averaging (FedNova) for clients that ran different numbers of local steps.
+        
+        Each client's change is divided by its step count before averaging and
+        the average is rescaled by the weighted mean step count, so clients that
+        did more work don't pull the model further just because they trained longer.
+        """
+        logger = logging.getLogger(__name__)
+        logger.info(f"Performing FedNova averaging on {len(updates)} client updates")
+        
+        if not updates:
+            logger.warning("No updates provided for FedNova averaging")
+            return None
+        
+        total_samples = sum(update['size'] for update in updates)
+        factors = [update['size'] / total_samples if self.weighted else 1.0 / len(updates)
+                   for update in updates]
+        effective_steps = sum(f * update['local_steps'] for f, update in zip(factors, updates))
+        
+        aggregated_weights = []
+        for i, start in enumerate(global_weights):
+            start = np.asarray(start, dtype=np.float32)
+            direction = np.zeros_like(start)
+            for factor, update in zip(factors, updates):
+                direction += (np.asarray(update['weights'][i]) - start) * (factor / update['local_steps'])
+            aggregated_weights.append(start + effective_steps * direction)
+        
+        logger.info(f"FedNova averaging completed (effective local steps: {effective_steps:.1f})")
+        return aggregated_weights
+    
+    def merge_feature_statistics(self, client_stats: List[Dict]) -> Dict:
+        """Merge per-client sufficient statistics into a global feature scaler.
+        
+        Each entry carries `count`, per-feature `sum` and `sum_sq`, and optionally
+        `histogram` counts over shared edges. Merging is O(features) per client.
+        """
+        logger = logging.getLogger(__name__)
+        if not client_stats:
+            logger.warning("No feature statistics provided to merge_feature_statistics.")
+            return None
+        
+        count = sum(stats['count'] for stats in client_stats)
+        total = np.sum([np.asarray(stats['sum'], dtype=np.float64) for stats in client_stats], axis=0)
+        total_sq = np.sum([np.asarray(stats['sum_sq'], dtype=np.float64) for stats in client_stats], axis=0)
+        mean = total / count
+        var = np.maximum(total_sq / count - mean ** 2, 0.0)
+        scale = np.sqrt(var)
+        scale[scale == 0.0] = 1.0  # Same convention as StandardScaler for constant features
+        
+        merged = {
+            'count': int(count),
+            'mean': mean.tolist(),
+            'var': var.tolist(),
+            'scale': scale.tolist(),
+            'num_clients': len(client_stats)
+        }
+        histograms = [stats['histogram'] for stats in client_stats if stats.get('histogram')]
+        if histograms:
+            merged['histogram'] = {
+                'edges': histograms[0]['edges'],
+                'counts': np.sum([np.asarray(h['counts']) for h in histograms], axis=0).tolist()
+            }
+        logger.info(f"Merged feature statistics from {len(client_stats)} clients ({count} samples)")
+        return merged
+    
     def compute_metrics(self, client_metrics: List[Dict]) -> Dict:
         logger = logging.getLogger(__name__)
         logger.debug(f"Computing metrics for {len(client_metrics)} clients")
@@ -7,7 +7,10 @@ from collections import defaultdict
 import logging
 import time
 import threading
+from contextlib import contextmanager
 from .aggregator import FederatedAggregator
+from ..utils.monitoring import MetricsRegistry
+from ..utils.tracing import Tracer
 
 class FederatedCoordinator:
     def __init__(self, config: Dict):
@@ -25,6 +28,14 @@ class FederatedCoordinator:
         self.min_clients = config.get('federated', {}).get('min_clients', 2)
         self.rounds = config.get('federated', {}).get('rounds', 10)
         
+        # Pre-training federated analytics for a shared feature scaler
+        stats_config = config.get('federated', {}).get('feature_stats', {})
+        self.feature_stats_enabled = stats_config.get('enabled', False)
+        self.feature_stats_min_clients = stats_config.get('min_clients', self.min_clients)
+        self.histogram_edges = stats_config.get('histogram_edges')
+        self.feature_stats = {}
+        self.feature_scaler = None
+        
         # Debug: log config structure
         logger.debug(f"Coordinator received config: {config}")
         
@@ -49,8 +60,36 @@ class FederatedCoordinator:
         self._initialize_global_model()
         
         self.lock = threading.Lock()  # Thread safety for concurrent API calls
+        self._setup_metrics()
+        self.tracer = Tracer('server', config.get('tracing', {}))
         logger.info("FederatedCoordinator initialized.")
     
+    def _setup_metrics(self):
+        """Register coordinator-level gauges and histograms"""
+        self.metrics = MetricsRegistry()
+        self.metrics.gauge('fl_current_round', 'Current federated round', lambda: self.current_round)
+        self.metrics.gauge('fl_total_rounds', 'Planned federated rounds', lambda: self.rounds)
+        self.metrics.gauge('fl_updates_pending', 'Client updates waiting for aggregation',
+                           lambda: len(self.client_updates))
+        self.metrics.gauge('fl_registered_clients', 'Registered clients', lambda: len(self.clients))
+        self.metrics.gauge('fl_active_clients', 'Clients seen in the last 60 seconds',
+                           self._count_active_clients)
+        self.metrics.gauge('fl_training_active', 'Whether training is running',
+                           lambda: int(self.training_active))
+        self.aggregation_duration = self.metrics.histogram(
+            'fl_aggregation_duration_seconds', 'Time spent aggregating a round')
+        self.lock_wait = self.metrics.histogram(
+            'fl_lock_wait_seconds', 'Time spent waiting for the coordinator lock',
+            buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+    
+    @contextmanager
+    def _locked(self, operation: str):
+        """Hold the coordinator lock, recording how long we waited for it"""
+        start = time.perf_counter()
+        with self.lock:
+            self.lock_wait.observe(time.perf_counter() - start, {'operation': operation})
+            yield
+    
     def _initialize_global_model(self):
         """Initialize global model weights with random values."""
         logger = logging.getLogger(__name__)
@@ -85,7 +124,7 @@ class FederatedCoordinator:
         
     def register_client(self, client_id: str, client_info: Dict[str, Any] = None) -> bool:
         """Register a new client."""
-        with self.lock:
+        with self._locked('register'):
             if client_id in self.clients:
                 logging.getLogger(__name__).warning(f"Client {client_id} already registered")
                 return True
@@ -105,17 +144,39 @@ class FederatedCoordinator:
             'model_config': self.config.get('model', {}),
             'training_config': self.config.get('training', {}),
             'current_round': self.current_round,
-            'total_rounds': self.rounds
+            'total_rounds': self.rounds,
+            'feature_stats': {
+                'enabled': self.feature_stats_enabled,
+                'histogram_edges': self.histogram_edges
+            },
+            'feature_scaler': self.feature_scaler
         }
     
+    def receive_feature_stats(self, client_id: str, stats: Dict[str, Any]) -> bool:
+        """Receive a client's feature statistics; returns True once the global scaler is ready"""
+        with self._locked('receive_stats'):
+            if client_id not in self.clients:
+                raise ValueError(f"Client {client_id} not registered")
+            
+            # The scaler is frozen once broadcast so every round sees the same inputs
+            if self.feature_scaler is None:
+                self.feature_stats[client_id] = stats
+                if len(self.feature_stats) >= self.feature_stats_min_clients:
+                    self.feature_scaler = self.aggregator.merge_feature_statistics(
+                        list(self.feature_stats.values()))
+            
+            self.clients[client_id]['last_seen'] = time.time()
+            logging.getLogger(__name__).info(f"Received feature statistics from client {client_id}")
+            return self.feature_scaler is not None
+    
     def get_global_model(self) -> Optional[List]:
         """Get the current global model weights"""
-        with self.lock:
+        with self._locked('get_model'):
             return self.global_model_weights
     
     def receive_model_update(self, client_id: str, model_weights: List, metrics: Dict[str, Any]):
         """Receive a model update from a client"""
-        with self.lock:
+        with self._locked('receive_update'):
             if client_id not in self.clients:
                 raise ValueError(f"Client {client_id} not registered")
             
@@ -136,6 +197,7 @@ class FederatedCoordinator:
     
     def _aggregate_models(self):
         """Aggregate models from all client updates"""
+        start = time.perf_counter()
         try:
             logger = logging.getLogger(__name__)
             logger.info(f"Aggregating models from {len(self.client_updates)} clients")
@@ -147,11 +209,13 @@ class FederatedCoordinator:
                 updates.append({
                     'client_id': client_id,
                     'weights': update['weights'],
-                    'size': client_size
+                    'size': client_size,
+                    'local_steps': update['metrics'].get('local_steps')
                 })
             
-            # Aggregate using FedAvg
-            self.global_model_weights = self.aggregator.federated_averaging(updates)
+            # Aggregate with the configured method (FedAvg or FedNova)
+            with self.tracer.span('aggregation', self.current_round, clients=len(updates)):
+                self.global_model_weights = self.aggregator.aggregate(updates, self.global_model_weights)
             
             # Clear updates for next round
             self.client_updates.clear()
@@ -162,12 +226,16 @@ class FederatedCoordinator:
         except Exception as e:
             logger = logging.getLogger(__name__)
             logger.error(f"Error during model aggregation: {str(e)}")
+        finally:
+            self.aggregation_duration.observe(time.perf_counter() - start)
     
     def _count_active_clients(self) -> int:
         """Count active clients (seen in last 60 seconds)"""
+        # Also runs from the metrics endpoint, concurrently with registrations
+        with self._locked('count_active'):
+            last_seen = [client['last_seen'] for client in self.clients.values()]
         current_time = time.time()
-        active_count = sum(1 for client in self.clients.values() 
-                          if current_time - client['last_seen'] < 60)
+        active_count = sum(1 for seen in last_seen if current_time - seen < 60)
         return active_count
     
     def start(self):
@@ -0,0 +1,218 @@
+"""simulation.py module."""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+import copy
+import logging
+import time
+import numpy as np
+from .api.local_transport import InMemoryTransport, NetworkEmulator
+from .client.data_handler import FinancialDataHandler
+from .client.model import FederatedClient
+from .client.process_pool import ProcessPoolBackend
+from .client.training import StackedTrainer
+from .server.coordinator import FederatedCoordinator
+
+class SimulationRunner:
+    """Runs a coordinator and N clients in one process over an in-memory transport.
+
+    Rounds are driven directly instead of by status polling: every client
+    downloads the global model, trains and submits, and the coordinator
+    aggregates once all updates for the round are in. With `max_workers` > 1
+    clients of a round train concurrently on a thread pool (TensorFlow releases
+    the GIL inside its kernels). An optional `network` profile adds per-client
+    latency, jitter and bandwidth delay to every call.
+
+    The `stacked` backend skips the per-client Keras models altogether and
+    trains every client in one StackedTrainer; clients still download and
+    submit through their own transports. The `processes` backend trains the
+    clients on a pool of `max_workers` processes (see ProcessPoolBackend).
+    """
+
+    BACKENDS = ('threads', 'stacked', 'processes')
+
+    def __init__(self, server_config: Dict, client_config: Dict, num_clients: int, rounds: int,
+                 network: Optional[Dict[str, Any]] = None, max_workers: int = 1,
+                 backend: str = 'threads'):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown simulation backend: {backend}")
+        self.num_clients = num_clients
+        self.rounds = rounds
+        self.max_workers = max(1, max_workers)
+        self.network = network
+        self.backend = backend
+
+        server_config = copy.deepcopy(server_config)
+        federated = server_config.setdefault('federated', {})
+        federated['min_clients'] = num_clients
+        federated['rounds'] = rounds
+        self.coordinator = FederatedCoordinator(server_config)
+        self.client_config = client_config
+        self.clients: List[FederatedClient] = []
+        self.transports: List[InMemoryTransport] = []
+        self.handlers: List[FinancialDataHandler] = []
+        self.client_configs: List[Dict] = []
+        self.trainer: Optional[StackedTrainer] = None
+        self.pool_backend: Optional[ProcessPoolBackend] = None
+        self._scaled_clients = set()
+
+    def _config_for(self, index: int, client_id: str) -> Dict:
+        config = copy.deepcopy(self.client_config)
+        client = config.setdefault('client', {})
+        # The id seeds the client's local data, so every simulated client gets its own
+        client['id'] = client_id
+        partition = client.get('data', {}).get('partition')
+        if partition:
+            partition['client_index'] = index
+            partition.setdefault('num_clients', self.num_clients)
+        return config
+
+    def setup(self):
+        """Build the clients and register them with the coordinator"""
+        logger = logging.getLogger(__name__)
+        start = time.perf_counter()
+        for index in range(self.num_clients):
+            client_id = f"sim_{index}"
+            network = NetworkEmulator(self.network, seed=index) if self.network else None
+            transport = InMemoryTransport(self.coordinator, client_id, network)
+            config = self._config_for(index, client_id)
+            if self.backend == 'processes':
+                # The workers build their own handlers; this one only counts and summarises the client's samples
+                self._register_handler(transport, FinancialDataHandler(config['client'], client_id))
+                self.client_configs.append(config)
+            elif self.backend == 'stacked':
+                handler = FinancialDataHandler(config['client'], client_id)
+                self._register_handler(transport, handler)
+                self.handlers.append(handler)
+            else:
+                client = FederatedClient(client_id, config, transport=transport)
+                client._register_with_server()
+                self.clients.append(client)
+            self.transports.append(transport)
+        
+        if self.backend == 'processes':
+            shapes = [np.shape(w) for w in self.coordinator.get_global_model()]
+            self.pool_backend = ProcessPoolBackend(self.client_configs, shapes, self.max_workers)
+            self.pool_backend.start()
+        elif self.backend == 'stacked':
+            client_config = self.client_config.get('client', {})
+            # The same architecture the coordinator initialises the global model with
+            model_config = self.coordinator.config.get('model', {})
+            layer_sizes = ([model_config.get('input_dim', 32)] + list(model_config.get('hidden_layers', [128, 64]))
+                           + [1])
+            self.trainer = StackedTrainer(self.num_clients, client_config.get('training', {}), layer_sizes)
+        logger.info(f"Set up {self.num_clients} simulated clients in {time.perf_counter() - start:.2f}s")
+
+    def _register_handler(self, transport: InMemoryTransport, handler: FinancialDataHandler):
+        """Register a client trained outside FederatedClient and contribute its feature statistics"""
+        _, num_samples = handler.get_training_data()
+        response = transport.register({'dataset_size': num_samples, 'capabilities': ['training']})
+        stats_config = response.get('server_config', {}).get('feature_stats', {})
+        if stats_config.get('enabled'):
+            transport.submit_feature_stats(handler.compute_feature_statistics(stats_config.get('histogram_edges')))
+    
+    def _run_client(self, client: FederatedClient, round_num: int) -> Optional[Dict]:
+        try:
+            return client._participate_in_round(round_num)
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Simulated client {client.client_id} failed "
+                                              f"in round {round_num}: {e!r}")
+            return None
+
+    def _run_stacked(self, round_num: int) -> List[Optional[Dict]]:
+        datasets = []
+        for index, (transport, handler) in enumerate(zip(self.transports, self.handlers)):
+            response = transport.get_global_model()
+            scaler = response.get('feature_scaler')
+            if scaler and index not in self._scaled_clients:
+                handler.apply_global_scaler(scaler['mean'], scaler['scale'])
+                self._scaled_clients.add(index)
+            self.trainer.set_weights(response['model_weights'], client=index)
+            datasets.append(handler.get_training_data()[0])
+        
+        history = self.trainer.train(datasets)
+        results = []
+        for index, (transport, (X, _)) in enumerate(zip(self.transports, datasets)):
+            epochs = history['loss'].shape[1]
+            metrics = {
+                'dataset_size': len(X),
+                'final_loss': float(history['loss'][index, -1]),
+                'epochs_trained': epochs,
+                # Each client steps once per batch of its own data; the stacked step masks the rest
+                'local_steps': epochs * -(-len(X) // self.trainer.batch_size),
+                'round': round_num
+            }
+            transport.submit_model_update(transport.encode_weights(self.trainer.get_weights(index)), metrics)
+            results.append(metrics)
+        return results
+
+    def _run_processes(self, round_num: int) -> List[Optional[Dict]]:
+        # Every client downloads (for transport accounting) but the weights go to shared memory once
+        responses = [transport.get_global_model() for transport in self.transports]
+        results = self.pool_backend.train_round(responses[0]['model_weights'], round_num,
+                                                responses[0].get('feature_scaler'))
+        for index, (transport, metrics) in enumerate(zip(self.transports, results)):
+            if metrics is not None:
+                transport.submit_model_update(self.pool_backend.update_weights(index), metrics)
+        return results
+
+    def _run_round(self, round_num: int, pool: Optional[ThreadPoolExecutor]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        if self.backend == 'stacked':
+            results = self._run_stacked(round_num)
+        elif self.backend == 'processes':
+            results = self._run_processes(round_num)
+        elif pool is None:
+            results = [self._run_client(client, round_num) for client in self.clients]
+        else:
+            results = list(pool.map(lambda client: self._run_client(client, round_num), self.clients))
+
+        coordinator = self.coordinator
+        with coordinator._locked('simulation'):
+            # Failed clients never submitted, so aggregate whatever did arrive
+            if coordinator.current_round == round_num and coordinator.client_updates:
+                coordinator._aggregate_models()
+
+        completed = [r for r in results if r is not None]
+        for client in self.clients:
+            client.current_round = coordinator.current_round
+        return {
+            'round': round_num,
+            'duration': time.perf_counter() - start,
+            'clients': len(completed),
+            'mean_loss': float(np.mean([r['final_loss'] for r in completed])) if completed else None
+        }
+
+    def run(self) -> Dict[str, Any]:
+        """Run all rounds and return per-round timings, losses and transport totals"""
+        logger = logging.getLogger(__name__)
+        start = time.perf_counter()
+        if not self.transports:
+            self.setup()
+
+        self.coordinator.training_active = True
+        pool = ThreadPoolExecutor(self.max_workers) if self.backend == 'threads' and self.max_workers > 1 else None
+        rounds = []
+        try:
+            for round_num in range(self.rounds):
+                summary = self._run_round(round_num, pool)
+                rounds.append(summary)
+                loss = 'n/a' if summary['mean_loss'] is None else f"{summary['mean_loss']:.4f}"
+                logger.info(f"Round {round_num + 1}/{self.rounds}: {summary['clients']} clients, "
+                            f"loss {loss}, {summary['duration']:.2f}s")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            if self.pool_backend is not None:
+                self.pool_backend.close()
+            self.coordinator.training_active = False
+
+        return {
+            'rounds': rounds,
+            'completed_rounds': self.coordinator.current_round,
+            'wall_time': time.perf_counter() - start,
+            'network_seconds': sum(t.network.simulated_seconds for t in self.transports
+                                   if t.network is not None),
+            'bytes_sent': sum(stats['bytes_sent'] for t in self.transports
+                              for stats in t.get_call_stats().values())
+        }
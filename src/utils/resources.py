@@ -0,0 +1,87 @@
+"""resources.py module."""
+
+from typing import Any, Dict, List, Optional
+import logging
+import os
+
+def _available_cpus() -> List[int]:
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def resolve_cpu_set(config: Dict[str, Any]) -> Optional[List[int]]:
+    """CPUs this process should be pinned to, or None to leave affinity alone.
+
+    `cpu_affinity` is either an explicit list of CPU ids or "auto", which splits
+    the CPUs available to the process into `slots` equal groups and takes
+    group number `slot` (e.g. one slot per co-located client replica;
+    FL_CLIENT_SLOT is used when `slot` is not set).
+    """
+    affinity = config.get('cpu_affinity')
+    if affinity is None:
+        return None
+    if affinity != 'auto':
+        return sorted(int(cpu) for cpu in affinity)
+
+    cpus = _available_cpus()
+    slots = max(1, int(config.get('slots') or 1))
+    # Replicas started from one config (e.g. docker-compose) can set their slot via the environment
+    slot = config.get('slot')
+    if slot is None:
+        slot = os.environ.get('FL_CLIENT_SLOT', 0)
+    slot = int(slot) % slots
+    per_slot = max(1, len(cpus) // slots)
+    return cpus[slot * per_slot:(slot + 1) * per_slot] or cpus[-per_slot:]
+
+def apply_resource_profile(config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Apply a client resource profile to the current process.
+
+    Must run before TensorFlow executes its first op: thread pool sizes are
+    fixed when the runtime initializes. Pinning without explicit thread
+    counts sizes both TF pools to the pinned CPU set, so co-located clients
+    don't each start one thread per host core. Returns what was applied.
+    """
+    logger = logging.getLogger(__name__)
+    config = config or {}
+    applied: Dict[str, Any] = {}
+
+    cpus = resolve_cpu_set(config)
+    if cpus is not None:
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cpus)
+            applied['cpu_affinity'] = cpus
+        else:
+            logger.warning("CPU affinity is not supported on this platform; ignoring cpu_affinity")
+
+    intra_op = config.get('intra_op_threads') or (len(cpus) if cpus else None)
+    inter_op = config.get('inter_op_threads') or (min(2, len(cpus)) if cpus else None)
+    if intra_op or inter_op:
+        import tensorflow as tf
+        try:
+            if intra_op:
+                tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+                applied['intra_op_threads'] = intra_op
+            if inter_op:
+                tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+                applied['inter_op_threads'] = inter_op
+        except RuntimeError as e:
+            # The runtime is already up (e.g. a second client in the same process)
+            logger.warning(f"TensorFlow thread pools already initialized, keeping current sizes: {str(e)}")
+
+    memory_limit_mb = config.get('memory_limit_mb')
+    if memory_limit_mb:
+        try:
+            import resource
+            limit = int(memory_limit_mb) * 1024 * 1024
+            # RLIMIT_DATA caps heap and anonymous mappings; allocations beyond it fail with MemoryError
+            _, hard = resource.getrlimit(resource.RLIMIT_DATA)
+            if hard != resource.RLIM_INFINITY:
+                limit = min(limit, hard)
+            resource.setrlimit(resource.RLIMIT_DATA, (limit, hard))
+            applied['memory_limit_mb'] = limit // (1024 * 1024)
+        except (ImportError, ValueError, OSError) as e:
+            logger.warning(f"Could not apply memory limit of {memory_limit_mb} MB: {str(e)}")
+
+    if applied:
+        logger.info(f"Applied resource profile: {applied}")
+    return applied
@@ -0,0 +1,109 @@
+"""tracing.py module."""
+
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+class Tracer:
+    """Collects round-phase spans and exports them as Chrome trace JSON.
+
+    Spans are grouped by the `round` tag and written to
+    `<output_dir>/<service>_round_<n>.json`, which loads directly in
+    chrome://tracing or Perfetto. Timestamps are wall-clock so client and
+    server traces of the same round can be opened side by side.
+    """
+
+    def __init__(self, service: str, config: Optional[Dict] = None):
+        config = config or {}
+        self.service = service
+        self.enabled = config.get('enabled', False)
+        self.output_dir = config.get('output_dir', 'logs/traces')
+        self.max_events_per_round = config.get('max_events_per_round', 100000)
+        self._events: Dict[Any, List[Dict]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, round_num: Optional[int] = None, **tags) -> Iterator[Dict[str, Any]]:
+        """Time the enclosed block; the yielded dict can be used to add tags."""
+        tags = dict(tags)
+        if not self.enabled:
+            yield tags
+            return
+        start = time.time()
+        perf_start = time.perf_counter()
+        try:
+            yield tags
+        finally:
+            self._add(name, start, time.perf_counter() - perf_start, round_num, tags)
+
+    def record(self, name: str, start: float, end: float, round_num: Optional[int] = None, **tags):
+        """Record a span measured elsewhere, from wall-clock start/end times."""
+        if self.enabled:
+            self._add(name, start, max(0.0, end - start), round_num, tags)
+
+    def _add(self, name: str, start: float, duration: float, round_num: Optional[int], tags: Dict):
+        event = {
+            'name': name,
+            'cat': self.service,
+            'ph': 'X',
+            'ts': int(start * 1e6),
+            'dur': int(duration * 1e6),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': dict(tags, round=round_num)
+        }
+        with self._lock:
+            events = self._events[round_num]
+            if len(events) < self.max_events_per_round:
+                events.append(event)
+
+    def events(self, round_num: Optional[int] = None) -> List[Dict]:
+        with self._lock:
+            return list(self._events.get(round_num, []))
+
+    def export_round(self, round_num: int) -> Optional[str]:
+        """Write and forget the spans of a round; returns the trace file path.
+
+        Spans that arrive after their round was exported (late uploads) are
+        merged into the existing file the next time a later round is exported.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            late_rounds = [r for r in self._events if r is not None and r < round_num]
+            batches = {r: self._events.pop(r) for r in late_rounds + [round_num] if r in self._events}
+
+        path = None
+        for batch_round, events in sorted(batches.items()):
+            written = self._write(batch_round, events)
+            if batch_round == round_num:
+                path = written
+        return path
+
+    def _write(self, round_num: int, events: List[Dict]) -> Optional[str]:
+        path = Path(self.output_dir) / f"{self.service}_round_{round_num}.json"
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if path.exists():
+                with open(path, 'r') as f:
+                    events = [e for e in json.load(f)['traceEvents'] if e['ph'] != 'M'] + events
+            metadata = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': self.service}}
+                        for pid in sorted({event['pid'] for event in events})]
+            with open(path, 'w') as f:
+                json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f)
+        except (OSError, ValueError, KeyError) as e:
+            logging.getLogger(__name__).error(f"Failed to export trace for round {round_num}: {str(e)}")
+            return None
+        return str(path)
@@ -0,0 +1,263 @@
+"""test_api.py module."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from src.api.client import BackoffPolicy, FederatedHTTPClient
+
+@pytest.fixture
+def stub_server():
+    """Local HTTP server replaying a scripted list of (status, headers, body) per path."""
+    script = {}
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self):
+            length = int(self.headers.get('Content-Length', 0))
+            self.rfile.read(length)
+            calls.append(self.path)
+            responses = script.get(self.path, [])
+            status, headers, body = responses.pop(0) if len(responses) > 1 else responses[0]
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_GET = _reply
+        do_POST = _reply
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", script, calls
+    server.shutdown()
+    server.server_close()
+
+def fast_client(url):
+    return FederatedHTTPClient(url, 'client_1', http_config={
+        'backoff': {'base_delay': 0.001, 'max_delay': 0.01}
+    })
+
+def test_backoff_is_jittered_and_capped():
+    policy = BackoffPolicy(base_delay=1.0, max_delay=4.0)
+    delays = [policy.delay(10) for _ in range(50)]
+    assert all(0 <= d <= 4.0 for d in delays)
+    assert len(set(delays)) > 1
+    assert BackoffPolicy(base_delay=1.0, jitter=False).delay(2, cap=3.0) == 3.0
+
+def test_idempotent_route_retries_transient_errors(stub_server):
+    url, script, calls = stub_server
+    script['/training_status'] = [(503, {}, {}), (502, {}, {}), (200, {}, {'current_round': 2})]
+    client = fast_client(url)
+
+    assert client.get_training_status()['current_round'] == 2
+    assert calls.count('/training_status') == 3
+
+    stats = client.get_call_stats()['training_status']
+    assert stats['calls'] == 3
+    assert stats['retries'] == 2
+    assert stats['errors'] == 2
+    assert stats['bytes_received'] > 0
+
+def test_submit_update_is_not_replayed_after_server_error(stub_server):
+    url, script, calls = stub_server
+    script['/submit_update'] = [(500, {}, {'error': 'boom'}), (200, {}, {'status': 'update_received'})]
+    client = fast_client(url)
+
+    with pytest.raises(Exception):
+        client.submit_model_update([[0.0]], {})
+    assert calls.count('/submit_update') == 1
+
+def test_submit_update_retries_when_server_sheds_load(stub_server):
+    url, script, calls = stub_server
+    script['/submit_update'] = [(429, {'Retry-After': '0'}, {}), (200, {}, {'status': 'update_received'})]
+    client = fast_client(url)
+
+    assert client.submit_model_update([[0.0]], {})['status'] == 'update_received'
+    assert calls.count('/submit_update') == 2
+    assert client.get_call_stats()['submit_update']['bytes_sent'] > 0
+
+def test_wait_for_server_gives_up_quickly_without_server():
+    client = FederatedHTTPClient('http://127.0.0.1:9', 'client_1')
+    assert client.wait_for_server(max_wait=0.3, check_interval=0.1) is False
+
+@pytest.fixture
+def serve_api():
+    """Factory serving a FederatedAPI from a background thread on a free port."""
+    import yaml
+    from werkzeug.serving import make_server
+    from src.server.coordinator import FederatedCoordinator
+    from src.api.server import FederatedAPI
+
+    servers = []
+
+    def start(**overrides):
+        with open('config/server_config.yaml', 'r') as f:
+            config = yaml.safe_load(f)
+        config.update(overrides)
+        coordinator = FederatedCoordinator(config)
+        coordinator.training_active = True
+        api = FederatedAPI(coordinator)
+        server = make_server('127.0.0.1', 0, api.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append((server, api))
+        return f"http://127.0.0.1:{server.server_port}", coordinator
+
+    yield start
+    for server, api in servers:
+        server.shutdown()
+        api.ingest.stop()
+
+@pytest.fixture
+def live_server(serve_api):
+    return serve_api(federated={'min_clients': 2, 'rounds': 2})
+
+def test_async_driver_runs_many_clients_in_one_process(live_server):
+    import asyncio
+    from src.client.async_driver import AsyncClientDriver
+
+    url, coordinator = live_server
+    driver = AsyncClientDriver(url, num_clients=20, rounds=2, pool_size=10, poll_interval=0.05)
+    summary = asyncio.run(driver.run())
+
+    assert summary['failed_clients'] == 0
+    assert len(coordinator.clients) == 20
+    assert coordinator.current_round >= 2
+    assert summary['routes']['submit_update']['calls'] >= 4
+
+def test_ingest_queue_sheds_load_with_retry_hint():
+    from src.server.admission import IngestQueue
+
+    applied = []
+    ingest = IngestQueue({'max_inflight_bytes': 100, 'max_queue_size': 2,
+                          'max_updates_per_second': 4, 'retry_after_seconds': 0.1},
+                         applied.append)
+    assert ingest.try_admit(60) is None
+    assert ingest.try_admit(60) >= 0.1  # Over the byte budget
+    assert ingest.try_admit(30) is None
+    assert ingest.try_admit(1) == pytest.approx(0.5)  # Queue full: two updates at 4/s
+
+    ingest.put({'client_id': 'a'}, 60)
+    ingest.put({'client_id': 'b'}, 30)
+    ingest.start()
+    ingest.stop()
+    assert [item['client_id'] for item in applied] == ['a', 'b']
+    assert ingest.stats()['inflight_bytes'] == 0
+    assert ingest.try_admit(100) is None
+
+def test_submit_update_returns_429_when_saturated():
+    import yaml
+    from src.server.coordinator import FederatedCoordinator
+    from src.api.server import FederatedAPI
+
+    with open('config/server_config.yaml', 'r') as f:
+        config = yaml.safe_load(f)
+    config['ingest'] = {'max_inflight_bytes': 4096, 'retry_after_seconds': 2}
+    coordinator = FederatedCoordinator(config)
+    api = FederatedAPI(coordinator)
+    http = api.app.test_client()
+    http.post('/register', json={'client_id': 'c1'})
+    update = {'client_id': 'c1', 'model_weights': [[0.5, 0.25]], 'metrics': {}}
+
+    assert api.ingest.try_admit(4090) is None  # Another upload holds most of the budget
+    response = http.post('/submit_update', json=update)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '2'
+
+    api.ingest.release(4090)
+    response = http.post('/submit_update', json=update)
+    assert response.status_code == 202
+    api.ingest.stop()
+    assert 'c1' in coordinator.client_updates
+
+    too_big = {'client_id': 'c1', 'model_weights': [[0.0] * 2000], 'metrics': {}}
+    assert http.post('/submit_update', json=too_big).status_code == 413
+
+def test_metrics_endpoint_exposes_route_and_coordinator_metrics():
+    import yaml
+    from src.server.coordinator import FederatedCoordinator
+    from src.api.server import FederatedAPI
+
+    with open('config/server_config.yaml', 'r') as f:
+        config = yaml.safe_load(f)
+    coordinator = FederatedCoordinator(config)
+    api = FederatedAPI(coordinator)
+    http = api.app.test_client()
+    http.post('/register', json={'client_id': 'c1'})
+    http.post('/get_model', json={'client_id': 'unknown'})
+
+    body = http.get('/metrics').get_data(as_text=True)
+    assert 'http_request_duration_seconds_count{method="POST",route="/register",status="200"} 1' in body
+    assert 'http_request_errors_total{route="/get_model",status="400"} 1' in body
+    assert 'fl_registered_clients 1' in body
+    assert 'fl_current_round 0' in body
+    assert 'fl_lock_wait_seconds_bucket{operation="register",le="+Inf"} 1' in body
+    assert 'fl_active_clients 1' in body
+    with pytest.raises(ValueError):
+        coordinator.metrics.gauge('fl_current_round', 'Registered twice')
+    api.ingest.stop()
+
+    # A second API on the same coordinator shares its metrics instead of failing
+    second = FederatedAPI(coordinator)
+    assert coordinator.metrics.get('http_request_duration_seconds').count(
+        {'route': '/register', 'method': 'POST', 'status': 200}) == 1
+    second.ingest.stop()
+
+def test_round_traces_correlate_client_and_server_spans(serve_api, tmp_path):
+    import yaml
+    from src.client.model import FederatedClient
+
+    tracing = {'enabled': True, 'output_dir': str(tmp_path)}
+    url, coordinator = serve_api(tracing=tracing)
+    with open('config/client_config.yaml', 'r') as f:
+        config = yaml.safe_load(f)
+    config['client']['tracing'] = tracing
+
+    clients = [FederatedClient(f"c{i}", config, url) for i in range(2)]
+    for client in clients:
+        client.http_client.register()
+        client._participate_in_round(0)
+    for _ in range(50):
+        if (tmp_path / 'server_round_0.json').exists():
+            break
+        time.sleep(0.1)
+
+    client_events = json.loads((tmp_path / 'client_c0_round_0.json').read_text())['traceEvents']
+    server_events = json.loads((tmp_path / 'server_round_0.json').read_text())['traceEvents']
+    client_spans = {e['name']: e for e in client_events if e['ph'] == 'X'}
+    assert {'model_download', 'deserialization', 'local_training',
+            'serialization', 'upload'} <= set(client_spans)
+
+    upload_id = client_spans['upload']['args']['request_id']
+    server_spans = [e for e in server_events if e['args'].get('request_id') == upload_id]
+    assert {e['name'] for e in server_spans} == {'server_decode', 'queue_wait', 'apply_update'}
+    assert any(e['name'] == 'aggregation' for e in server_events)
+
+def test_feature_statistics_are_merged_before_training(serve_api):
+    url, coordinator = serve_api(federated={'min_clients': 2, 'rounds': 1,
+                                            'feature_stats': {'enabled': True, 'min_clients': 2}})
+    clients = [fast_client(url) for _ in range(2)]
+    for i, client in enumerate(clients):
+        client.client_id = f'client_{i}'
+        response = client.register({'dataset_size': 10})
+        assert response['server_config']['feature_stats']['enabled']
+
+    first = clients[0].submit_feature_stats({'count': 2, 'sum': [2.0], 'sum_sq': [2.0]})
+    assert not first['feature_stats_ready']
+    assert clients[0].get_global_model().get('feature_scaler') is None
+
+    second = clients[1].submit_feature_stats({'count': 2, 'sum': [6.0], 'sum_sq': [18.0]})
+    assert second['feature_stats_ready']
+    assert clients[1].get_training_status()['feature_stats_ready']
+    scaler = clients[1].get_global_model()['feature_scaler']
+    assert scaler['mean'] == [2.0] and scaler['scale'] == [1.0]
@@ -47,3 +47,379 @@ def test_federated_client(config):
     assert 'weights' in training_result
     assert 'metrics' in training_result
 
+
+def test_training_engine_reuses_compiled_step_across_rounds(config):
+    """Local training runs without retracing when global weights change."""
+    import numpy as np
+    from src.client.model import FederatedClient
+
+    client = FederatedClient('engine_test', {'client': config})
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((256, 32)).astype(np.float32)
+    y = X.sum(axis=1, keepdims=True)
+
+    history = client.train_local((X, y))
+    assert len(history['loss']) == config['training']['local_epochs']
+    assert history['loss'][-1] < history['loss'][0]
+
+    global_weights = [w * 0.5 for w in client.get_weights()]
+    client.set_weights(global_weights)
+    assert all(np.allclose(a, b) for a, b in zip(client.get_weights(), global_weights))
+    client.train_local((X, y))
+    assert client.engine.tracing_count() == 1
+
+def test_training_engine_with_xla(config):
+    import numpy as np
+    from src.client.training import TrainingEngine
+
+    model = tf.keras.Sequential([tf.keras.layers.Input(shape=(4,)), tf.keras.layers.Dense(1)])
+    model.compile(optimizer=tf.keras.optimizers.SGD(0.05), loss='mse')
+    engine = TrainingEngine(model, {'batch_size': 16, 'local_epochs': 5, 'jit_compile': True})
+    X = np.random.default_rng(1).standard_normal((64, 4)).astype(np.float32)
+    history = engine.train((X, X[:, :1] * 2.0))
+    assert history['loss'][-1] < history['loss'][0]
+
+def test_training_engine_accepts_tf_data(config):
+    import numpy as np
+    from src.client.training import TrainingEngine
+
+    model = tf.keras.Sequential([tf.keras.layers.Input(shape=(4,)), tf.keras.layers.Dense(1)])
+    model.compile(optimizer=tf.keras.optimizers.SGD(0.05), loss='mse')
+    engine = TrainingEngine(model, {'batch_size': 16, 'local_epochs': 3})
+    X = np.random.default_rng(2).standard_normal((50, 4)).astype(np.float32)
+    dataset = tf.data.Dataset.from_tensor_slices((X, X[:, :1])).batch(16)
+    history = engine.train(dataset)
+    assert len(history['loss']) == 3
+    assert history['loss'][-1] < history['loss'][0]
+
+def test_local_data_is_materialized_once_and_cached(config, tmp_path):
+    import numpy as np
+
+    config = dict(config, data=dict(config['data'], cache_dir=str(tmp_path)))
+    handler = FinancialDataHandler(config)
+    X, y = handler.get_local_data()
+    assert X.shape == (config['data']['dataset_size'], config['data']['input_dim'])
+    assert handler.get_local_data()[0] is X
+    assert len(list(tmp_path.glob(f"{config['id']}-*.npz"))) == 1
+
+    # A fresh handler (e.g. after a restart) reloads the identical data from disk
+    reloaded, _ = FinancialDataHandler(config).get_local_data()
+    assert np.array_equal(reloaded, X)
+
+    other, _ = FinancialDataHandler(dict(config, id='client_2', data=config['data'])).get_local_data()
+    assert not np.array_equal(other, X)
+    # The id the client runs under wins over the config's
+    passed, _ = FinancialDataHandler(config, 'client_3').get_local_data()
+    assert not np.array_equal(passed, X) and list(tmp_path.glob('client_3-*.npz'))
+
+    # A different size, width or seed regenerates instead of reusing the cached arrays
+    for change in ({'dataset_size': 37}, {'input_dim': 5}, {'seed': 99}):
+        changed, _ = FinancialDataHandler(dict(config, data=dict(config['data'], **change))).get_local_data()
+        assert changed.shape == (change.get('dataset_size', len(X)), change.get('input_dim', X.shape[1]))
+        assert not np.array_equal(changed, X)
+    assert len(list(tmp_path.glob(f"{config['id']}-*.npz"))) == 4
+
+    dataset = handler.get_local_dataset()
+    assert handler.get_local_dataset() is dataset
+    batch_x, batch_y = next(iter(dataset))
+    assert batch_x.shape == (config['data']['batch_size'], config['data']['input_dim'])
+    assert batch_y.shape == (config['data']['batch_size'], 1)
+
+def test_out_of_core_loader_streams_scaled_memmap(config, tmp_path):
+    import numpy as np
+    import pandas as pd
+    from sklearn.preprocessing import StandardScaler
+
+    rng = np.random.default_rng(3)
+    frame = pd.DataFrame({
+        'amount': rng.lognormal(4.0, 1.0, 1000),
+        'balance': rng.normal(10000, 5000, 1000),
+        'branch': ['north'] * 1000,  # Non-numeric columns are skipped
+        'label': rng.normal(size=1000)
+    })
+    source = tmp_path / 'extract.csv'
+    frame.to_csv(source, index=False)
+
+    config = dict(config, data=dict(config['data'], source_path=str(source), target_column='label',
+                                    chunk_size=128, mmap_dir=str(tmp_path / 'mmap')))
+    handler = FinancialDataHandler(config)
+    dataset, num_rows = handler.get_training_data()
+    table = handler._table
+
+    assert num_rows == 1000
+    assert isinstance(table.features, np.memmap)
+    assert table.feature_columns == ['amount', 'balance']
+    expected = StandardScaler().fit_transform(frame[['amount', 'balance']])
+    np.testing.assert_allclose(table.features, expected, rtol=1e-4, atol=1e-4)
+    np.testing.assert_allclose(handler.scaler.mean_, frame[['amount', 'balance']].mean(), rtol=1e-6)
+
+    rows = sum(int(x.shape[0]) for x, _ in dataset)
+    assert rows == 1000
+    x, y = next(iter(dataset))
+    assert x.shape[1] == 2 and y.shape[1] == 1
+
+    # Conversions are per extract and client, and a finished one is reused rather than rewritten
+    inode = (table.directory / 'features.f32').stat().st_ino
+    assert handler.loader.load(str(source), target_column='label', client_id=handler.client_id).directory == \
+        table.directory
+    assert (table.directory / 'features.f32').stat().st_ino == inode
+    other = FinancialDataHandler(config, 'client_9')
+    other.get_training_data()
+    assert other._table.directory != table.directory
+    (tmp_path / 'b').mkdir()
+    frame.to_csv(tmp_path / 'b' / 'extract.csv', index=False)
+    assert handler.loader.output_dir(str(tmp_path / 'b' / 'extract.csv')) != handler.loader.output_dir(str(source))
+    assert not list((tmp_path / 'mmap').glob('*.tmp-*'))
+
+    # Without a target the extract has nothing to train against
+    with pytest.raises(ValueError, match='target_column'):
+        FinancialDataHandler(dict(config, data=dict(config['data'], target_column=None)))
+
+def test_global_feature_scaler_replaces_local_scaling(config, tmp_path):
+    import numpy as np
+    import pandas as pd
+
+    handler = FinancialDataHandler(config)
+    X, _ = handler.get_local_data()
+    stats = handler.compute_feature_statistics(histogram_edges=[-1.0, 0.0, 1.0])
+    assert stats['count'] == len(X)
+    np.testing.assert_allclose(np.asarray(stats['sum']) / len(X), X.mean(axis=0), rtol=1e-5, atol=1e-6)
+    assert len(stats['histogram']['counts']) == X.shape[1]
+
+    mean, scale = np.full(X.shape[1], 0.5), np.full(X.shape[1], 2.0)
+    handler.apply_global_scaler(mean, scale)
+    (scaled, _), _ = handler.get_training_data()
+    np.testing.assert_allclose(scaled, (X - 0.5) / 2.0, rtol=1e-5, atol=1e-6)
+
+    # The memory-mapped path scales rows as they are read and leaves the stored matrix alone
+    rng = np.random.default_rng(5)
+    frame = pd.DataFrame({'amount': rng.normal(100, 20, 500), 'label': rng.normal(size=500)})
+    frame.to_csv(tmp_path / 'extract.csv', index=False)
+    config = dict(config, data=dict(config['data'], source_path=str(tmp_path / 'extract.csv'),
+                                    target_column='label', mmap_dir=str(tmp_path / 'mmap')))
+    handler = FinancialDataHandler(config)
+    stats = handler.compute_feature_statistics()
+    np.testing.assert_allclose(stats['sum'], [frame['amount'].sum()], rtol=1e-6)
+    stored = np.array(handler._table.features)
+    handler.apply_global_scaler([90.0], [10.0])
+    handler.apply_global_scaler([90.0], [10.0])
+    expected = (frame['amount'].to_numpy() - 90.0) / 10.0
+    np.testing.assert_allclose(handler._table.rows(0, 500)[:, 0], expected, rtol=1e-4, atol=1e-4)
+    np.testing.assert_array_equal(handler._table.features, stored)
+    dataset, _ = handler.get_training_data()
+    batches = np.concatenate([x.numpy() for x, _ in dataset])
+    np.testing.assert_allclose(np.sort(batches[:, 0]), np.sort(expected), rtol=1e-4, atol=1e-4)
+
+def test_non_iid_partitioner_is_reproducible_and_skewed(config, tmp_path):
+    import numpy as np
+    from src.client.partitioner import NonIIDPartitioner
+
+    settings = {'num_clients': 20, 'input_dim': 8, 'total_samples': 4000, 'label_alpha': 0.1,
+                'size_alpha': 0.5, 'seed': 7}
+    serial = NonIIDPartitioner(dict(settings, max_workers=1)).generate()
+    parallel = NonIIDPartitioner(dict(settings, max_workers=4, cache_dir=str(tmp_path))).generate()
+    for i in range(20):
+        for a, b in zip(serial[i], parallel[i]):
+            assert np.array_equal(a, b)
+
+    sizes = np.array([len(shard[0]) for shard in serial.values()])
+    assert sizes.sum() == 4000 and sizes.min() >= 10 and sizes.max() > 3 * np.median(sizes)
+    # Small label_alpha concentrates each client on a few segments
+    dominant = [np.bincount(labels).max() / len(labels) for _, _, labels in serial.values()]
+    assert np.mean(dominant) > 0.5
+
+    # Cached shards are read back (optionally memory-mapped) instead of regenerated
+    cached = NonIIDPartitioner(dict(settings, cache_dir=str(tmp_path))).client_shard(3, mmap=True)
+    assert isinstance(cached[0], np.memmap) and np.array_equal(cached[0], serial[3][0])
+
+    handler = FinancialDataHandler(dict(config, data=dict(config['data'], partition=dict(settings, client_index=3))))
+    assert np.array_equal(handler.get_local_data()[0], serial[3][0])
+
+def test_simulated_financial_data_differs_per_client(config):
+    first = FinancialDataHandler(config).simulate_financial_data(50)
+    again = FinancialDataHandler(config).simulate_financial_data(50)
+    other = FinancialDataHandler(dict(config, id='client_2')).simulate_financial_data(50)
+    assert first.equals(again)
+    assert not first.equals(other)
+
+def test_in_process_simulation_runs_rounds_over_in_memory_transport(config):
+    import numpy as np
+    from src.simulation import SimulationRunner
+
+    with open('config/server_config.yaml', 'r') as f:
+        server_config = yaml.safe_load(f)
+    client_config = {'client': dict(config, training=dict(config['training'], local_epochs=1))}
+    network = {'latency_ms': 50, 'bandwidth_mbps': 10, 'realtime': False}
+    runner = SimulationRunner(server_config, client_config, num_clients=3, rounds=2,
+                              network=network, max_workers=2)
+    initial = [np.copy(w) for w in runner.coordinator.get_global_model()]
+    summary = runner.run()
+
+    assert summary['completed_rounds'] == 2
+    assert [r['clients'] for r in summary['rounds']] == [3, 3]
+    assert not np.allclose(initial[0], runner.coordinator.get_global_model()[0])
+    # Each simulated client trains on its own data
+    first, second = (c.data_handler.get_local_data()[0] for c in runner.clients[:2])
+    assert not np.array_equal(first, second)
+    # Latency alone is 2 rounds x 3 clients x 2 calls x 50 ms; only accounted, never slept
+    assert summary['network_seconds'] > 0.6
+    assert summary['wall_time'] < summary['network_seconds'] + 60
+
+def test_stacked_trainer_matches_independent_client_training(config):
+    import numpy as np
+    from src.client.training import StackedTrainer, TrainingEngine
+
+    rng = np.random.default_rng(0)
+    datasets = []
+    for size in (20, 45, 100):
+        X = rng.standard_normal((size, 32), dtype=np.float32)
+        datasets.append((X, X.sum(axis=1, keepdims=True)))
+    initial = FederatedClient('client_1', {'client': config}).get_weights()
+
+    # With batch_size >= the smallest shard, that client runs out of batches early and must sit out
+    training_config = {'batch_size': 32, 'local_epochs': 2, 'learning_rate': 0.001}
+    stacked = StackedTrainer(3, training_config)
+    stacked.set_weights(initial)
+    history = stacked.train(datasets)
+    assert history['loss'].shape == (3, 2)
+
+    # Single-batch clients are order-independent, so they must match a Keras client exactly
+    client = FederatedClient('client_1', {'client': dict(config, training=training_config)})
+    client.set_weights(initial)
+    client.engine.train(datasets[0])
+    for expected, actual in zip(client.get_weights(), stacked.get_weights(0)):
+        np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-5)
+
+    # Larger clients are trained too, and differently from each other
+    assert not np.allclose(stacked.get_weights(1)[0], initial[0])
+    assert not np.allclose(stacked.get_weights(1)[0], stacked.get_weights(2)[0])
+    stacked.train(datasets)
+    assert stacked.tracing_count() == 1
+
+def test_stacked_simulation_backend(config):
+    from src.simulation import SimulationRunner
+
+    with open('config/server_config.yaml', 'r') as f:
+        server_config = yaml.safe_load(f)
+    server_config['aggregation']['method'] = 'fednova'
+    client_config = {'client': dict(config, training=dict(config['training'], local_epochs=1))}
+    runner = SimulationRunner(server_config, client_config, num_clients=4, rounds=2, backend='stacked')
+    aggregator = runner.coordinator.aggregator
+    steps = []
+    fednova = aggregator.fednova_averaging
+    aggregator.fednova_averaging = lambda updates, weights: (steps.append([u['local_steps'] for u in updates])
+                                                             or fednova(updates, weights))
+    summary = runner.run()
+
+    assert summary['completed_rounds'] == 2
+    assert not runner.clients and runner.trainer.num_clients == 4
+    assert all(r['clients'] == 4 and r['mean_loss'] > 0 for r in summary['rounds'])
+    # Every client reports its steps, so FedNova doesn't fall back to FedAvg
+    batches = -(-config['data']['dataset_size'] // config['training']['batch_size'])
+    assert steps == [[batches] * 4] * 2
+
+def test_stacked_simulation_shares_feature_stats_and_server_architecture(config):
+    from src.simulation import SimulationRunner
+
+    with open('config/server_config.yaml', 'r') as f:
+        server_config = yaml.safe_load(f)
+    server_config['model']['hidden_layers'] = [16, 8]
+    server_config['federated']['feature_stats'] = {'enabled': True, 'min_clients': 3}
+    client_config = {'client': dict(config, model=dict(config.get('model', {}), hidden_dims=[128, 64]),
+                                    training=dict(config['training'], local_epochs=1))}
+    runner = SimulationRunner(server_config, client_config, num_clients=3, rounds=1, backend='stacked')
+    runner.setup()
+
+    assert runner.trainer.layer_sizes == [32, 16, 8, 1]
+    assert set(runner.coordinator.feature_stats) == {'sim_0', 'sim_1', 'sim_2'}
+    assert runner.coordinator.feature_scaler is not None
+    summary = runner.run()
+    assert summary['completed_rounds'] == 1 and runner._scaled_clients == {0, 1, 2}
+
+def test_process_pool_backend_shares_weights_through_shared_memory(config):
+    import numpy as np
+    from src.client.process_pool import SharedWeights
+    from src.simulation import SimulationRunner
+
+    shapes = [(3, 2), (2,)]
+    owner = SharedWeights(shapes, slots=2)
+    reader = SharedWeights(shapes, slots=2, name=owner.name)
+    owner.write([np.ones((3, 2)), np.full(2, 5.0)], slot=1)
+    assert reader.views(1)[1].tolist() == [5.0, 5.0] and not reader.views(0)[0].any()
+    reader.close()
+    owner.close()
+
+    with open('config/server_config.yaml', 'r') as f:
+        server_config = yaml.safe_load(f)
+    client_config = {'client': dict(config, training=dict(config['training'], local_epochs=1))}
+    runner = SimulationRunner(server_config, client_config, num_clients=4, rounds=2,
+                              max_workers=2, backend='processes')
+    initial = [np.copy(w) for w in runner.coordinator.get_global_model()]
+    runner.setup()
+    assert all(isinstance(c['info']['dataset_size'], int) for c in runner.coordinator.clients.values())
+    update = runner.pool_backend.update_weights(0)
+    assert not np.shares_memory(update[0], runner.pool_backend.updates.buffer)
+    summary = runner.run()
+
+    assert summary['completed_rounds'] == 2
+    assert all(r['clients'] == 4 for r in summary['rounds'])
+    assert not np.allclose(initial[0], runner.coordinator.get_global_model()[0])
+
+def test_client_sizes_local_work_to_round_deadline(config):
+    import time
+    from src.api.local_transport import InMemoryTransport
+    from src.server.coordinator import FederatedCoordinator
+
+    with open('config/server_config.yaml', 'r') as f:
+        server_config = yaml.safe_load(f)
+    server_config['training'].update(round_deadline_seconds=1.5, max_local_steps=100000)
+    server_config['federated']['min_clients'] = 1
+    coordinator = FederatedCoordinator(server_config)
+    client = FederatedClient('client_1', {'client': config},
+                             transport=InMemoryTransport(coordinator, 'client_1'))
+    client._register_with_server()
+
+    start = time.perf_counter()
+    metrics = client._participate_in_round(0)
+    elapsed = time.perf_counter() - start
+    assert elapsed < 1.5
+    assert metrics['local_steps'] > 10
+    assert client.engine.steps_per_second > 0
+    assert coordinator.current_round == 1
+
+    # An explicit cap bounds the work regardless of the budget
+    history = client.engine.train_for(client.data_handler.get_training_data()[0], 10.0, max_steps=7)
+    assert history['steps'] == 7
+
+def test_resource_profile_pins_cpus_and_sizes_thread_pools(monkeypatch):
+    import json
+    import subprocess
+    import sys
+    from src.utils import resources
+
+    monkeypatch.setattr(resources, '_available_cpus', lambda: list(range(8)))
+    assert resources.resolve_cpu_set({'cpu_affinity': 'auto', 'slot': 1, 'slots': 4}) == [2, 3]
+    monkeypatch.setenv('FL_CLIENT_SLOT', '3')
+    assert resources.resolve_cpu_set({'cpu_affinity': 'auto', 'slots': 4}) == [6, 7]
+    for path in ('config/client_config.yaml', 'config/client_config_2.yaml'):
+        with open(path, 'r') as f:
+            shipped = yaml.safe_load(f)['client']['resources']
+        assert resources.resolve_cpu_set(dict(shipped, cpu_affinity='auto', slots=4)) == [6, 7]
+    assert resources.resolve_cpu_set({}) is None
+
+    # Thread pools are fixed once TensorFlow starts, so check in a fresh interpreter
+    script = (
+        "import json, os, resource\n"
+        "from src.utils.resources import apply_resource_profile\n"
+        "applied = apply_resource_profile({'cpu_affinity': [0], 'memory_limit_mb': 8192})\n"
+        "import tensorflow as tf\n"
+        "print(json.dumps({'applied': applied, 'affinity': sorted(os.sched_getaffinity(0)),\n"
+        "  'intra': tf.config.threading.get_intra_op_parallelism_threads(),\n"
+        "  'inter': tf.config.threading.get_inter_op_parallelism_threads(),\n"
+        "  'limit': resource.getrlimit(resource.RLIMIT_DATA)[0]}))\n"
+    )
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, timeout=300)
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    assert result['affinity'] == [0]
+    assert result['intra'] == 1 and result['inter'] == 1
+    assert result['limit'] == 8192 * 1024 * 1024
@@ -1,10 +1,29 @@
 """test_rag.py module."""
 
+import json
 import pytest
+import faiss
+import numpy as np
+from src.rag.indexes import base_index
 from src.rag.retriever import FinancialDataRetriever
 from src.rag.generator import RAGGenerator
 import yaml
 
+def hashed_embeddings(texts, dimension=768):
+    """Deterministic bag-of-words vectors standing in for BERT in offline tests."""
+    vectors = np.zeros((len(texts), dimension), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for token in text.lower().split():
+            vectors[row, sum(map(ord, token)) * 7919 % dimension] += 1.0
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-6)
+
+FILINGS = [
+    {'text': 'Quarterly earnings report for retail banking', 'id': 1},
+    {'text': 'Mortgage default risk analysis', 'id': 2},
+    {'text': 'Annual liquidity coverage ratio disclosure', 'id': 3},
+    {'text': 'Credit card fraud detection summary', 'id': 4}
+]
+
 @pytest.fixture
 def rag_config():
     with open('config/server_config.yaml', 'r') as f:
@@ -91,3 +110,470 @@ def test_context_preparation(generator):
     assert 'Doc 1 content' in context
     assert 'Doc 2 content' in context
 
+
+@pytest.fixture
+def offline_retriever(rag_config, monkeypatch):
+    monkeypatch.setattr(FinancialDataRetriever, 'encode_text', lambda self, texts: hashed_embeddings(texts))
+    return lambda **overrides: FinancialDataRetriever(dict(rag_config, rag=dict(rag_config['rag'], **overrides)))
+
+def test_index_is_saved_and_memory_mapped_on_startup(offline_retriever, tmp_path):
+    retriever = offline_retriever()
+    retriever.index_documents(FILINGS)
+    retriever.save(str(tmp_path / 'index'))
+    
+    restored = offline_retriever(index_dir=str(tmp_path / 'index'))
+    assert restored.index.ntotal == len(FILINGS)
+    assert len(restored.documents) == len(FILINGS)
+    assert restored._model is None  # Nothing was re-encoded
+    
+    results = restored.retrieve('mortgage default risk analysis', k=2)
+    assert results[0]['document'] == FILINGS[1]
+    assert [d['id'] for d in restored.documents] == [1, 2, 3, 4]
+    
+    with pytest.raises(ValueError):
+        offline_retriever(index_dir=str(tmp_path / 'index'), embedding_model='other-model')
+
+def test_approximate_index_types_trade_recall_for_speed(offline_retriever):
+    from src.rag.indexes import recall_latency_sweep
+    
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((20, 32)).astype(np.float32)
+    vectors = centers[rng.integers(0, 20, 4000)] + 0.3 * rng.standard_normal((4000, 32)).astype(np.float32)
+    queries = vectors[:50] + 0.01
+    configs = [
+        {'type': 'flat'},
+        {'type': 'ivf_flat', 'nlist': 32},
+        {'type': 'ivf_pq', 'nlist': 32, 'pq_m': 8},
+        {'type': 'hnsw', 'hnsw_m': 16}
+    ]
+    results = recall_latency_sweep(vectors, queries, configs, k=5,
+                                   knob_values={'nprobe': [1, 32], 'ef_search': [64]})
+    by_type = {(r['type'], r.get('nprobe')): r for r in results}
+    
+    assert by_type[('flat', None)]['recall'] == 1.0
+    # Searching every IVF cell is exact; one cell is cheaper but may miss neighbours
+    assert by_type[('ivf_flat', 32)]['recall'] == 1.0
+    assert by_type[('ivf_flat', 1)]['recall'] <= 1.0
+    assert by_type[('hnsw', None)]['recall'] > 0.9
+    # PQ codes are a fraction of the flat index size
+    assert by_type[('ivf_pq', 32)]['memory_bytes'] < by_type[('flat', None)]['memory_bytes'] / 2
+    
+    # Batches smaller than the training sample are searched exactly until the IVF index can be trained
+    retriever = offline_retriever(index={'type': 'ivf_flat', 'nlist': 16, 'nprobe': 16})
+    retriever.index_documents(FILINGS)
+    assert faiss.try_extract_index_ivf(base_index(retriever.index)) is None
+    assert retriever.retrieve('credit card fraud detection summary', k=1)[0]['document'] == FILINGS[3]
+    
+    words = ['loan', 'deposit', 'equity', 'bond', 'swap', 'hedge', 'yield', 'margin', 'audit', 'tax']
+    retriever.delete([2])
+    for start in range(0, 640, 64):
+        retriever.index_documents([{'id': 100 + i, 'text': f"{words[i % 10]} {words[i // 10 % 10]} note {i}"}
+                                   for i in range(start, start + 64)])
+    # 16 lists need 16 * 39 training vectors; the IVF index takes over once they are there
+    assert faiss.extract_index_ivf(retriever.index).nprobe == 16
+    assert retriever.index.ntotal == len(FILINGS) - 1 + 640
+    assert retriever.retrieve('credit card fraud detection summary', k=1)[0]['document'] == FILINGS[3]
+    assert all(r['document']['id'] != 2 for r in retriever.retrieve('mortgage default risk analysis', k=5))
+
+@pytest.mark.parametrize('index_type', ['flat', 'hnsw'])
+def test_incremental_add_upsert_delete(offline_retriever, tmp_path, monkeypatch, index_type):
+    retriever = offline_retriever(index={'type': index_type}, compaction_threshold=0.0)
+    retriever.index_documents(FILINGS[:2])
+    # A second ingest appends instead of replacing the id -> document mapping
+    retriever.index_documents(FILINGS[2:])
+    assert retriever.retrieve('mortgage default risk analysis', k=1)[0]['document'] == FILINGS[1]
+    assert retriever.retrieve('credit card fraud detection summary', k=1)[0]['document'] == FILINGS[3]
+    with pytest.raises(ValueError):
+        retriever.add([FILINGS[0]])
+    
+    revised = {'text': 'Revised mortgage default risk analysis with stress scenarios', 'id': 2}
+    retriever.upsert([revised])
+    assert len(retriever.documents) == len(FILINGS)
+    assert retriever.retrieve('mortgage default risk analysis stress scenarios', k=1)[0]['document'] == revised
+    
+    assert retriever.delete([3, 99]) == 1
+    assert all(r['document']['id'] != 3
+               for r in retriever.retrieve('annual liquidity coverage ratio disclosure', k=4))
+    
+    # Background compaction drops the replaced and deleted vectors
+    retriever.wait_for_compaction()
+    retriever.compact()
+    assert retriever.index.ntotal == len(FILINGS) - 1 and not retriever._deleted
+    
+    retriever.save(str(tmp_path / 'index'))
+    restored = offline_retriever(index={'type': index_type}, index_dir=str(tmp_path / 'index'))
+    assert sorted(d['id'] for d in restored.documents) == [1, 2, 4]
+    # The id -> label map comes from the saved ids, not from decoding every document
+    restored.documents.get = None
+    assert sorted(restored._label_map()) == [1, 2, 4]
+    del restored.documents.get
+    # Changes after a memory-mapped load go to an in-memory copy of the index
+    restored.upsert([{'text': 'Annual liquidity coverage ratio disclosure', 'id': 3}])
+    restored.delete([1])
+    assert restored.retrieve('annual liquidity coverage ratio disclosure', k=1)[0]['document']['id'] == 3
+    assert sorted(d['id'] for d in restored.documents) == [2, 3, 4]
+    
+    # Compaction works on a copy; documents added meanwhile are carried over to it
+    import src.rag.retriever as retriever_module
+    restored.wait_for_compaction()
+    restored.compaction_threshold = 1.0
+    restored.delete([4])
+    late = {'text': 'Quarterly capital adequacy report', 'id': 5}
+    target, name = (retriever_module, 'build_index') if index_type == 'hnsw' else (faiss, 'IDSelectorBatch')
+    original = getattr(target, name)
+    def add_during_compaction(*args):
+        monkeypatch.setattr(target, name, original)
+        restored.add([late])
+        return original(*args)
+    monkeypatch.setattr(target, name, add_during_compaction)
+    assert restored.compact() == 1
+    assert restored.index.ntotal == 3 and not restored._deleted
+    assert restored.retrieve(late['text'], k=1)[0]['document'] == late
+
+def test_documents_with_a_none_id_are_keyed_by_their_label(offline_retriever, tmp_path):
+    retriever = offline_retriever()
+    retriever.index_documents([{'id': 'a', 'text': 'Quarterly mortgage report'}, {'id': 'b', 'text': 'Fraud summary'}])
+    anonymous = [{'text': 'Unattributed branch memo', 'id': None}, {'text': 'Unattributed audit memo', 'id': None}]
+    # Two id-less documents in one batch are both kept, not collapsed onto a shared None key
+    assert retriever.upsert(anonymous) == 2
+    retriever.add([{'text': 'Another unattributed memo', 'id': None}])
+    labels = retriever._label_map()
+    assert None not in labels and len(labels) == 5
+    assert len(retriever.documents) == 5
+    
+    retriever.save(str(tmp_path / 'index'))
+    restored = offline_retriever(index_dir=str(tmp_path / 'index'))
+    assert None not in restored._label_map() and len(restored._label_map()) == 5
+
+def test_batched_encoder_matches_single_pass(tmp_path):
+    import torch
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+    from src.rag.encoder import TextEncoder
+    
+    words = sorted({w for doc in FILINGS for w in doc['text'].lower().split()})
+    (tmp_path / 'vocab.txt').write_text('\n'.join(['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]'] + words))
+    tokenizer = BertTokenizerFast(str(tmp_path / 'vocab.txt'))
+    torch.manual_seed(0)
+    model = BertModel(BertConfig(vocab_size=len(words) + 5, hidden_size=32, num_hidden_layers=2,
+                                 num_attention_heads=2, intermediate_size=64))
+    texts = [doc['text'] * (i % 3 + 1) for i, doc in enumerate(FILINGS * 5)]
+    
+    encoder = TextEncoder(tokenizer, model, {'batch_size': 4, 'bucket_window': 2})
+    batched = encoder.encode(texts, output_path=str(tmp_path / 'embeddings.npy'))
+    with torch.no_grad():
+        expected = np.stack([model(**tokenizer([t], return_tensors='pt')).last_hidden_state[0, 0].numpy()
+                             for t in texts])
+    
+    # Rows come back in input order whatever batch they were bucketed into
+    np.testing.assert_allclose(batched, expected, atol=1e-4)
+    np.testing.assert_allclose(np.load(tmp_path / 'embeddings.npy'), expected, atol=1e-4)
+    stats = encoder.throughput()
+    assert stats['texts_per_second'] > 0 and 0 <= stats['padding_ratio'] < 0.5
+
+def test_embedding_cache_skips_the_model_for_seen_texts(rag_config, tmp_path):
+    class CountingEncoder:
+        def __init__(self):
+            self.encoded = []
+            self.calls = []
+        
+        def encode(self, texts, output_path=None):
+            self.encoded.extend(texts)
+            self.calls.append(len(texts))
+            return hashed_embeddings(texts)
+    
+    cache = {'path': str(tmp_path / 'cache.sqlite'), 'max_entries': 4}
+    retriever = FinancialDataRetriever(dict(rag_config, rag=dict(rag_config['rag'], embedding_cache=cache)))
+    retriever._encoder = CountingEncoder()
+    texts = [doc['text'] for doc in FILINGS]
+    
+    first = retriever.encode_text(texts[:3])
+    # Whitespace differences hit the same entry; only the new text is encoded
+    second = retriever.encode_text(['  ' + texts[0] + ' ', texts[1], texts[3]])
+    assert retriever._encoder.encoded == texts[:3] + [texts[3]]
+    np.testing.assert_array_equal(second[:2], first[:2])
+    
+    # The cache persists across retrievers, and evicts the least recently used entry past max_entries
+    retriever.encode_text(['A fifth, unrelated filing'])
+    reopened = FinancialDataRetriever(dict(rag_config, rag=dict(rag_config['rag'], embedding_cache=cache)))
+    reopened._encoder = CountingEncoder()
+    reopened.encode_text(texts[:2] + texts[3:])
+    assert reopened._encoder.encoded == [] and len(reopened.embedding_cache) == 4
+    
+    # Workers sharing the file evict against the entries all of them wrote, not just their own
+    from src.rag.embedding_cache import EmbeddingCache
+    path = str(tmp_path / 'shared.sqlite')
+    first_worker, second_worker = (EmbeddingCache(path, 'model', 16, max_entries=4) for _ in range(2))
+    second_worker.store(texts, hashed_embeddings(texts))
+    first_worker.store(['A fifth, unrelated filing'], hashed_embeddings(['A fifth, unrelated filing']))
+    assert len(first_worker) == len(second_worker) == 4
+    reopened.encode_text([texts[2]])
+    assert reopened._encoder.encoded == [texts[2]]
+    
+    # Misses are encoded a window at a time, straight into the output file
+    windowed = FinancialDataRetriever(dict(rag_config, rag=dict(
+        rag_config['rag'], embedding_cache=dict(cache, path=str(tmp_path / 'windowed.sqlite')),
+        encoder={'batch_size': 1, 'bucket_window': 2})))
+    windowed._encoder = CountingEncoder()
+    windowed.encode_text(texts, output_path=str(tmp_path / 'embeddings.npy'))
+    assert windowed._encoder.calls == [2, 2]
+    np.testing.assert_array_equal(np.load(tmp_path / 'embeddings.npy'), hashed_embeddings(texts))
+
+def test_chunking_overlaps_passages():
+    from src.rag.ingestion import chunk_document
+    
+    words = [f"w{i}" for i in range(25)]
+    passages = chunk_document({'id': 'filing', 'text': ' '.join(words), 'bank': 'A'}, chunk_size=10, overlap=3)
+    assert [p['id'] for p in passages] == ['filing#0', 'filing#1', 'filing#2', 'filing#3']
+    assert passages[1]['text'].split()[:3] == words[7:10] and passages[-1]['text'].split()[-1] == 'w24'
+    assert all(p['parent_id'] == 'filing' and p['bank'] == 'A' for p in passages)
+    assert chunk_document(FILINGS[0], chunk_size=10) == [FILINGS[0]]
+
+def test_ingestion_pipeline_streams_through_worker_processes(rag_config, tmp_path):
+    import torch
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+    from src.rag.ingestion import IngestionPipeline
+    
+    words = sorted({w for doc in FILINGS for w in doc['text'].lower().split()})
+    (tmp_path / 'vocab.txt').write_text('\n'.join(['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]'] + words))
+    BertTokenizerFast(str(tmp_path / 'vocab.txt')).save_pretrained(str(tmp_path / 'model'))
+    torch.manual_seed(0)
+    BertModel(BertConfig(vocab_size=len(words) + 5, hidden_size=768, num_hidden_layers=1,
+                         num_attention_heads=2, intermediate_size=64)).save_pretrained(str(tmp_path / 'model'))
+    
+    corpus = tmp_path / 'filings.jsonl'
+    long_filing = {'id': 9, 'text': ' '.join(doc['text'] for doc in FILINGS * 3)}
+    corpus.write_text('\n'.join(json.dumps(doc) for doc in FILINGS + [long_filing]))
+    
+    def run(workers):
+        rag = dict(rag_config['rag'], embedding_model=str(tmp_path / 'model'), similarity_threshold=0.0,
+                   ingestion={'workers': workers, 'batch_size': 2, 'queue_size': 1, 'chunk_size': 10,
+                              'chunk_overlap': 2})
+        pipeline = IngestionPipeline(dict(rag_config, rag=rag))
+        return pipeline, pipeline.ingest_files([str(corpus)])
+    
+    pipeline, stats = run(workers=2)
+    # 60 words in passages of 10 starting every 8 words
+    assert stats['documents'] == 5 and stats['passages'] == 4 + 8
+    assert pipeline.retriever.index.ntotal == 12
+    assert {'9#0', '9#7', 4} <= {d['id'] for d in pipeline.retriever.documents}
+    
+    # Encoding in worker processes gives the same index as encoding inline
+    inline, _ = run(workers=0)
+    query = FILINGS[1]['text']
+    assert ([r['document']['id'] for r in pipeline.retriever.retrieve(query, k=3)] ==
+            [r['document']['id'] for r in inline.retriever.retrieve(query, k=3)])
+    
+    # Re-ingesting a shortened document drops its passages that no longer exist
+    shortened = dict(long_filing, text=' '.join(long_filing['text'].split()[:20]))
+    inline.ingest([shortened])
+    assert sorted(d['id'] for d in inline.retriever.documents if d.get('parent_id') == 9) == ['9#0', '9#1', '9#2']
+    inline.ingest([dict(long_filing, text='Short restated filing')])
+    assert [d for d in inline.retriever.documents if d['id'] == 9 or d.get('parent_id') == 9] == \
+        [dict(long_filing, text='Short restated filing')]
+    assert inline.retriever.index.ntotal - len(inline.retriever._deleted) == len(FILINGS) + 1
+    
+    # A worker that dies without reporting back fails the ingest instead of hanging it
+    import multiprocessing
+    def killing_reader():
+        yield FILINGS[0]
+        for child in multiprocessing.active_children():
+            child.kill()
+        yield from FILINGS[1:]
+    with pytest.raises(RuntimeError, match='exited unexpectedly'):
+        pipeline.ingest(killing_reader())
+
+def test_retrieve_many_searches_once(offline_retriever):
+    retriever = offline_retriever(similarity_threshold=0.5)
+    retriever.index_documents(FILINGS)
+    searches = []
+    search = retriever._search
+    retriever._search = lambda queries, *args: searches.append(len(queries)) or search(queries, *args)
+    
+    queries = [doc['text'] for doc in FILINGS] + ['completely unrelated words']
+    batched = retriever.retrieve_many(queries, k=3)
+    assert searches == [len(queries)]
+    assert [results[0]['document'] for results in batched[:4]] == FILINGS
+    # The threshold mask drops every neighbour of the unrelated query
+    assert batched[-1] == []
+    assert batched == [retriever.retrieve(query, k=3) for query in queries]
+    assert all(result['score'] >= 0.5 for results in batched for result in results)
+
+def test_bm25_and_hybrid_retrieval_without_elasticsearch(offline_retriever, tmp_path):
+    ledger = [
+        {'text': 'Reconciliation of general ledger account GL-4100-20 for March', 'id': 'gl'},
+        {'text': 'BRK.B position increased in the equity portfolio', 'id': 'brk'}
+    ]
+    # similarity_threshold is for vector scores; BM25 hits aren't cut by it
+    lexical = offline_retriever(retriever='bm25', similarity_threshold=0.99)
+    lexical.index_documents(FILINGS + ledger)
+    assert lexical.index.ntotal == 0  # No vectors are computed for pure BM25
+    assert lexical.retrieve('GL-4100-20', k=1)[0]['document']['id'] == 'gl'
+    assert lexical.retrieve('brk.b exposure', k=1)[0]['document']['id'] == 'brk'
+    lexical.delete(['gl'])
+    assert lexical.retrieve('GL-4100-20') == []
+    
+    # Only empty documents left: zero average length must not divide by zero
+    from src.rag.lexical import BM25Index
+    empty = BM25Index()
+    empty.add([0, 1], ['ledger', ''])
+    empty.remove([0])
+    with np.errstate(all='raise'):
+        assert len(empty.search('ledger', k=1)[0]) == 0
+    
+    hybrid = offline_retriever(retriever='hybrid', similarity_threshold=0.0, lexical={'max_segments': 1})
+    hybrid.index_documents(FILINGS)
+    hybrid.index_documents(ledger)
+    # An account code only the lexical ranking matches exactly comes first after fusion
+    results = hybrid.retrieve('balance of GL-4100-20', k=3)
+    assert results[0]['document']['id'] == 'gl'
+    assert results[0]['score'] == pytest.approx(2 / 61)
+    
+    hybrid.save(str(tmp_path / 'index'))
+    restored = offline_retriever(retriever='hybrid', similarity_threshold=0.0, index_dir=str(tmp_path / 'index'))
+    assert restored.retrieve_many(['balance of GL-4100-20'], k=3) == [results]
+    
+    # A vector-only index gains a lexical index from its stored documents when reopened as hybrid
+    dense = offline_retriever()
+    dense.index_documents(ledger)
+    dense.save(str(tmp_path / 'dense'))
+    reopened = offline_retriever(retriever='hybrid', similarity_threshold=0.0, index_dir=str(tmp_path / 'dense'))
+    assert reopened.lexical.num_documents == 2
+
+@pytest.fixture
+def elasticsearch_stand_in():
+    """Minimal local Elasticsearch: bulk, msearch and refresh over an in-memory index."""
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    state = {'documents': {}, 'requests': []}
+    
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+        
+        def reply(self, body):
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            # The client refuses servers that don't identify as Elasticsearch
+            self.send_header('X-Elastic-Product', 'Elasticsearch')
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        
+        def do_POST(self):
+            lines = [json.loads(line) for line in
+                     self.rfile.read(int(self.headers['Content-Length'])).splitlines() if line.strip()]
+            endpoint = self.path.split('?')[0].rstrip('/').split('/')[-1]
+            state['requests'].append(endpoint)
+            if endpoint == '_bulk':
+                items, pending = [], iter(lines)
+                for action in pending:
+                    op, meta = next(iter(action.items()))
+                    if op == 'delete':
+                        found = state['documents'].pop(meta['_id'], None) is not None
+                        items.append({op: {'_id': meta['_id'], 'status': 200 if found else 404,
+                                           'result': 'deleted' if found else 'not_found'}})
+                    else:
+                        state['documents'][meta['_id']] = next(pending)
+                        items.append({op: {'_id': meta['_id'], 'status': 201, 'result': 'created'}})
+                errors = any(item[next(iter(item))]['status'] >= 300 for item in items)
+                self.reply({'took': 1, 'errors': errors, 'items': items})
+            elif endpoint == '_msearch':
+                responses = []
+                for body in lines[1::2]:
+                    terms = set(body['query']['match']['text'].lower().split())
+                    hits = sorted(({'_id': str(i), '_source': doc,
+                                    '_score': float(len(terms & set(doc['text'].lower().split())))}
+                                   for i, doc in state['documents'].items()), key=lambda hit: -hit['_score'])
+                    responses.append({'status': 200, 'hits': {'hits': [h for h in hits if h['_score'] > 0][:body['size']]}})
+                self.reply({'took': 1, 'responses': responses})
+            else:
+                self.reply({'_shards': {'total': 1, 'successful': 1, 'failed': 0}})
+        
+        do_PUT = do_POST
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state['url'] = f"http://127.0.0.1:{server.server_address[1]}"
+    yield state
+    server.shutdown()
+    server.server_close()
+
+def test_elasticsearch_bulk_indexing_and_msearch(rag_config, elasticsearch_stand_in):
+    es = {'hosts': [elasticsearch_stand_in['url']], 'bulk_chunk_size': 2, 'bulk_threads': 2,
+          'msearch_batch_size': 3, 'refresh': True}
+    retriever = FinancialDataRetriever(dict(rag_config, rag=dict(rag_config['rag'], retriever='elasticsearch',
+                                                                 similarity_threshold=1.0, elasticsearch=es)))
+    assert retriever.add(FILINGS) == len(FILINGS)
+    # Four documents in bulk requests of two, then one refresh
+    assert sorted(elasticsearch_stand_in['requests']) == ['_bulk', '_bulk', '_refresh']
+    assert len(elasticsearch_stand_in['documents']) == len(FILINGS)
+    
+    del elasticsearch_stand_in['requests'][:]
+    queries = [doc['text'] for doc in FILINGS] * 2
+    results = retriever.retrieve_many(queries, k=2)
+    assert elasticsearch_stand_in['requests'] == ['_msearch'] * 3
+    assert [r[0]['document'] for r in results] == FILINGS * 2
+    assert retriever.retrieve('mortgage default')[0]['document'] == FILINGS[1]
+    
+    assert retriever.delete([1, 2, 99]) == 2
+    assert len(elasticsearch_stand_in['documents']) == 2
+
+@pytest.mark.parametrize('retriever_type,index', [('faiss', {'type': 'flat'}), ('faiss', {'type': 'hnsw'}),
+                                                  ('hybrid', {'type': 'flat'})])
+def test_metadata_filters_are_applied_inside_the_search(offline_retriever, tmp_path, retriever_type, index):
+    banks = ['First Harbor', 'Second Harbor', 'Third Harbor']
+    filings = [
+        {'id': i, 'text': f"{'liquidity stress test' if i % 3 == 0 else 'loan book review'} filing {i}",
+         'bank': banks[i % 3], 'doc_type': '10-K' if i % 2 else '10-Q',
+         'filing_date': f"2024-{i % 12 + 1:02d}-15"}
+        for i in range(60)
+    ]
+    fields = {'bank': 'keyword', 'doc_type': 'keyword', 'filing_date': 'date'}
+    retriever = offline_retriever(retriever=retriever_type, index=index, similarity_threshold=0.0,
+                                  metadata_fields=fields)
+    retriever.index_documents(filings)
+    
+    # Every nearest neighbour of the query is a First Harbor filing, so post-filtering would return nothing
+    query = 'liquidity stress test'
+    assert all(r['document']['bank'] == 'First Harbor' for r in retriever.retrieve(query, k=5))
+    results = retriever.retrieve(query, k=5, filters={'bank': 'Second Harbor'})
+    assert len(results) == 5 and all(r['document']['bank'] == 'Second Harbor' for r in results)
+    
+    q1 = {'bank': ['First Harbor', 'Third Harbor'], 'doc_type': '10-K',
+          'filing_date': {'gte': '2024-01-01', 'lt': '2024-04-01'}}
+    expected = {f['id'] for f in filings if f['bank'] != 'Second Harbor' and f['doc_type'] == '10-K'
+                and f['filing_date'] < '2024-04'}
+    assert {r['document']['id'] for r in retriever.retrieve(query, k=60, filters=q1)} == expected
+    
+    # Deleted and upserted documents leave the metadata indexes too
+    retriever.delete([f['id'] for f in filings if f['bank'] == 'Second Harbor'][:10])
+    retriever.upsert([dict(filings[1], bank='Fourth Harbor')])
+    assert {r['document']['id'] for r in retriever.retrieve(query, k=60, filters={'bank': 'Second Harbor'})} == \
+        {f['id'] for f in filings if f['bank'] == 'Second Harbor'} - {1, 4, 7, 10, 13, 16, 19, 22, 25, 28}
+    assert [r['document']['id'] for r in retriever.retrieve(query, filters={'bank': 'Fourth Harbor'})] == [1]
+    assert retriever.retrieve(query, filters={'bank': 'Nobody'}) == []
+    with pytest.raises(ValueError):
+        retriever.retrieve(query, filters={'region': 'EU'})
+    
+    retriever.save(str(tmp_path / 'index'))
+    restored = offline_retriever(retriever=retriever_type, index=index, similarity_threshold=0.0,
+                                 metadata_fields=fields, index_dir=str(tmp_path / 'index'))
+    assert restored.retrieve_many([query], k=60, filters=q1) == retriever.retrieve_many([query], k=60, filters=q1)
+
+def test_bad_metadata_rejects_the_batch_before_indexing(offline_retriever):
+    retriever = offline_retriever(metadata_fields={'filing_date': 'date'}, similarity_threshold=0.0)
+    with pytest.raises(ValueError, match='filing_date'):
+        retriever.add([{'id': 'a', 'text': 'Quarterly earnings', 'filing_date': 'Q1 2024'}])
+    assert retriever.index.ntotal == 0 and len(retriever.documents) == 0
+    
+    retriever.add([{'id': 'b', 'text': 'Quarterly earnings', 'filing_date': '2024-03-31'}])
+    results = retriever.retrieve('Quarterly earnings', k=5)
+    assert [r['document']['id'] for r in results] == ['b']
+    
+    # A rejected upsert keeps the previous version
+    with pytest.raises(ValueError):
+        retriever.upsert([{'id': 'b', 'text': 'Restated earnings', 'filing_date': 'Q1 2024'}])
+    assert retriever.retrieve('Quarterly earnings', k=5, filters={'filing_date': '2024-03-31'}) == results
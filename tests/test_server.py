@@ -55,3 +55,40 @@ def test_weight_aggregation(aggregator):
     aggregated_weights = aggregator.compute_metrics(client_updates)
     assert isinstance(aggregated_weights, dict)
 
+
+def test_merge_feature_statistics_matches_pooled_data():
+    rng = np.random.default_rng(0)
+    shards = [rng.normal(loc, 2.0, size=(n, 3)) for loc, n in [(0.0, 100), (5.0, 300), (-2.0, 50)]]
+    edges = [-100.0, 0.0, 100.0]
+    stats = [{
+        'count': len(x),
+        'sum': x.sum(axis=0).tolist(),
+        'sum_sq': np.square(x).sum(axis=0).tolist(),
+        'histogram': {'edges': edges, 'counts': [np.histogram(x[:, j], bins=edges)[0].tolist() for j in range(3)]}
+    } for x in shards]
+    
+    merged = FederatedAggregator({'aggregation': {}}).merge_feature_statistics(stats)
+    pooled = np.concatenate(shards)
+    
+    assert merged['count'] == 450 and merged['num_clients'] == 3
+    np.testing.assert_allclose(merged['mean'], pooled.mean(axis=0))
+    np.testing.assert_allclose(merged['scale'], pooled.std(axis=0))
+    assert np.sum(merged['histogram']['counts'], axis=1).tolist() == [450, 450, 450]
+
+def test_fednova_normalizes_by_local_steps():
+    start = [np.zeros(2, dtype=np.float32)]
+    a, b = np.array([1.0, 0.0]), np.array([0.0, 1.0])
+    updates = [
+        {'client_id': 'fast', 'weights': [10 * a], 'size': 100, 'local_steps': 10},
+        {'client_id': 'slow', 'weights': [2 * b], 'size': 100, 'local_steps': 2}
+    ]
+    aggregator = FederatedAggregator({'aggregation': {'method': 'fednova'}})
+    
+    # Plain FedAvg lets the fast client dominate; FedNova averages per-step progress
+    np.testing.assert_allclose(aggregator.federated_averaging(updates)[0], [5.0, 1.0])
+    np.testing.assert_allclose(aggregator.aggregate(updates, start)[0], [3.0, 3.0])
+    
+    # Without step counts FedNova falls back to FedAvg
+    for update in updates:
+        update['local_steps'] = None
+    np.testing.assert_allclose(aggregator.aggregate(updates, start)[0], [5.0, 1.0])